@@ -1,36 +1,65 @@
+import sys
 import vim
 from os import path
 from getProjSettings import getProjSettings
 from sbtools import getRootDir
 
 
-def addSandboxTags(fname, addAllTags=False):
+def getSandboxTagsFiles(fname, addAllTags=False):
     rootDir = getRootDir()
     if not rootDir:
-        return
+        return []
 
     soln = getProjSettings()
     if not soln:
-        return
+        return []
 
     soln.setRootDir(rootDir)
 
-    for proj in soln.projects:
-        if proj.includesFile(fname):
-            # add project tags
-            for inc in proj.includes:
-                vim.command("let &l:tags .= ',%s'" % path.join(rootDir, inc['path'], inc['tagsFile']))
-                if addAllTags:
-                    allTagsFile = path.join(rootDir,
-                                            inc['path'],
-                                            inc['allTagsFile'])
-                    vim.command("let &l:tags .= ',%s'" % allTagsFile)
+    tagsFiles = []
+    for proj in soln.projectsForFile(fname):
+        # add project tags
+        for inc in proj.includes:
+            tagsFiles.append(path.join(rootDir, inc['path'], inc['tagsFile']))
+            if addAllTags:
+                tagsFiles.append(path.join(rootDir, inc['path'], inc['allTagsFile']))
+
+        # add imported header tags, of the modules it depends on directly.
+        for dep in soln.getDependencyGraph().directDependencies(proj.name):
+            dep_proj = soln.getProjByName(dep)
+            for inc in dep_proj.exports:
+                tagsFiles.append(path.join(rootDir, inc['path'], inc['tagsFile']))
+
+    return tagsFiles
+
+
+def addSandboxTags(fname, addAllTags=False):
+    for tagsFile in getSandboxTagsFiles(fname, addAllTags):
+        vim.command("let &l:tags .= ',%s'" % tagsFile)
+
+
+def findSandboxTags(fname, name):
+    """Returns the tags called name in all the tags files of the projects
+    of fname, like taglist() would with those tags files. Returns None if
+    one of them does not have an up to date index."""
+
+    # The index needs Python 3, a Vim with Python 2 uses taglist().
+    if sys.version_info[0] < 3:
+        return None
+    from tagIndex import openIndex
 
-            # add imported header tags.
-            for dep in proj.depends:
-                dep_proj = soln.getProjByName(dep)
-                for inc in dep_proj.exports:
-                    vim.command("let &l:tags .= ',%s'" % path.join(rootDir, inc['path'], inc['tagsFile']))
+    tags = []
+    for tagsFile in getSandboxTagsFiles(fname, addAllTags=True):
+        if not path.exists(tagsFile):
+            continue
+        index = openIndex(tagsFile)
+        if index is None:
+            return None
+        try:
+            tags += index.find(name)
+        finally:
+            index.close()
+    return tags
 
 
 def getTagFiles(fname):
@@ -44,8 +73,7 @@ def getTagFiles(fname):
 
     soln.setRootDir(rootDir)
 
-    for proj in soln.projects:
-        if proj.includesFile(fname):
-            for inc in proj.includes:
-                tagsFileFullPath = path.join(rootDir, inc['path'], inc['tagsFile'])
-                return tagsFileFullPath
+    for proj in soln.projectsForFile(fname):
+        for inc in proj.includes:
+            tagsFileFullPath = path.join(rootDir, inc['path'], inc['tagsFile'])
+            return tagsFileFullPath
@@ -0,0 +1,109 @@
+" =====================================================================================
+" Job compatibility layer for Vim/Neovim
+"
+" Runs a shell command in the background and hands its output to a
+" callback a batch of complete lines at a time, in the same way on vim and
+" neovim. Used to show the results of the pytools which can stream them
+" (listFiles.py --stream, findInProj.py --stream, ...) while they come.
+" =====================================================================================
+" mw#job#Supported: return whether jobs can be started {{{
+function! mw#job#Supported()
+    return has('nvim') || has('job')
+endfunction " }}}
+" mw#job#Start: start a shell command in the background {{{
+" Description: opts can have
+"   cwd:      the directory to run cmd in
+"   lines_cb: called with a list of lines of the output as they come
+"   done_cb:  called once all the output has been handled
+" Returns a job for mw#job#Stop, or {} if cmd could not be started.
+function! mw#job#Start(cmd, opts={})
+    let defaults = {
+                \ 'cwd': getcwd(),
+                \ 'lines_cb': function('s:DoNothing'),
+                \ 'done_cb': function('s:DoNothing')
+                \ }
+
+    let job = {
+                \ 'opts': extend(copy(a:opts), defaults, 'keep'),
+                \ 'partial': '',
+                \ 'stopped': v:false
+                \ }
+    let cmd = ['/bin/sh', '-c', a:cmd]
+
+    if has('nvim')
+        let job.jobid = jobstart(cmd, {
+                    \ 'cwd': job.opts.cwd,
+                    \ 'on_stdout': function('s:NvimOnStdout', [job]),
+                    \ 'on_exit': function('s:OnClose', [job])
+                    \ })
+        if job.jobid <= 0
+            return {}
+        endif
+    else
+        let job.job = job_start(cmd, {
+                    \ 'cwd': job.opts.cwd,
+                    \ 'in_io': 'null',
+                    \ 'err_io': 'null',
+                    \ 'out_mode': 'raw',
+                    \ 'out_cb': function('s:VimOnStdout', [job]),
+                    \ 'close_cb': function('s:OnClose', [job])
+                    \ })
+        if job_status(job.job) ==# 'fail'
+            return {}
+        endif
+    endif
+    return job
+endfunction " }}}
+" mw#job#Stop: stop a job, its callbacks are not called anymore {{{
+function! mw#job#Stop(job)
+    if empty(a:job) || a:job.stopped
+        return
+    endif
+    let a:job.stopped = v:true
+    if has('nvim')
+        call jobstop(a:job.jobid)
+    else
+        call job_stop(a:job.job)
+    endif
+endfunction " }}}
+" mw#job#Running: return whether a job is still producing output {{{
+function! mw#job#Running(job)
+    return !empty(a:job) && !a:job.stopped
+endfunction " }}}
+" s:AddOutput: pass on the complete lines of the output {{{
+" Description: the output comes in arbitrary pieces, the part after the
+" last newline is kept until the rest of its line is there.
+function! s:AddOutput(job, data)
+    if a:job.stopped
+        return
+    endif
+    let lines = split(a:job.partial . a:data, "\n", 1)
+    let a:job.partial = remove(lines, -1)
+    if !empty(lines)
+        call a:job.opts.lines_cb(lines)
+    endif
+endfunction " }}}
+" s:NvimOnStdout: {{{
+function! s:NvimOnStdout(job, job_id, data, event)
+    " data is the output split at newlines, the NULs in it are newlines.
+    call s:AddOutput(a:job, join(a:data, "\n"))
+endfunction " }}}
+" s:VimOnStdout: {{{
+function! s:VimOnStdout(job, channel, msg)
+    call s:AddOutput(a:job, a:msg)
+endfunction " }}}
+" s:OnClose: called once there is no more output {{{
+function! s:OnClose(job, ...)
+    if a:job.stopped
+        return
+    endif
+    if a:job.partial != ''
+        call a:job.opts.lines_cb([a:job.partial])
+        let a:job.partial = ''
+    endif
+    let a:job.stopped = v:true
+    call a:job.opts.done_cb()
+endfunction " }}}
+" s:DoNothing: do nothing function {{{
+function! s:DoNothing(...)
+endfunction " }}}
@@ -74,6 +74,7 @@ function! s:OpenSelection()
     let fileName = b:textToAdd . fileName
 
     let tmpBufNum = bufnr('%')
+    call s:StopListing()
 
     exec 'e '.fileName
     call s:restoreAltBuffer()
@@ -103,6 +104,7 @@ function! s:CloseToolWindow()
     " . The user starts Open from a [No Name] buffer
     " . The user starts Open with several windows open
     " . The user starts Open with the same buffer open in multiple windows
+    call s:StopListing()
     
     " 1. We first split open a new [No Name] buffer. Remember the window
     " number of [No Name] when it opens.
@@ -177,13 +179,20 @@ function! mw#open#StartFiltering()
 endfunction " }}}
 
 " mw#open#OpenFile: opens a file in the solution {{{
-" Description: 
-function! mw#open#OpenFile()
+" Description: the files of a sandbox come from cached file lists, which
+" are only updated for the directories that changed. Pass 1 to read all the
+" directories again.
+function! mw#open#OpenFile(...)
     call mw#utils#AssertThatWeHaveAValidProject()
 
+    let refresh = a:0 > 0 && a:1
     let prefix = mw#utils#GetRootDir()
-    if filereadable(prefix . '/mw_anchor')
-        let filelist = system('listFiles.py')
+    let stream = filereadable(prefix . '/mw_anchor') && mw#job#Supported()
+    if stream
+        " The files are added as listFiles.py finds them.
+        let filelist = ''
+    elseif filereadable(prefix . '/mw_anchor')
+        let filelist = system('listFiles.py'.(refresh ? ' --refresh' : ''))
     else
         if executable('fd')
             let filelist = system('fd --type f . '.prefix)
@@ -207,16 +216,65 @@ function! mw#open#OpenFile()
     call setbufvar(bufnum, '&filetype', 'MW_FILES')
 
     let origPat = @/
-    silent! 0put=filelist
+    if !stream
+        silent! 0put=filelist
 
-    silent! %s/^/    /g
-    call histdel('search', -1)
+        silent! %s/^/    /g
+        call histdel('search', -1)
 
-    exec 'silent! %s/'.escape(prefix, '/').'//'
-    call histdel('search', -1)
+        exec 'silent! %s/'.escape(prefix, '/').'//'
+        call histdel('search', -1)
+    endif
 
     let b:textToAdd = prefix
 
     call mw#open#StartFiltering()
     let @/ = origPat
+
+    if stream
+        silent! 2,$ d_
+        let s:allLines = []
+        call s:StopListing()
+        let s:listJob = mw#job#Start('listFiles.py --stream'.(refresh ? ' --refresh' : ''), {
+                    \ 'cwd': getcwd(),
+                    \ 'lines_cb': function('s:AddFiles', [bufnum, prefix])
+                    \ })
+    endif
+endfunction " }}}
+" s:AddFiles: add files listed by listFiles.py --stream {{{
+" Description: the ones which match the current pattern are shown right
+" away, the rest are only remembered for when the pattern changes.
+function! s:AddFiles(bufnum, prefix, files)
+    if !bufexists(a:bufnum)
+        call s:StopListing()
+        return
+    endif
+
+    let lines = map(a:files, {_, f -> '    '.(stridx(f, a:prefix) == 0 ? strpart(f, len(a:prefix)) : f)})
+    call filter(lines, {_, l -> l !~ '^\s*$'})
+    let s:allLines += lines
+
+    if s:pattern != ''
+        let pattern = substitute(s:pattern, ' ', '.*', 'g')
+        let lines = filter(copy(lines), {_, l -> l =~ pattern})
+    endif
+    if empty(lines)
+        return
+    endif
+
+    let shown = getbufline(a:bufnum, 2, 3)
+    if empty(shown) || shown == ['']
+        " The first line shown is selected, like after filtering, which
+        " leaves an empty line when nothing matched.
+        let lines[0] = substitute(lines[0], '^\s', '>', '')
+        call setbufline(a:bufnum, 2, lines)
+    else
+        call appendbufline(a:bufnum, '$', lines)
+    endif
+endfunction " }}}
+" s:StopListing: stop adding files, if they are still coming {{{
+let s:listJob = {}
+function! s:StopListing()
+    call mw#job#Stop(s:listJob)
+    let s:listJob = {}
 endfunction " }}}
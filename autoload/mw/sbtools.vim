@@ -149,12 +149,9 @@ function! mw#sbtools#FindIn(prog, dir, name, str)
         let startdir = rootDir
     endif
 
-    let searchstr = a:str
+    let searchstr = s:GetSearchString(a:name, a:str)
     if searchstr == ''
-        let searchstr = input('Enter grep options and pattern ('.a:name.'): ', expand('<cword>'))
-        if searchstr == ''
-            return
-        endif
+        return
     endif
 
     let origDir = getcwd()
@@ -169,15 +166,148 @@ function! mw#sbtools#FindIn(prog, dir, name, str)
 
     cwindow
 endfunction " }}}
+" s:GetSearchString: asks for the grep args if str is empty {{{
+function! s:GetSearchString(name, str)
+    if a:str != ''
+        return a:str
+    endif
+    return input('Enter grep options and pattern ('.a:name.'): ', expand('<cword>'))
+endfunction " }}}
+" mw#sbtools#FindInAsync: like FindIn, but for the pytools which stream {{{
+" Description: prog is run with --stream in the background and the
+" quickfix list is filled as the results come, the ones in the current
+" project first. Outside a sandbox, or without jobs, this is FindIn.
+let s:findJob = {}
+function! mw#sbtools#FindInAsync(prog, dir, name, str)
+    let rootDir = mw#utils#GetRootDir()
+    if empty(rootDir) || !filereadable(rootDir . '/mw_anchor') || !mw#job#Supported()
+        return mw#sbtools#FindIn(a:prog, a:dir, a:name, a:str)
+    endif
+
+    let searchstr = s:GetSearchString(a:name, a:str)
+    if searchstr == ''
+        return
+    endif
+
+    " Only one search at a time, a new one replaces the results.
+    call mw#job#Stop(s:findJob)
+
+    let title = a:name.': '.searchstr
+    call setqflist([], ' ', {'title': title})
+    let qfid = getqflist({'id': 0}).id
+    let s:findJob = mw#job#Start(a:prog.' --stream '.searchstr, {
+                \ 'cwd': a:dir,
+                \ 'lines_cb': function('s:OnFindResults', [qfid]),
+                \ 'done_cb': function('s:OnFindDone', [qfid, title])
+                \ })
+    if empty(s:findJob)
+        echohl Error
+        echomsg 'Could not start '.a:prog
+        echohl None
+    endif
+endfunction " }}}
+" s:OnFindResults: add results to the quickfix list {{{
+function! s:OnFindResults(qfid, lines)
+    if getqflist({'id': a:qfid}).id != a:qfid
+        " The list is gone, there is no point in searching anymore.
+        call mw#job#Stop(s:findJob)
+        return
+    endif
+
+    let wasEmpty = getqflist({'id': a:qfid, 'size': 0}).size == 0
+    call setqflist([], 'a', {'id': a:qfid, 'lines': a:lines, 'efm': &grepformat})
+
+    if wasEmpty && getqflist({'nr': 0, 'id': 0}).id == a:qfid
+        " Show the first results without leaving the current window.
+        let winid = win_getid()
+        cwindow
+        call win_gotoid(winid)
+    endif
+endfunction " }}}
+" s:OnFindDone: {{{
+function! s:OnFindDone(qfid, title)
+    let size = getqflist({'id': a:qfid, 'size': 0}).size
+    if size == 0
+        echomsg a:title.': no matches'
+    else
+        echomsg a:title.': '.size.' matches'
+    endif
+endfunction " }}}
 " mw#sbtools#FindInProj: finds pattern in project {{{
 function! mw#sbtools#FindInProj(...)
     let str = a:0 > 0 ? a:1 : ''
-    call mw#sbtools#FindIn('findInProj.py', expand('%:p:h'), 'grep project', str)
+    call mw#sbtools#FindInAsync('findInProj.py', expand('%:p:h'), 'grep project', str)
 endfunction " }}}
 " mw#sbtools#FindInSolution: finds pattern in project {{{
 function! mw#sbtools#FindInSolution(...)
     let str = a:0 > 0 ? a:1 : ''
-    call mw#sbtools#FindIn('findInSoln.py', expand('%:p:h'), 'grep solution', str)
+    call mw#sbtools#FindInAsync('findInSoln.py', expand('%:p:h'), 'grep solution', str)
+endfunction " }}}
+" mw#sbtools#FindInIndex: finds pattern in solution using the code index {{{
+" Description: only searches the files which the code index of the sandbox
+" says can have matches. Without an index this is like FindInSolution, and
+" the index is built in the background for the next time.
+function! mw#sbtools#FindInIndex(...)
+    let rootDir = mw#utils#GetRootDir()
+    if !empty(rootDir) && filereadable(rootDir.'/mw_anchor')
+                \ && !filereadable(rootDir.'/.sbtools/codeIndex/files')
+        call mw#sbtools#UpdateCodeIndex()
+    endif
+
+    let str = a:0 > 0 ? a:1 : ''
+    call mw#sbtools#FindInAsync('findInIndex.py', expand('%:p:h'), 'grep code index', str)
+endfunction " }}}
+" mw#sbtools#UpdateCodeIndex: updates the code index in the background {{{
+" Description: adds the new files of the solution to the code index of the
+" sandbox and re-indexes the changed ones.
+let s:codeIndexJobs = {}
+function! mw#sbtools#UpdateCodeIndex()
+    call mw#utils#AssertThatWeHaveAValidProject()
+
+    let rootDir = mw#utils#GetRootDir()
+    if has_key(s:codeIndexJobs, rootDir)
+        return
+    endif
+
+    echomsg 'Updating the code index of '.rootDir.' in the background'
+    let s:codeIndexJobs[rootDir] = mw#term#Start('codeIndex.py', {
+                \ 'term_name': 'codeIndex',
+                \ 'hidden': v:true,
+                \ 'term_finish': 'close',
+                \ 'exit_cb': function('s:OnCodeIndexExit', [rootDir])
+                \ })
+endfunction " }}}
+" s:OnCodeIndexExit: {{{
+function! s:OnCodeIndexExit(rootDir, ...)
+    if has_key(s:codeIndexJobs, a:rootDir)
+        call remove(s:codeIndexJobs, a:rootDir)
+    endif
+endfunction " }}}
+" mw#sbtools#StartToolServer: keep the pytools of this sandbox loaded {{{
+" Description: runs toolServer.py in the background till Vim exits. The
+" pytools which Vim runs, like listFiles.py and findInProj.py, then start
+" with the solution and the file lists of the sandbox loaded already.
+let s:toolServers = {}
+function! mw#sbtools#StartToolServer()
+    call mw#utils#AssertThatWeHaveAValidProject()
+
+    let rootDir = mw#utils#GetRootDir()
+    if has_key(s:toolServers, rootDir)
+        return
+    endif
+
+    let s:toolServers[rootDir] = mw#term#Start('toolServer.py', {
+                \ 'term_name': 'toolServer',
+                \ 'hidden': v:true,
+                \ 'term_finish': 'close',
+                \ 'exit_cb': function('s:OnToolServerExit', [rootDir])
+                \ })
+endfunction " }}}
+" s:OnToolServerExit: {{{
+function! s:OnToolServerExit(rootDir, ...)
+    if has_key(s:toolServers, a:rootDir)
+        call remove(s:toolServers, a:rootDir)
+    endif
 endfunction " }}}
 " mw#sbtools#FindUsingSbid: find using sbglobal {{{
 " Description: 
@@ -448,7 +578,7 @@ let s:term_job = {}
 function! mw#sbtools#CompileProject()
     call s:CompileCommon(s:GetProjectMakeProgram())
     if expand('%:p') != ''
-        exec 'silent! !genVimTags.py '.expand('%:p').' &'
+        exec 'silent! !genVimTags.py --incremental '.expand('%:p').' &'
     endif
 endfunction 
 " }}}
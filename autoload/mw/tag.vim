@@ -4,7 +4,7 @@ function! s:InitScript()
     pythonx import sys
     pythonx import vim
     exec 'pythonx sys.path += [r"'.s:scriptDir.'"]'
-    pythonx from addSandboxTags import addSandboxTags, getTagFiles
+    pythonx from addSandboxTags import addSandboxTags, findSandboxTags, getTagFiles
 endfunction
 call s:InitScript()
 
@@ -23,9 +23,35 @@ endfunction " }}}
 function! mw#tag#InitVimTags()
     call mw#utils#AssertThatWeHaveAValidProject()
 
-    !genVimTags.py
+    " Tags for the current file's project are generated first.
+    exec '!genVimTags.py --all '.shellescape(expand('%:p'), 1)
     call mw#tag#AddSandboxTags(expand('%:p'))
 endfunction " }}}
+" mw#tag#StartTagWatcher: keep the tags of this sandbox up to date {{{
+" Description: runs tagWatcher.py in the background till Vim exits. It
+" re-tags the files which change in the projects of the sandbox.
+let s:tagWatchers = {}
+function! mw#tag#StartTagWatcher()
+    call mw#utils#AssertThatWeHaveAValidProject()
+
+    let rootDir = mw#utils#GetRootDir()
+    if has_key(s:tagWatchers, rootDir)
+        return
+    endif
+
+    let s:tagWatchers[rootDir] = mw#term#Start('tagWatcher.py', {
+                \ 'term_name': 'tagWatcher',
+                \ 'hidden': v:true,
+                \ 'term_finish': 'close',
+                \ 'exit_cb': function('s:OnTagWatcherExit', [rootDir])
+                \ })
+endfunction " }}}
+" s:OnTagWatcherExit: {{{
+function! s:OnTagWatcherExit(rootDir, ...)
+    if has_key(s:tagWatchers, a:rootDir)
+        call remove(s:tagWatchers, a:rootDir)
+    endif
+endfunction " }}}
 " mw#tag#SelectTag: select a tag from this project {{{
 " Description: 
 function! mw#tag#SelectTag(fname)
@@ -63,10 +89,15 @@ function! mw#tag#AddIncludeImpl(currentFilePath, word)
     let currentModulePath = findfile('MODULE_DEPENDENCIES', a:currentFilePath.';')
     let currentModulePath = substitute(currentModulePath, 'MODULE_DEPENDENCIES$', '', '')
 
-    let origTagsFile = &l:tags
-    exec 'pythonx addSandboxTags(r"'.a:currentFilePath.'", addAllTags=True)'
-    let tags = taglist('\C^'.a:word.'$')
-    let &l:tags = origTagsFile
+    " The indexes next to the tags files make this a few binary searches.
+    " Fall back to taglist() if some tags file has not been indexed yet.
+    let tags = pyxeval('findSandboxTags(r"'.a:currentFilePath.'", r"'.a:word.'")')
+    if type(tags) != v:t_list
+        let origTagsFile = &l:tags
+        exec 'pythonx addSandboxTags(r"'.a:currentFilePath.'", addAllTags=True)'
+        let tags = taglist('\C^'.a:word.'$')
+        let &l:tags = origTagsFile
+    endif
 
     let fileNamesMap = {}
     for tag_ in tags
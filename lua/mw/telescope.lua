@@ -122,13 +122,87 @@ pickers.files = function()
     opts = vim.fn.extend(opts, { cwd = projdir })
     local insideSb = vim.fn.filereadable(projdir .. '/mw_anchor')
     if insideSb then
-      opts = vim.fn.extend(opts, { find_command = { 'listFiles.py' } })
+      -- Files of the current project first, shown as they are listed.
+      opts = vim.fn.extend(opts, { find_command = { 'listFiles.py', '--stream' } })
     end
   end
 
   return require('telescope.builtin').find_files(opts)
 end
 
+-- Makes entries out of the file:line:text results of findInProj.py and
+-- findInSoln.py.
+local function gen_from_grep_results(opts)
+  local make_display = function(entry)
+    local fname = require("telescope.utils").transform_path(opts, entry.filename)
+    return fname .. ":" .. entry.lnum .. ": " .. entry.text
+  end
+
+  return function(line)
+    local fname, lnum, text = string.match(line, "^(.-):(%d+):(.*)$")
+    if not fname then
+      return nil
+    end
+    return {
+      value = line,
+      ordinal = fname .. " " .. text,
+      display = make_display,
+      filename = fname,
+      path = fname,
+      lnum = tonumber(lnum),
+      text = text,
+    }
+  end
+end
+
+-- Searches with prog, which writes the results as it finds them, and
+-- shows them as they come. The results can then be filtered further.
+local function find_in_picker(prog, title, args)
+  local projdir = vim.fn['mw#utils#GetRootDir']()
+  if string.len(projdir) == 0 or vim.fn.filereadable(projdir .. '/mw_anchor') == 0 then
+    vim.notify(title .. ": not in a sandbox", vim.log.levels.ERROR)
+    return
+  end
+
+  args = args or vim.fn.input('Enter grep options and pattern (' .. title .. '): ', vim.fn.expand('<cword>'))
+  if args == '' then
+    return
+  end
+
+  local opts = {
+    layout_strategy = 'vertical',
+    layout_config = { width = 0.8 },
+    path_display = "shorten",
+    -- The current directory decides the current project.
+    cwd = vim.fn.expand('%:p:h'),
+  }
+
+  local command = { prog, '--stream' }
+  vim.list_extend(command, vim.split(args, '%s+', { trimempty = true }))
+
+  pickers.new(opts, {
+    prompt_title = title .. ": " .. args,
+    finder = finders.new_oneshot_job(command, {
+      cwd = opts.cwd,
+      entry_maker = gen_from_grep_results(opts),
+    }),
+    previewer = conf.grep_previewer(opts),
+    sorter = conf.generic_sorter(opts),
+  }):find()
+end
+
+pickers.find_in_project = function(args)
+  find_in_picker('findInProj.py', 'Find in project', args)
+end
+
+pickers.find_in_solution = function(args)
+  find_in_picker('findInSoln.py', 'Find in solution', args)
+end
+
+pickers.find_in_index = function(args)
+  find_in_picker('findInIndex.py', 'Find in code index', args)
+end
+
 pickers.buffers = function()
   return require('telescope.builtin').buffers({
     layout_strategy = 'vertical',
@@ -1,47 +1,270 @@
 #!/usr/bin/env python3
 
 from getProjSettings import getProjSettings
-from sbtools import getRootDir
+from sbtools import getRootDir, getScriptPath
 import os
-from threading import Thread
-from subprocess import Popen, PIPE
+from threading import Lock, Thread
+from queue import Queue
 import sys
-from sbtools import *
+import re
+from fnmatch import translate
+import searchFiles
+import fileListCache
+
+# Files and directories which are never listed or searched. Patterns with
+# a / are matched against the whole path, the others against the name. A
+# project can exclude more with an exclude attribute in .vimproj.xml.
+DEFAULT_EXCLUDES = ['bundle.index.js', 'compile_commands.json', '*l10n*', '*web/release*']
+
+def compilePatterns(patterns):
+    """Returns a regular expression matching any of the shell patterns,
+    or None if there are none."""
+    if not patterns:
+        return None
+    return re.compile('|'.join(translate(p) for p in patterns))
+
+class IncludeMatcher:
+    """The name patterns and excludes of an include, each compiled into a
+    single regular expression."""
+
+    def __init__(self, patterns, excludes):
+        self.key = (tuple(patterns), tuple(excludes))
+        self.nameRe = compilePatterns(patterns)
+        self.excludedNameRe = compilePatterns([p for p in excludes if '/' not in p])
+        self.excludedPathRe = compilePatterns([p for p in excludes if '/' in p])
+
+    def isIncluded(self, name):
+        return self.nameRe is not None and self.nameRe.match(name) is not None
+
+    def isExcluded(self, fname, name):
+        return ((self.excludedNameRe is not None and self.excludedNameRe.match(name) is not None) or
+                (self.excludedPathRe is not None and self.excludedPathRe.match(fname) is not None))
+
+def isUnder(fname, dirName):
+    return fname == dirName or fname.startswith(dirName.rstrip(os.sep) + os.sep)
+
+class IncludeRoot:
+    """An include and all the includes under it, listed with a single walk
+    of the directory tree under path.
+
+    Every directory gets a state: the matchers of the includes which list
+    files in it. A directory is pruned once the state is empty, unless it
+    leads to another include."""
+
+    def __init__(self, path):
+        self.path = path
+        # The position of the first of its includes in the solution.
+        self.order = None
+        # include path -> matchers of the includes with that path
+        self.matchers = {}
+        # The directories on the way from path to the includes under it.
+        self.innerDirs = set()
+        # An IncludeRoot with some of the includes under path, whose files
+        # are listed before and left out here.
+        self.listedBefore = None
+        # Its files, once listed. The threads listing it and the one it is
+        # listedBefore take turns with lock.
+        self.files = None
+        self.lock = Lock()
+
+    def add(self, incPath, matcher, order):
+        if self.order is None or order < self.order:
+            self.order = order
+        matchers = self.matchers.setdefault(incPath, [])
+        if matcher in matchers:
+            return
+        matchers.append(matcher)
+        dirName = os.path.dirname(incPath)
+        while dirName != self.path and isUnder(dirName, self.path) and dirName not in self.innerDirs:
+            self.innerDirs.add(dirName)
+            dirName = os.path.dirname(dirName)
+
+    def key(self):
+        """What decides which files are listed."""
+        return (self.path, tuple(sorted((p, tuple(sorted(m.key for m in ms)))
+                                        for (p, ms) in self.matchers.items())))
+
+    def rootState(self):
+        return tuple(self.matchers.get(self.path, ()))
+
+    def enterDir(self, state, dirPath, name):
+        state = tuple(m for m in state if not m.isExcluded(dirPath, name))
+        for m in self.matchers.get(dirPath, ()):
+            if m not in state:
+                state += (m,)
+        if state or dirPath in self.innerDirs:
+            return state
+        return None
+
+    def followsLink(self, dirPath):
+        # An include can be reached through a symbolic link to a directory.
+        return dirPath in self.innerDirs or dirPath in self.matchers
+
+    def isListed(self, state, dirPath, name):
+        for m in state:
+            if m.isIncluded(name) and not m.isExcluded(os.path.join(dirPath, name), name):
+                return True
+        return False
+
+def getIncludeRoots(rootDir, projects, numFirst=0):
+    """Returns the IncludeRoots of the includes of projects. Every file is
+    listed by exactly one of them. They come in the order of their first
+    includes in projects.
+
+    The files of the includes of the first numFirst projects come before
+    all the others, even when an include of another project contains them.
+    Such a root is split in two: one with only the includes of the first
+    projects, listed first, and one with all of them, which leaves out the
+    files of the first one."""
+
+    matchers = {}
+    includes = []
+    numFirstIncludes = 0
+    for (i, proj) in enumerate(projects):
+        if i == numFirst:
+            numFirstIncludes = len(includes)
+        for inc in proj.includes:
+            incPath = os.path.normpath(os.path.join(rootDir, inc['path']))
+            key = (inc['pattern'], inc.get('exclude', ''))
+            if key not in matchers:
+                excludes = DEFAULT_EXCLUDES + inc.get('exclude', '').split()
+                matchers[key] = IncludeMatcher(inc['pattern'].split(), excludes)
+            includes.append((incPath, len(includes), matchers[key]))
+
+    # Includes are looked at after the ones containing them, so that their
+    # root already exists.
+    rootsByPath = {}
+    roots = []
+    for (incPath, order, matcher) in sorted(includes, key=lambda inc: (inc[0].count(os.sep), inc[1])):
+        dirName = incPath
+        while True:
+            root = rootsByPath.get(dirName)
+            parent = os.path.dirname(dirName)
+            if root is not None or parent == dirName:
+                break
+            dirName = parent
+        if root is None:
+            root = rootsByPath[incPath] = IncludeRoot(incPath)
+            roots.append(root)
+        root.add(incPath, matcher, order)
+
+    if numFirst >= len(projects):
+        numFirstIncludes = len(includes)
+    for root in list(roots):
+        under = [inc for inc in includes if isUnder(inc[0], root.path)]
+        if root.order >= numFirstIncludes or all(order < numFirstIncludes for (_, order, _) in under):
+            continue
+        first = IncludeRoot(root.path)
+        for (incPath, order, matcher) in under:
+            if order < numFirstIncludes:
+                first.add(incPath, matcher, order)
+        roots.append(first)
+        root.listedBefore = first
+        root.order = min(order for (_, order, _) in under if order >= numFirstIncludes)
+
+    return sorted(roots, key=lambda r: r.order)
+
+def listIncludeRoot(rootDir, includeRoot, refresh=False):
+    """Returns the files of all the includes of includeRoot, each one once,
+    from the cached file list. An IncludeRoot is only listed once, the one
+    it is listedBefore leaves out the files it already has."""
+
+    with includeRoot.lock:
+        if includeRoot.files is None:
+            files = fileListCache.listFiles(rootDir, includeRoot.path, refresh, includeRoot)
+            if includeRoot.listedBefore is not None:
+                listed = set(listIncludeRoot(rootDir, includeRoot.listedBefore, refresh))
+                files = [f for f in files if f not in listed]
+            includeRoot.files = files
+        return includeRoot.files
 
 class Base(Thread):
-    def __init__(self, rootDir, include):
+    """Lists or searches the files of an IncludeRoot. The results are put
+    on the chunks queue as they are produced, followed by None."""
+
+    # Whether to read all the directories again instead of using the
+    # cached file lists.
+    refresh = False
+
+    def __init__(self, rootDir, includeRoot):
         Thread.__init__(self)
+        self.daemon = True
 
         self.rootDir = rootDir
-        self.path = os.path.join(rootDir, include['path'])
-        self.pattern = ' -name ' + (' -or -name '.join(include['pattern'].split()))
+        self.includeRoot = includeRoot
+        self.path = includeRoot.path
+        self.chunks = Queue()
 
-        exclude = '-not -name bundle.index.js -not -name compile_commands.json -not -path *l10n* -not -path *web/release*'
-        self.pattern = f'{self.path} ( {self.pattern} ) -and ( {exclude}  )'
-        self.result = ''
+    @classmethod
+    def prepare(cls, rootDir, includeRoots):
+        """Called with all the include roots before any of the threads
+        are started."""
+        pass
 
-class Lister(Base):
-    def __init__(self, rootDir, include):
-        super().__init__(rootDir, include)
+    def listFiles(self):
+        return listIncludeRoot(self.rootDir, self.includeRoot, self.refresh)
 
     def run(self):
-        if not os.path.exists(self.path):
-            return
-        self.result = getoutput(['find'] + self.pattern.split())
+        try:
+            if os.path.exists(self.path):
+                for chunk in self.produce():
+                    if chunk:
+                        self.chunks.put(chunk)
+        finally:
+            self.chunks.put(None)
+
+class Lister(Base):
+    def __init__(self, rootDir, includeRoot):
+        super().__init__(rootDir, includeRoot)
+
+    def produce(self):
+        files = self.listFiles()
+        yield ''.join(f + '\n' for f in files).encode('utf-8', 'surrogateescape')
 
 class Finder(Base):
-    def __init__(self, rootDir, include):
-        super().__init__(rootDir, include)
+    # The grep args as understood by searchFiles, None if they need grep.
+    searchOptions = None
 
-    def run(self):
-        if not os.path.exists(self.path):
+    def __init__(self, rootDir, includeRoot):
+        super().__init__(rootDir, includeRoot)
+
+    @classmethod
+    def prepare(cls, rootDir, includeRoots):
+        cls.searchOptions = searchFiles.getSearchOptions(sys.argv[1:])
+        if cls.searchOptions is None or searchFiles.NUM_WORKERS == 1:
             return
 
-        p1 = Popen(['find'] + self.pattern.split(), stdout=PIPE)
-        p2 = Popen(['python', getScriptPath('findInFiles.py'), '-nH'] + sys.argv[1:], stdin=p1.stdout, stdout=PIPE)
-        self.result = p2.communicate()[0]
+        # The worker processes have to be forked before the threads are
+        # started. Starting them costs more than searching a few files,
+        # so they are only started if there is more than that. The roots
+        # are only listed here until that is clear, which usually takes
+        # the first one, the threads list the others.
+        def iterFiles():
+            for includeRoot in includeRoots:
+                if os.path.exists(includeRoot.path):
+                    for f in listIncludeRoot(rootDir, includeRoot, cls.refresh):
+                        yield f
+
+        if searchFiles.needsPool(iterFiles()):
+            searchFiles.getPool()
+
+    def produce(self):
+        files = self.listFiles()
+        if self.searchOptions is not None:
+            for chunk in searchFiles.search(self.searchOptions, files):
+                yield chunk
+            return
+
+        from subprocess import Popen, PIPE
+
+        p = Popen(['python', getScriptPath('findInFiles.py'), '-nH'] + sys.argv[1:], stdin=PIPE, stdout=PIPE)
+        yield p.communicate(''.join(f + '\n' for f in files).encode('utf-8', 'surrogateescape'))[0]
+
+def iterResults(searchOnlyProj, Runner):
+    """Yields the results of Runner (Lister or Finder) for the includes of
+    the current project, or of the whole solution with the current project
+    first. Every chunk is yielded as soon as the ones before it are."""
 
-def listOrSearchFiles(searchOnlyProj, Runner):
     rootDir = getRootDir()
 
     soln = getProjSettings()
@@ -53,19 +276,46 @@ def listOrSearchFiles(searchOnlyProj, Runner):
     # The current directory decides the "current project"
     cwd = os.getcwd()
 
+    projects = soln.projectsForFile(cwd)
+    numCurrent = len(projects)
+    if not searchOnlyProj:
+        projects += [p for p in soln.projects if p not in projects]
+
+    includeRoots = getIncludeRoots(rootDir, projects, numCurrent)
+    Runner.prepare(rootDir, includeRoots)
+
     threads = []
-    for proj in soln.projects:
-        # Figure out if the current directory is in the current project
-        if (not searchOnlyProj) or proj.includesFile(cwd):
-            for inc in proj.includes:
-                th = Runner(rootDir, inc)
-                th.start()
-                threads += [th]
-
-    result = ''
+    for includeRoot in includeRoots:
+        th = Runner(rootDir, includeRoot)
+        th.start()
+        threads += [th]
+
     for th in threads:
-        th.join()
-        if len(th.result) > 5:
-            result += th.result.decode('utf-8')
+        while True:
+            chunk = th.chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+
+def listOrSearchFiles(searchOnlyProj, Runner):
+    results = list(iterResults(searchOnlyProj, Runner))
+    return b''.join(results).decode('utf-8').split("\n")
+
+def streamFiles(searchOnlyProj, Runner, out=None):
+    """Like listOrSearchFiles, but writes the results to out (a binary
+    stream, stdout by default) as soon as they are there."""
+
+    out = out or sys.stdout.buffer
+    for chunk in iterResults(searchOnlyProj, Runner):
+        out.write(chunk)
+        out.flush()
+
+def popStreamArg():
+    """Removes a leading --stream from the args of findInProj.py and the
+    like, which pass the rest of them to grep. Returns whether it was
+    there."""
 
-    return result.split("\n")
+    if sys.argv[1:2] == ['--stream']:
+        del sys.argv[1]
+        return True
+    return False
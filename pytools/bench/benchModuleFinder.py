@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# Compares ModuleFinder against the os.walk based module search it
+# replaced on a synthetic tree of about 20000 directories.
+#
+#   benchModuleFinder.py [numDirs] [numThreads ...]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from moduleFinder import ModuleFinder, MODULE_MARKER
+
+# Each module looks roughly like a real one: sources, tests, exports and
+# some directories which can never contain modules.
+MODULE_LAYOUT = ['src', 'src/impl', 'src/impl/detail', 'test', 'test/unit',
+                 'test/unit/data', 'export', 'export/include',
+                 'export/include/pkg', 'resources', 'resources/en',
+                 'l10n', 'l10n/ja_JP', 'l10n/ko_KR', 'l10n/zh_CN',
+                 '.git', '.git/objects', '.git/refs']
+
+def makeTree(topDir, numDirs):
+    numModules = numDirs // (len(MODULE_LAYOUT) + 1)
+    for i in range(numModules):
+        modDir = path.join(topDir, 'group%d' % (i % 20), 'mod%d' % i)
+        for sub in MODULE_LAYOUT:
+            os.makedirs(path.join(modDir, sub))
+        open(path.join(modDir, MODULE_MARKER), 'w').close()
+    return numModules
+
+def walkFind(topDir):
+    modules = []
+    for (dirname, _, files) in os.walk(topDir, topdown=True):
+        if MODULE_MARKER in files:
+            modules.append(dirname)
+    return sorted(modules)
+
+def timeIt(func, *args):
+    start = time.time()
+    result = func(*args)
+    return (time.time() - start, result)
+
+def main():
+    numDirs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threadCounts = [int(n) for n in sys.argv[2:]] or [1, 4, 16, 32]
+
+    topDir = tempfile.mkdtemp(prefix='benchModuleFinder')
+    try:
+        numModules = makeTree(topDir, numDirs)
+        print('%d modules in about %d directories' % (numModules, numDirs))
+
+        (t, expected) = timeIt(walkFind, topDir)
+        print('os.walk:                  %.3fs' % t)
+
+        for numThreads in threadCounts:
+            finder = ModuleFinder(numThreads=numThreads)
+            (t, found) = timeIt(finder.find, topDir)
+            assert found == expected, 'ModuleFinder found different modules'
+            print('ModuleFinder(%2d threads): %.3fs (%d directories listed)'
+                  % (numThreads, t, len(finder.visitedDirs)))
+    finally:
+        shutil.rmtree(topDir)
+
+if __name__ == "__main__":
+    main()
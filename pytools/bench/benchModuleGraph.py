@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Measures DependencyGraph on a random module graph: building it with its
+# transitive closures, and answering queries. The transitive dependencies
+# are checked against walking Project.depends one level at a time, which
+# is also timed.
+#
+#   benchModuleGraph.py [numModules] [depsPerModule]
+
+import random
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from moduleGraph import DependencyGraph
+
+# Modules mostly depend on lower level modules, but a few dependencies go
+# the other way and make cycles.
+BACK_EDGE_RATIO = 0.001
+
+class Module:
+    def __init__(self, name, depends):
+        self.name = name
+        self.depends = depends
+
+def makeModules(numModules, depsPerModule):
+    rand = random.Random(42)
+    modules = []
+    for i in range(numModules):
+        depends = set()
+        for j in range(min(i, depsPerModule)):
+            if rand.random() < BACK_EDGE_RATIO:
+                depends.add('mod%d' % rand.randrange(numModules))
+            else:
+                # Mostly close to the module, like in a layered code base.
+                depends.add('mod%d' % max(0, i - 1 - int(rand.expovariate(1.0 / 50))))
+        depends.discard('mod%d' % i)
+        modules.append(Module('mod%d' % i, sorted(depends)))
+    return modules
+
+def walkDependencies(byName, name):
+    seen = set()
+    level = [name]
+    while level:
+        nextLevel = []
+        for n in level:
+            for dep in byName[n].depends:
+                if dep not in seen:
+                    seen.add(dep)
+                    nextLevel.append(dep)
+        level = nextLevel
+    return seen
+
+def timeIt(func, *args):
+    start = time.time()
+    result = func(*args)
+    return (time.time() - start, result)
+
+def main():
+    numModules = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    depsPerModule = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    modules = makeModules(numModules, depsPerModule)
+    byName = dict((m.name, m) for m in modules)
+    names = [m.name for m in modules]
+    print('%d modules, %d dependencies' % (numModules, sum(len(m.depends) for m in modules)))
+
+    (t, graph) = timeIt(DependencyGraph, modules)
+    print('build graph:               %.3fs' % t)
+    (t, _) = timeIt(graph.ensureClosures)
+    print('transitive closures:       %.3fs (%d components)' % (t, len(graph.components)))
+
+    rand = random.Random(1)
+    pairs = [(rand.choice(names), rand.choice(names)) for i in range(100000)]
+    start = time.time()
+    for (a, b) in pairs:
+        graph.dependsOn(a, b)
+    print('dependsOn:                 %.2fus per query' % ((time.time() - start) / len(pairs) * 1e6))
+
+    sample = [rand.choice(names) for i in range(100)]
+    (t, found) = timeIt(lambda: [graph.dependencies(n) for n in sample])
+    print('dependencies (first time): %.2fms per module' % (t / len(sample) * 1000))
+    (t, _) = timeIt(lambda: [graph.dependencies(n) for n in sample])
+    print('dependencies (cached):     %.2fus per module' % (t / len(sample) * 1e6))
+
+    (t, expected) = timeIt(lambda: [walkDependencies(byName, n) for n in sample])
+    print('walking Project.depends:   %.2fms per module' % (t / len(sample) * 1000))
+    for (n, deps, walked) in zip(sample, found, expected):
+        assert deps == walked, 'different dependencies for %s' % n
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Compares searching a source tree the way findInProj.py used to, find
+# piped into findInFiles.py which runs grep, with searchFiles.py.
+#
+#   benchSearch.py [-n numFiles] [dir] [pattern ...]
+#
+# Without a directory, a tree with numFiles synthetic C++ files (and a few
+# binary ones) is generated. Every pattern is a list of grep args separated
+# by spaces, like '-w getValue'. Both outputs are checked to be the same.
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from os import path
+from subprocess import Popen, PIPE
+
+PYTOOLS = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, PYTOOLS)
+
+from searchFiles import getSearchOptions, search
+
+WORDS = ['get', 'set', 'value', 'block', 'port', 'handle', 'chart', 'state',
+         'data', 'model', 'compile', 'emit', 'node', 'visit', 'type', 'info',
+         'create', 'update', 'context', 'manager']
+
+DEFAULT_PATTERNS = ['getValue', '-w getValue', '-i CHARTSTATE', '-F visit(context',
+                    'emit.*Node', '-E (get|set)Port[0-9]+', 'noSuchIdentifier']
+
+def randomName():
+    words = [random.choice(WORDS) for i in range(random.randint(1, 3))]
+    return words[0] + ''.join(w.capitalize() for w in words[1:])
+
+def writeTree(rootDir, numFiles):
+    random.seed(0)
+    for i in range(numFiles):
+        dirName = path.join(rootDir, 'src', 'mod%d' % (i // 100))
+        if not path.isdir(dirName):
+            os.makedirs(dirName)
+        lines = ['#include "%s.hpp"' % randomName(), '']
+        for j in range(random.randint(50, 400)):
+            lines.append('    %s->%s(%s%d);' % (randomName(), randomName(), randomName(), j))
+        with open(path.join(dirName, 'file%d.cpp' % i), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        if i % 500 == 0:
+            with open(path.join(dirName, 'file%d.o' % i), 'wb') as f:
+                f.write(b'\0getValue\n' * 1000)
+
+def listFiles(rootDir):
+    p = Popen(['find', rootDir, '-type', 'f'], stdout=PIPE)
+    return p.communicate()[0].decode('utf-8').splitlines()
+
+def timeIt(func, *args):
+    start = time.time()
+    result = func(*args)
+    return (time.time() - start, result)
+
+def findPipeline(rootDir, args):
+    p1 = Popen(['find', rootDir, '-type', 'f'], stdout=PIPE)
+    p2 = Popen([sys.executable, path.join(PYTOOLS, 'findInFiles.py'), '-nH'] + args,
+               stdin=p1.stdout, stdout=PIPE, stderr=PIPE)
+    p1.stdout.close()
+    out = p2.communicate()[0]
+    # grep reports matching binary files, searchFiles skips them.
+    return b''.join(l for l in out.splitlines(True) if not l.startswith(b'Binary file '))
+
+def searchInProcess(rootDir, args):
+    return b''.join(search(getSearchOptions(args), listFiles(rootDir)))
+
+def main():
+    args = sys.argv[1:]
+    numFiles = 20000
+    if args[:1] == ['-n']:
+        numFiles = int(args[1])
+        args = args[2:]
+
+    tmpDir = None
+    if args:
+        rootDir = args[0]
+        patterns = args[1:] or DEFAULT_PATTERNS
+    else:
+        tmpDir = tempfile.mkdtemp(prefix='benchSearch')
+        rootDir = tmpDir
+        writeTree(rootDir, numFiles)
+        patterns = DEFAULT_PATTERNS
+
+    try:
+        files = listFiles(rootDir)
+        print('%d files in %s (%.1f MB)'
+              % (len(files), rootDir, sum(path.getsize(f) for f in files) / 1e6))
+
+        print('%-26s %9s %10s %10s' % ('pattern', 'matches', 'pipeline', 'searchFiles'))
+        for pattern in patterns:
+            grepArgs = pattern.split()
+            if getSearchOptions(grepArgs) is None:
+                print('%-26s not supported by searchFiles' % pattern)
+                continue
+            (tOld, old) = timeIt(findPipeline, rootDir, grepArgs)
+            (tNew, new) = timeIt(searchInProcess, rootDir, grepArgs)
+            assert old == new, 'different results for %s' % pattern
+            print('%-26s %9d %9.2fs %9.2fs'
+                  % (pattern, old.count(b'\n'), tOld, tNew))
+    finally:
+        if tmpDir:
+            shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
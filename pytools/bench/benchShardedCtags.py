@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Measures how genDirTags.runCtags speeds up with the number of shards on a
+# synthetic C++ source tree, and checks that every shard count produces
+# exactly the same tags file.
+#
+#   benchShardedCtags.py [--ctags PATH] [--files N] [shards ...]
+#
+# ctags is taken from --ctags, $CTAGS_CMD, the PATH or the default used by
+# genDirTags, in that order.
+
+import filecmp
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import genDirTags
+
+def makeTree(topDir, numFiles):
+    random.seed(0)
+    for i in range(numFiles):
+        dirName = path.join(topDir, 'dir%d' % (i % 100))
+        if not path.isdir(dirName):
+            os.makedirs(dirName)
+        with open(path.join(dirName, 'file%d.cpp' % i), 'w') as f:
+            f.write('namespace ns%d {\n' % (i % 37))
+            for j in range(random.randrange(5, 60)):
+                f.write('class Class%d_%d {\n  public:\n' % (i, j))
+                f.write('    int method%d(int a, double b);\n' % j)
+                f.write('    void other%d(const char* s) { (void)s; }\n' % j)
+                f.write('};\n')
+                f.write('int Class%d_%d::method%d(int a, double b) { return a + (int)b; }\n' % (i, j, j))
+                f.write('static int helper%d_%d(int x) { return x * %d; }\n' % (i, j, j))
+            f.write('}\n')
+
+def findCtags(option):
+    for candidate in [option, os.environ.get('CTAGS_CMD'), shutil.which('ctags'), genDirTags.ctags]:
+        if candidate and path.isfile(candidate):
+            return candidate
+    return None
+
+def main():
+    parser = OptionParser(usage="%prog [--ctags PATH] [--files N] [shards ...]")
+    parser.add_option("--ctags", dest="ctags", help="ctags executable", default=None)
+    parser.add_option("--files", dest="numFiles", type="int", help="number of source files", default=8000)
+    (options, args) = parser.parse_args()
+
+    ctags = findCtags(options.ctags)
+    if not ctags:
+        print('ctags not found. Use --ctags or set $CTAGS_CMD.')
+        sys.exit(1)
+    genDirTags.ctags = ctags
+
+    shardCounts = [int(n) for n in args] or [1, 2, 4, 8]
+
+    tmpDir = tempfile.mkdtemp(prefix='benchShardedCtags')
+    try:
+        srcDir = path.join(tmpDir, 'src')
+        makeTree(srcDir, options.numFiles)
+
+        files = genDirTags.listSourceFiles(srcDir, '*.cpp')
+        sizes = dict((f, st.st_size) for (f, st) in files.items())
+        names = sorted(files)
+        print('%d files, %.1f MB, %d cpus' % (len(names), sum(sizes.values()) / 1e6, os.cpu_count()))
+
+        reference = None
+        baseTime = None
+        for numShards in shardCounts:
+            tagsFile = path.join(tmpDir, 'tags%d' % numShards)
+            start = time.time()
+            genDirTags.runCtags(srcDir, names, [], tagsFile, sizes, numShards)
+            elapsed = time.time() - start
+
+            if reference is None:
+                (reference, baseTime) = (tagsFile, elapsed)
+            identical = filecmp.cmp(reference, tagsFile, shallow=False)
+
+            print('%2d shards: %7.2fs  speedup %.2fx  %s' %
+                  (numShards, elapsed, baseTime / elapsed,
+                   'identical' if identical else 'DIFFERENT OUTPUT'))
+    finally:
+        shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
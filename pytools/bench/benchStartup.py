@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+# Measures how long the pytools which are run all the time take to start
+# and fails when one of them got slower than its budget.
+#
+#   benchStartup.py [-n runs] [-v] [--server] [--keep] [--baseline]
+#
+# The tools run on a small fixture sandbox whose caches (the Solution, the
+# file lists and the tags manifests) are all up to date, so what they do is
+# the no-op path: start, import, load what is cached and find that there is
+# nothing to do. That is what they do most of the time, and most of it
+# used to be importing modules they did not need.
+#
+# For every entry point the best wall time and CPU time of the runs and
+# the time spent in imports (from python -X importtime) are measured, all
+# of them on top of what an empty python3 -c pass takes. The CPU and import
+# times are compared with their BASELINES plus a MARGIN, the wall time
+# depends too much on what else the machine does. The modules in UNWANTED
+# must not be imported at all. The exit status is 1 if any of that fails.
+# With --baseline the times measured are printed as new BASELINES.
+#
+# With --server the times through a toolServer.py running for the fixture
+# are shown as well, they are not checked. selectTag.py is a Tk GUI and is
+# not measured.
+
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+from os import path
+
+PYTOOLS = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, PYTOOLS)
+
+from toolClient import getSocketFile
+
+# Modules which are expensive to import and which none of the no-op paths
+# need. multiprocessing is only needed to search more than a chunk of
+# files and subprocess only when grep or ctags have to run.
+UNWANTED = ['xml.dom.minidom', 'multiprocessing', 'concurrent.futures',
+            'subprocess', 'socket', 'hashlib']
+
+# Only needed when the Solution or the file lists are not in the cache.
+NOT_CACHED = ['xml.etree.ElementTree', 'tempfile']
+
+# name -> (args, directory of the sandbox to run in, unwanted modules on
+# top of UNWANTED)
+ENTRY_POINTS = [
+    ('listFiles',           ['listFiles.py'], 'matlab/src/a', NOT_CACHED + ['optparse']),
+    ('listFiles -p',        ['listFiles.py', '-p'], 'matlab/src/a', NOT_CACHED),
+    ('findInProj',          ['findInProj.py', '-F', 'noSuchIdentifier'], 'matlab/src/a', NOT_CACHED),
+    ('findInSoln',          ['findInSoln.py', '-F', 'noSuchIdentifier'], 'matlab/src/a', NOT_CACHED),
+    ('genVimTags -i',       ['genVimTags.py', '-i', 'file0.cpp'], 'matlab/src/a', NOT_CACHED),
+    ('getCompilationDatabase', ['getCompilationDatabase.py', 'file0.cpp'], 'matlab/src/a', []),
+]
+
+# name -> (CPU time, import time), both on top of python3 -c pass and in
+# units of the CPU time and the import time of python3 -c pass itself. That
+# scales them to the speed of the machine, and the import time, which is
+# wall time, to its load. Measured with --baseline on an idle machine.
+BASELINES = {
+    'listFiles':              (1.71, 2.35),
+    'listFiles -p':           (1.90, 3.01),
+    'findInProj':             (1.73, 2.34),
+    'findInSoln':             (2.29, 2.37),
+    'genVimTags -i':          (2.37, 3.36),
+    'getCompilationDatabase': (1.52, 2.48),
+}
+
+# How much more than its baseline an entry point may take. That leaves room
+# for noise, a tool which goes over imports something it should not.
+MARGIN = 0.5
+
+MODULES = ['a', 'b', 'c']
+FILES_PER_MODULE = 50
+
+SPEC = """<solution>
+  <project name="tools">
+    <include path="matlab/toolbox/tools" pattern="*.m"/>
+  </project>
+  <modules_under path="matlab/src"/>
+</solution>
+"""
+
+MODULE_DATA = """<module>
+  <CPPFLAGS><flag>-DNDEBUG</flag><flag>-DGLNXA64</flag></CPPFLAGS>
+  <CXXFLAGS><flag>-std=c++17</flag><flag>-fPIC</flag></CXXFLAGS>
+  <moduleIncludePath><dir>export/include</dir><dir>../b/export/include</dir></moduleIncludePath>
+</module>
+"""
+
+# Stands in for ctags when the tags are generated the first time, the
+# no-op path never runs it.
+FAKE_CTAGS = """#!/bin/sh
+while [ $# -gt 0 ]; do
+    if [ "$1" = "-f" ]; then out="$2"; shift; fi
+    shift
+done
+printf '!_TAG_FILE_FORMAT\\t2\\t/extended format/\\n!_TAG_FILE_SORTED\\t1\\t/0=unsorted, 1=sorted, 2=foldcase/\\n' > "$out"
+"""
+
+def writeFile(fname, text):
+    if not path.isdir(path.dirname(fname)):
+        os.makedirs(path.dirname(fname))
+    with open(fname, 'w') as f:
+        f.write(text)
+
+def makeSandbox(rootDir):
+    writeFile(path.join(rootDir, 'mw_anchor'), '')
+    writeFile(path.join(rootDir, '.vimproj.xml'), SPEC)
+    for mod in MODULES:
+        modDir = path.join(rootDir, 'matlab', 'src', mod)
+        writeFile(path.join(modDir, 'MODULE_DEPENDENCIES'),
+                  '\n'.join('libmw' + m for m in MODULES if m < mod) + '\n')
+        for i in range(FILES_PER_MODULE):
+            subDir = ['', 'impl', 'impl/detail', 'test'][i % 4]
+            writeFile(path.join(modDir, subDir, 'file%d.cpp' % i),
+                      '#include "file%d.hpp"\n\nint func%d(int x)\n{\n    return x + %d;\n}\n' % (i, i, i))
+            writeFile(path.join(modDir, subDir, 'file%d.hpp' % i), 'int func%d(int x);\n' % i)
+        writeFile(path.join(modDir, 'export', 'include', mod + '.hpp'), 'int %s();\n' % mod)
+        writeFile(path.join(rootDir, 'matlab', 'derived', 'glnxa64', 'modules', 'src', mod,
+                            'module_data.xml'), MODULE_DATA)
+    for i in range(FILES_PER_MODULE):
+        writeFile(path.join(rootDir, 'matlab', 'toolbox', 'tools', 'tool%d.m' % i),
+                  'function tool%d\nend\n' % i)
+
+def makeTags(rootDir, env):
+    """Generates the tags and their manifests with a fake ctags, so that
+    genVimTags -i has nothing left to do."""
+
+    fakeCtags = path.join(rootDir, 'fakeCtags')
+    writeFile(fakeCtags, FAKE_CTAGS)
+    os.chmod(fakeCtags, 0o755)
+    code = ('import genDirTags, genVimTags, sys; genDirTags.ctags = sys.argv[1]; '
+            'genVimTags.genVimTags(sys.argv[2], incremental=True, allProjects=True)')
+    subprocess.check_call([sys.executable, '-c', code, fakeCtags,
+                           path.join(rootDir, 'matlab/src/a/file0.cpp')],
+                          cwd=rootDir, env=dict(env, PYTHONPATH=PYTOOLS),
+                          stdout=subprocess.DEVNULL)
+
+def ageDirs(rootDir):
+    """Moves the times of the directories in the sandbox an hour back. The
+    directories of a new sandbox are so recent that fileListCache would
+    read them again every time. The files are left alone, the tags
+    manifests have their times."""
+
+    then = time.time() - 3600
+    for (dirPath, dirNames, fileNames) in os.walk(rootDir):
+        os.utime(dirPath, (then, then))
+
+def getCommand(args):
+    return [sys.executable, path.join(PYTOOLS, args[0])] + args[1:]
+
+def run(cmd, cwd, env):
+    return subprocess.run(cmd, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+def getChildrenCPUTime():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def runTimes(cmd, cwd, env, runs):
+    """The best (wall time, CPU time) of runs of cmd, in milliseconds."""
+
+    (bestWall, bestCPU) = (None, None)
+    for i in range(runs):
+        startCPU = getChildrenCPUTime()
+        start = time.perf_counter()
+        run(cmd, cwd, env)
+        wall = (time.perf_counter() - start) * 1000
+        cpu = (getChildrenCPUTime() - startCPU) * 1000
+        bestWall = wall if bestWall is None else min(bestWall, wall)
+        bestCPU = cpu if bestCPU is None else min(bestCPU, cpu)
+    return (bestWall, bestCPU)
+
+# import time:   self [us] | cumulative | imported package
+IMPORT_TIME_PATTERN = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+def importTimes(cmd, cwd, env):
+    """Returns ({module: self time in us}, {top level module: cumulative
+    time in us}) of cmd."""
+
+    proc = run([cmd[0], '-X', 'importtime'] + cmd[1:], cwd, env)
+    modules = {}
+    topLevel = {}
+    for line in proc.stderr.decode('utf-8', 'replace').splitlines():
+        m = IMPORT_TIME_PATTERN.match(line)
+        if not m:
+            continue
+        (selfTime, cumulative, indent, name) = m.groups()
+        modules[name] = int(selfTime)
+        if not indent:
+            topLevel[name] = int(cumulative)
+    return (modules, topLevel)
+
+def extraImportTime(cmd, cwd, env, baseline, runs):
+    """The best time in milliseconds cmd spends importing the modules
+    python3 -c pass does not import, and all the modules it imports."""
+
+    best = None
+    for i in range(runs):
+        (modules, topLevel) = importTimes(cmd, cwd, env)
+        extra = sum(t for (name, t) in topLevel.items() if name not in baseline) / 1000.0
+        best = extra if best is None else min(best, extra)
+    return (best, modules)
+
+def waitForServer(rootDir, proc, timeout=30):
+    socketFile = getSocketFile(rootDir)
+    deadline = time.time() + timeout
+    while not path.exists(socketFile):
+        if proc.poll() is not None or time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+def main():
+    parser = OptionParser(usage="%prog [-n runs] [-v] [--server] [--keep] [--baseline]")
+    parser.add_option("-n", "--runs", dest="runs", type="int", help="runs of every entry point, the best one counts", default=20)
+    parser.add_option("-v", "--verbose", dest="verbose", help="list the slowest modules every entry point imports", action="store_true", default=False)
+    parser.add_option("--server", dest="server", help="also time the entry points through toolServer.py", action="store_true", default=False)
+    parser.add_option("--keep", dest="keep", help="do not remove the fixture sandbox", action="store_true", default=False)
+    parser.add_option("--baseline", dest="baseline", help="print the times measured as BASELINES", action="store_true", default=False)
+    (options, args) = parser.parse_args()
+
+    rootDir = path.realpath(tempfile.mkdtemp(prefix='benchStartup'))
+    # The .vimproj.xml in $HOME would be part of the Solution.
+    env = dict(os.environ, HOME=path.join(rootDir, 'home'))
+    # Without a server, with the .pyc files of the pytools written.
+    for name in ('PYTOOLS_NO_SERVER', 'PYTHONPATH', 'PYTHONDONTWRITEBYTECODE'):
+        env.pop(name, None)
+    os.makedirs(env['HOME'])
+
+    failures = []
+    try:
+        makeSandbox(rootDir)
+        makeTags(rootDir, env)
+        ageDirs(rootDir)
+
+        # Fills the caches and checks that every entry point works.
+        for (name, args, cwd, _) in ENTRY_POINTS:
+            proc = run(getCommand(args), path.join(rootDir, cwd), env)
+            if proc.returncode not in (0, 1) or proc.stderr:
+                print('%s failed:\n%s' % (name, proc.stderr.decode('utf-8', 'replace')))
+                failures.append(name)
+        if failures:
+            return 1
+
+        basePass = [sys.executable, '-c', 'pass']
+        (baseWall, baseCPU) = runTimes(basePass, rootDir, env, options.runs)
+        (baseImports, baseline) = extraImportTime(basePass, rootDir, env, {}, options.runs)
+        print('python3 -c pass: %.1f ms wall, %.1f ms CPU, %.1f ms imports, fixture in %s'
+              % (baseWall, baseCPU, baseImports, rootDir))
+        print('%-24s %9s %9s %7s %9s %7s' % ('[ms]', 'wall', 'CPU', 'budget', 'imports', 'budget'))
+
+        baselines = []
+        for (name, args, cwd, unwanted) in ENTRY_POINTS:
+            cmd = getCommand(args)
+            cwd = path.join(rootDir, cwd)
+            (wall, cpu) = runTimes(cmd, cwd, env, options.runs)
+            (wall, cpu) = (wall - baseWall, cpu - baseCPU)
+            (imports, modules) = extraImportTime(cmd, cwd, env, baseline, options.runs)
+            baselines.append((name, cpu / baseCPU, imports / baseImports))
+            (cpuBaseline, importBaseline) = BASELINES[name]
+            cpuBudget = cpuBaseline * baseCPU * (1 + MARGIN)
+            importBudget = importBaseline * baseImports * (1 + MARGIN)
+
+            problems = []
+            if cpu > cpuBudget:
+                problems.append('too slow')
+            if imports > importBudget:
+                problems.append('imports too much')
+            imported = [m for m in UNWANTED + unwanted if m in modules]
+            if imported:
+                problems.append('imports ' + ', '.join(imported))
+            if problems:
+                failures.append(name)
+
+            print('%-24s %9.1f %9.1f %7.1f %9.1f %7.1f  %s' % (name, wall, cpu, cpuBudget, imports, importBudget,
+                                                                'FAIL: ' + '; '.join(problems) if problems else 'ok'))
+            if options.verbose:
+                slowest = sorted([(t, m) for (m, t) in modules.items() if m not in baseline], reverse=True)
+                for (t, m) in slowest[:10]:
+                    print('    %7.1f  %s' % (t / 1000.0, m))
+
+        if options.baseline:
+            print('BASELINES = {')
+            for (name, cpu, imports) in baselines:
+                print('    %-25s (%.2f, %.2f),' % ("'%s':" % name, cpu, imports))
+            print('}')
+
+        if options.server:
+            server = subprocess.Popen([sys.executable, path.join(PYTOOLS, 'toolServer.py')],
+                                      cwd=rootDir, env=env, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL)
+            try:
+                if not waitForServer(rootDir, server):
+                    print('toolServer.py did not start')
+                    return 1
+                print('through toolServer.py:')
+                for (name, args, cwd, _) in ENTRY_POINTS:
+                    (wall, cpu) = runTimes(getCommand(args), path.join(rootDir, cwd), env, options.runs)
+                    print('%-24s %9.1f %9.1f' % (name, wall - baseWall, cpu - baseCPU))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        if options.keep:
+            print('kept %s' % rootDir)
+        else:
+            shutil.rmtree(rootDir, ignore_errors=True)
+
+    if failures:
+        print('over budget: %s' % ', '.join(failures))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
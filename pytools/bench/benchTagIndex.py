@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Measures building the index of a tags file (see tagIndex.py) for tags
+# files of growing size, and fails when the peak memory of the build grows
+# with the tags file.
+#
+#   benchTagIndex.py [numTags ...]
+#
+# Every index is built in a process of its own, whose peak RSS is what is
+# measured. The tags files are not sorted, like a tags file which was
+# appended to. That is the worst case: both orders of the index are sorted
+# in runs which are merged. The exit status is 1 if the peak RSS of the
+# largest build is more than MAX_GROWTH_MB over the one of the smallest.
+
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from os import path
+
+PYTOOLS = path.dirname(path.dirname(path.abspath(__file__)))
+
+MAX_GROWTH_MB = 10
+
+BUILD = """
+import resource, sys
+sys.path.insert(0, sys.argv[1])
+import tagIndex
+tagIndex.buildIndex(sys.argv[2])
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def makeTagsFile(fname, numTags):
+    rand = random.Random(42)
+    with open(fname, 'w') as f:
+        f.write('!_TAG_FILE_FORMAT\t2\t/extended format/\n')
+        f.write('!_TAG_FILE_SORTED\t0\t/0=unsorted, 1=sorted, 2=foldcase/\n')
+        for i in range(numTags):
+            name = '%s%sImpl%d' % (rand.choice(['get', 'set', 'Make', 'is', 'on']),
+                                   rand.choice(['Value', 'name', 'Block', 'port', 'Chart']),
+                                   rand.randrange(numTags))
+            f.write('%s\tsrc/mod%d/file%d.cpp\t/^void %s(int x)$/;"\tf\tclass:Cls%d\n'
+                    % (name, i % 100, i % 1000, name, i % 500))
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [100000, 400000, 1600000]
+
+    tmpDir = tempfile.mkdtemp(prefix='benchTagIndex')
+    try:
+        peaks = []
+        for numTags in sorted(sizes):
+            tagsFile = path.join(tmpDir, 'tags')
+            makeTagsFile(tagsFile, numTags)
+            start = time.time()
+            out = subprocess.check_output([sys.executable, '-c', BUILD, PYTOOLS, tagsFile])
+            elapsed = time.time() - start
+            # ru_maxrss is in kilobytes on Linux.
+            peaks.append(int(out) / 1024.0)
+            print('%8d tags, %6.1f MB: %6.2fs, peak RSS %6.1f MB'
+                  % (numTags, path.getsize(tagsFile) / 1e6, elapsed, peaks[-1]))
+    finally:
+        shutil.rmtree(tmpDir)
+
+    growth = peaks[-1] - peaks[0]
+    if growth > MAX_GROWTH_MB:
+        print('FAIL: peak RSS grew by %.1f MB, more than %d MB' % (growth, MAX_GROWTH_MB))
+        sys.exit(1)
+    print('ok: peak RSS grew by %.1f MB' % growth)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Measures how long selectTag takes to filter and rank the tags for some
+# filters: finding the candidates in the trigram index, checking them, and
+# then either picking the best screenful with a heap or sorting them all.
+#
+#   benchTagRanking.py [-n numTags] [tagsFile] [filter ...]
+#
+# Without a tags file, one with numTags synthetic C++ tags is generated.
+
+import heapq
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))), 'selecttag'))
+
+from parseTags import parseTags
+from TagItem import TagItemList
+from TrigramIndex import TrigramIndex
+
+NUM_SHOWN = 20
+
+WORDS = ['get', 'set', 'value', 'block', 'port', 'handle', 'chart', 'state',
+         'data', 'model', 'compile', 'emit', 'node', 'visit', 'type', 'info',
+         'create', 'update', 'sf', 'slsv', 'cg', 'ir', 'context', 'manager']
+
+DEFAULT_FILTERS = ['get', 'chart', 'getval', 'port han', 'create node',
+                   'stateinfo', 'xyz']
+
+def randomName(capitalizeFirst):
+    words = [random.choice(WORDS) for i in range(random.randint(1, 4))]
+    words = [w.capitalize() for w in words]
+    if not capitalizeFirst:
+        words[0] = words[0].lower()
+    return ''.join(words)
+
+def writeTagsFile(fname, numTags):
+    random.seed(0)
+    lines = []
+    for i in range(numTags):
+        cls = randomName(True)
+        name = randomName(False)
+        fileName = './src/%s.cpp' % cls
+        lines.append('%s\t%s\t/^void %s::%s(int)$/;"\tf\tclass:%s\tsignature:(int x)\n'
+                     % (name, fileName, cls, name, cls))
+    lines.sort()
+    with open(fname, 'w') as f:
+        f.write('!_TAG_FILE_FORMAT\t2\t/extended format/\n')
+        f.write('!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted, 2=foldcase/\n')
+        f.writelines(lines)
+
+def timeIt(func, *args):
+    start = time.time()
+    result = func(*args)
+    return (time.time() - start, result)
+
+def filterItems(items, index, filterTxt):
+    candidates = index.candidates(filterTxt)
+    if candidates is None:
+        candidates = range(len(items))
+    return [items[i] for i in candidates if items[i].satisfies(filterTxt)]
+
+def topK(matches, filterTxt):
+    scores = [-it.score(filterTxt) for it in matches]
+    best = heapq.nsmallest(NUM_SHOWN, range(len(matches)), key=scores.__getitem__)
+    return [matches[i] for i in best]
+
+def sortAll(matches, filterTxt):
+    return sorted(matches, key=lambda it: -it.score(filterTxt))
+
+def main():
+    args = sys.argv[1:]
+    numTags = 500000
+    if args[:1] == ['-n']:
+        numTags = int(args[1])
+        args = args[2:]
+
+    tmpDir = None
+    if args:
+        tagsFile = args[0]
+        filters = args[1:] or DEFAULT_FILTERS
+    else:
+        tmpDir = tempfile.mkdtemp(prefix='benchTagRanking')
+        tagsFile = path.join(tmpDir, 'bench.tags')
+        writeTagsFile(tagsFile, numTags)
+        filters = DEFAULT_FILTERS
+
+    try:
+        (t, tags) = timeIt(parseTags, tagsFile, False)
+        print('%d tags in %s (%.1f MB), parsed in %.2fs'
+              % (len(tags), tagsFile, os.path.getsize(tagsFile) / 1e6, t))
+
+        items = TagItemList(tags)
+        index = TrigramIndex()
+        (t, _) = timeIt(index.addAll, (it.txtLower for it in items))
+        print('trigram index built in %.2fs' % t)
+
+        print('%-14s %9s %9s %9s %9s' % ('filter', 'matches', 'filter', 'top %d' % NUM_SHOWN, 'sort all'))
+        for filterTxt in filters:
+            (tFilter, matches) = timeIt(filterItems, items, index, filterTxt)
+            (tTop, best) = timeIt(topK, matches, filterTxt)
+            (tSort, ranked) = timeIt(sortAll, matches, filterTxt)
+            assert [it.txt for it in best] == [it.txt for it in ranked[:NUM_SHOWN]]
+            print('%-14s %9d %8.1fms %8.1fms %8.1fms'
+                  % (filterTxt, len(matches), tFilter * 1e3, tTop * 1e3, tSort * 1e3))
+            for it in best[:3]:
+                print('    %s' % it.txt)
+    finally:
+        if tmpDir:
+            shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
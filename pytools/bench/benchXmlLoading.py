@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Compares the streaming loaders for .vimproj.xml and module_data.xml with
+# the minidom / ElementTree.fromstring based code they replaced. Reports the
+# parse time and the peak memory allocated while parsing.
+#
+#   benchXmlLoading.py [numModules] [numFlags]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.dom.minidom
+import xml.etree.ElementTree as ET
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from getProjSettings import Project, handleModuleImpl, loadSolution
+from getCompilationDatabase import readModuleData
+
+def writeSpec(fname, numModules):
+    with open(fname, 'w') as f:
+        f.write('<solution>\n')
+        for i in range(numModules // 10):
+            f.write('    <project name="proj%d">\n' % i)
+            f.write('        <include path="matlab/toolbox/proj%d" pattern="*.m *.html" />\n' % i)
+            f.write('        <export path="matlab/toolbox/proj%d/export" pattern="*.hpp" />\n' % i)
+            f.write('        <depends>mod%d mod%d</depends>\n' % (i, i + 1))
+            f.write('    </project>\n')
+        for i in range(numModules):
+            f.write('    <module path="matlab/src/group%d/mod%d" extraIncludes="*.zml"></module>\n' % (i % 50, i))
+        f.write('</solution>\n')
+
+def writeModuleData(fname, numFlags):
+    with open(fname, 'w') as f:
+        f.write('<moduleData>\n')
+        for section in ['CPPFLAGS', 'CXXFLAGS', 'LDFLAGS']:
+            f.write('  <%s>\n' % section)
+            for i in range(numFlags):
+                f.write('    <flag>-DSOME_LONGISH_DEFINE_NAME_%d=%d</flag>\n' % (i, i))
+            f.write('  </%s>\n' % section)
+        f.write('  <moduleIncludePath>\n')
+        for i in range(numFlags):
+            f.write('    <dir>../../derived/glnxa64/src/include/mod%d</dir>\n' % i)
+        f.write('  </moduleIncludePath>\n')
+        f.write('</moduleData>\n')
+
+def getText(doms):
+    txt = ''
+    for d in doms:
+        for c in d.childNodes:
+            if c.nodeType == c.TEXT_NODE:
+                txt += c.data
+    return txt
+
+def legacyLoadSolution(fname, rootDir):
+    dom = xml.dom.minidom.parseString(open(fname).read())
+    projects = []
+    for projDom in dom.getElementsByTagName('project'):
+        depends = getText(projDom.getElementsByTagName('depends')).strip().split()
+        proj = Project(projDom.getAttribute('name'), '', depends)
+        for incDom in projDom.getElementsByTagName('include'):
+            proj.addInclude(incDom.getAttribute('path'), incDom.getAttribute('pattern'))
+        for expDom in projDom.getElementsByTagName('export'):
+            proj.addExport(expDom.getAttribute('path'), expDom.getAttribute('pattern'))
+        projects.append(proj)
+    for modDom in dom.getElementsByTagName('module'):
+        projects.append(handleModuleImpl(rootDir, modDom.getAttribute('path'),
+                                         modDom.getAttribute('extraIncludes')))
+    return projects
+
+def legacyReadModuleData(fname):
+    root = ET.fromstring(open(fname).read())
+    return ([f.text for f in root.findall('./CPPFLAGS/flag')],
+            [f.text for f in root.findall('./CXXFLAGS/flag')],
+            [d.text for d in root.findall('./moduleIncludePath/dir')])
+
+def measure(func, *args):
+    elapsed = None
+    for i in range(3):
+        start = time.time()
+        func(*args)
+        t = time.time() - start
+        elapsed = t if elapsed is None else min(elapsed, t)
+
+    tracemalloc.start()
+    func(*args)
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (elapsed, peak)
+
+def report(name, func, *args):
+    (elapsed, peak) = measure(func, *args)
+    print('%-28s %8.3fs %10.1f MB' % (name, elapsed, peak / 1e6))
+
+def main():
+    numModules = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    numFlags = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    tmpDir = tempfile.mkdtemp(prefix='benchXmlLoading')
+    try:
+        specFile = path.join(tmpDir, '.vimproj.xml')
+        moduleDataFile = path.join(tmpDir, 'module_data.xml')
+        writeSpec(specFile, numModules)
+        writeModuleData(moduleDataFile, numFlags)
+
+        print('.vimproj.xml with %d modules (%.1f MB)' % (numModules, os.path.getsize(specFile) / 1e6))
+        report('  minidom', legacyLoadSolution, specFile, tmpDir)
+        report('  streaming', loadSolution, specFile, tmpDir)
+
+        print('module_data.xml with %d entries per section (%.1f MB)' % (numFlags, os.path.getsize(moduleDataFile) / 1e6))
+        report('  ElementTree.fromstring', legacyReadModuleData, moduleDataFile)
+        report('  streaming', readModuleData, moduleDataFile)
+    finally:
+        shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+    main()
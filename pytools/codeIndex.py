@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+# A trigram index of all the files of the Solution, kept in
+# <rootDir>/.sbtools/codeIndex.
+#
+# For every file the index knows the set of trigrams (three consecutive
+# bytes, lower cased) in it. A search only has to look at the files which
+# contain all the trigrams of the literal strings its matches must contain
+# (see searchFiles.requiredLiterals).
+#
+# The index is made of segments: files of postings, which map a trigram to
+# the sorted ids of the files it occurs in. Segments are never changed.
+# When a file changes it gets a new id, is indexed into a new segment, and
+# its old id becomes a tombstone. Once there are too many segments they
+# are merged into one, leaving out the tombstones. The list of files with
+# the mtime and size they were indexed with is kept in a separate pickle.
+#
+#   codeIndex.py [-f]       update the index with the files of the Solution
+#   codeIndex.py -s         show how big the index is
+
+import fcntl
+import mmap
+import os
+import pickle
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from os import path
+
+from searchFiles import NUM_WORKERS, BINARY_CHECK_BYTES, translateRegexp, splitAlternatives, requiredLiterals
+
+INDEX_DIR = path.join('.sbtools', 'codeIndex')
+FILES_NAME = 'files'
+LOCK_NAME = 'lock'
+
+# Bump this whenever the format of the index changes.
+INDEX_VERSION = 1
+
+SEGMENT_MAGIC = b'VTRIGSG1'
+# magic, number of trigrams, number of postings
+SEGMENT_HEADER = struct.Struct('=8sQQ')
+
+# Files are indexed this many at a time, each batch into its own segment.
+FILES_PER_SEGMENT = 20000
+MAX_SEGMENTS = 8
+
+# Larger files are not indexed, they are always searched.
+MAX_FILE_SIZE = 16 << 20
+
+# What the index knows about a file.
+TEXT = 0
+BINARY = 1
+LARGE = 2
+
+def getIndexDir(rootDir):
+    return path.join(rootDir, INDEX_DIR)
+
+def hasIndex(rootDir):
+    """Whether rootDir has an index. The directory is there as soon as its
+    first build starts, the list of files only once it is done."""
+    return path.isfile(path.join(getIndexDir(rootDir), FILES_NAME))
+
+def trigramKey(a, b, c):
+    return (a << 16) | (b << 8) | c
+
+def stringTrigrams(s):
+    """Returns the keys of the trigrams of the str or bytes s."""
+
+    if not isinstance(s, bytes):
+        s = s.encode('utf-8', 'surrogateescape')
+    s = s.lower()
+    return set(trigramKey(*t) for t in zip(s, s[1:], s[2:]))
+
+def readFileTrigrams(fname):
+    """Returns (mtime, size, kind, trigram keys) of fname, or None if it
+    cannot be read."""
+
+    try:
+        with open(fname, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size > MAX_FILE_SIZE:
+                return (st.st_mtime_ns, st.st_size, LARGE, None)
+            data = f.read()
+    except (IOError, OSError):
+        return None
+
+    if b'\0' in data[:BINARY_CHECK_BYTES]:
+        return (st.st_mtime_ns, st.st_size, BINARY, None)
+
+    data = data.lower()
+    keys = array('I', sorted(trigramKey(*t) for t in set(zip(data, data[1:], data[2:]))))
+    return (st.st_mtime_ns, st.st_size, TEXT, keys)
+
+def literalQuery(options):
+    """Returns what the files with matches for options (searchFiles
+    SearchOptions) have to contain: a list of alternatives, each a list of
+    strings a file must all contain."""
+
+    if options.fixedStrings:
+        return [[options.pattern]]
+    regexp = translateRegexp(options.pattern, options.extended)
+    return [requiredLiterals(alt) for alt in splitAlternatives(regexp)]
+
+class Segment:
+    """Postings of the trigrams of some files, read through mmap."""
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.data = None
+        self.keys = self.offsets = self.postings = []
+
+        with open(fname, 'rb') as f:
+            header = f.read(SEGMENT_HEADER.size)
+            (magic, numKeys, numPostings) = SEGMENT_HEADER.unpack(header)
+            if magic != SEGMENT_MAGIC:
+                raise ValueError('%s is not a code index segment' % fname)
+            if numKeys == 0:
+                return
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        start = SEGMENT_HEADER.size
+        self.keys = memoryview(self.data)[start:start + 4 * numKeys].cast('I')
+        start += 4 * (numKeys + numKeys % 2)
+        self.offsets = memoryview(self.data)[start:start + 8 * (numKeys + 1)].cast('Q')
+        start += 8 * (numKeys + 1)
+        self.postings = memoryview(self.data)[start:start + 4 * numPostings].cast('I')
+
+    def close(self):
+        self.keys = self.offsets = self.postings = []
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def lookup(self, key):
+        """Returns the ids of the files with the trigram key."""
+
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return []
+        return self.postings[self.offsets[i]:self.offsets[i+1]]
+
+    def iterPostings(self):
+        for i in range(len(self.keys)):
+            yield (self.keys[i], self.postings[self.offsets[i]:self.offsets[i+1]])
+
+def writeSegment(fname, postings):
+    """Writes a segment with postings, a dictionary from trigram keys to
+    sorted arrays of file ids."""
+
+    keys = array('I', sorted(postings))
+    offsets = array('Q', [0])
+    for key in keys:
+        offsets.append(offsets[-1] + len(postings[key]))
+
+    tmpFile = fname + '.tmp'
+    with open(tmpFile, 'wb') as f:
+        f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(keys), offsets[-1]))
+        keys.tofile(f)
+        if len(keys) % 2:
+            # Keeps the offsets 8 byte aligned.
+            f.write(b'\0' * 4)
+        offsets.tofile(f)
+        for key in keys:
+            postings[key].tofile(f)
+    os.replace(tmpFile, fname)
+
+class CodeIndex:
+    """The code index of a sandbox. Use it in a with statement, which holds
+    a lock for the index. Any number of processes can read the index at the
+    same time with shared, only one at a time can update it."""
+
+    def __init__(self, rootDir, shared=False):
+        self.rootDir = rootDir
+        self.indexDir = getIndexDir(rootDir)
+        self.shared = shared
+        self.lockFile = None
+
+        # Indexed by file id: (path, mtime, size, kind), or None for the
+        # tombstones of files which changed or went away.
+        self.files = []
+        self.segmentNames = []
+        self.nextSegment = 0
+
+        self.ids = {}
+        self.segments = []
+
+    def __enter__(self):
+        if not path.isdir(self.indexDir):
+            os.makedirs(self.indexDir)
+        self.lockFile = open(path.join(self.indexDir, LOCK_NAME), 'w')
+        fcntl.flock(self.lockFile, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        self.load()
+        return self
+
+    def __exit__(self, *args):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self.lockFile.close()
+        self.lockFile = None
+
+    def exists(self):
+        return len(self.files) > 0
+
+    def load(self):
+        try:
+            with open(path.join(self.indexDir, FILES_NAME), 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != INDEX_VERSION:
+                return
+            segments = [Segment(path.join(self.indexDir, name)) for name in data['segments']]
+        except Exception:
+            return
+
+        self.files = data['files']
+        self.segmentNames = data['segments']
+        self.nextSegment = data['nextSegment']
+        self.segments = segments
+        self.ids = dict((f[0], i) for (i, f) in enumerate(self.files) if f is not None)
+
+    def save(self):
+        data = {'version': INDEX_VERSION,
+                'files': self.files,
+                'segments': self.segmentNames,
+                'nextSegment': self.nextSegment}
+        fname = path.join(self.indexDir, FILES_NAME)
+        with open(fname + '.tmp', 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(fname + '.tmp', fname)
+
+    def clear(self):
+        """Forgets all the files, the next update indexes them again."""
+
+        for segment in self.segments:
+            segment.close()
+        for name in self.segmentNames:
+            os.remove(path.join(self.indexDir, name))
+        self.files = []
+        self.segmentNames = []
+        self.segments = []
+        self.ids = {}
+        self.save()
+
+    def newSegmentName(self):
+        self.nextSegment += 1
+        return 'seg%06d' % self.nextSegment
+
+    def isStale(self, fileId):
+        (fname, mtime, size, kind) = self.files[fileId]
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return True
+        return st.st_mtime_ns != mtime or st.st_size != size
+
+    def findChanges(self, allFiles):
+        """Returns the ids of the files which changed since they were
+        indexed or which are not in allFiles any more, and the files in
+        allFiles which are not indexed yet."""
+
+        stale = set(i for (i, f) in enumerate(self.files) if f is not None and self.isStale(i))
+        stale.update(self.ids[f] for f in set(self.ids) - allFiles)
+        return (stale, allFiles - set(self.ids))
+
+    def isUpToDate(self, allFiles):
+        (stale, toIndex) = self.findChanges(set(allFiles))
+        return not stale and not toIndex
+
+    def update(self, allFiles):
+        """Brings the index up to date with allFiles, the files of the
+        Solution: re-indexes the files which changed since they were
+        indexed, adds the new ones and removes the ones which are gone.
+        Returns the number of files which were indexed."""
+
+        allFiles = set(allFiles)
+        (stale, toIndex) = self.findChanges(allFiles)
+
+        for fileId in stale:
+            fname = self.files[fileId][0]
+            self.files[fileId] = None
+            del self.ids[fname]
+            if fname in allFiles:
+                toIndex.add(fname)
+
+        toIndex = sorted(toIndex)
+        if toIndex:
+            self.indexFiles(toIndex)
+        if len(self.segmentNames) > MAX_SEGMENTS:
+            self.merge()
+        if stale or toIndex or not path.exists(path.join(self.indexDir, FILES_NAME)):
+            self.save()
+        return len(toIndex)
+
+    def indexFiles(self, fnames):
+        if len(fnames) > 100 and NUM_WORKERS > 1:
+            from multiprocessing import Pool
+            pool = Pool(NUM_WORKERS)
+            results = pool.imap(readFileTrigrams, fnames, 64)
+        else:
+            pool = None
+            results = map(readFileTrigrams, fnames)
+
+        try:
+            postings = {}
+            numInSegment = 0
+            for (fname, result) in zip(fnames, results):
+                if result is None:
+                    continue
+                (mtime, size, kind, keys) = result
+                fileId = len(self.files)
+                self.files.append((fname, mtime, size, kind))
+                self.ids[fname] = fileId
+
+                if keys is not None:
+                    for key in keys:
+                        if key in postings:
+                            postings[key].append(fileId)
+                        else:
+                            postings[key] = array('I', [fileId])
+                numInSegment += 1
+                if numInSegment == FILES_PER_SEGMENT:
+                    self.addSegment(postings)
+                    postings = {}
+                    numInSegment = 0
+            if postings:
+                self.addSegment(postings)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def addSegment(self, postings):
+        name = self.newSegmentName()
+        writeSegment(path.join(self.indexDir, name), postings)
+        self.segmentNames.append(name)
+        self.segments.append(Segment(path.join(self.indexDir, name)))
+
+    def merge(self):
+        """Merges all the segments into one. The tombstones are dropped and
+        the files get new ids."""
+
+        newIds = array('i')
+        files = []
+        for f in self.files:
+            newIds.append(len(files) if f is not None else -1)
+            if f is not None:
+                files.append(f)
+
+        postings = {}
+        for segment in self.segments:
+            for (key, ids) in segment.iterPostings():
+                ids = array('I', [newIds[i] for i in ids if newIds[i] >= 0])
+                if not ids:
+                    continue
+                if key in postings:
+                    postings[key].extend(ids)
+                else:
+                    postings[key] = ids
+
+        oldNames = self.segmentNames
+        for segment in self.segments:
+            segment.close()
+        self.files = files
+        self.ids = dict((f[0], i) for (i, f) in enumerate(files))
+        self.segmentNames = []
+        self.segments = []
+        self.addSegment(postings)
+        # Saved before the old segments are removed, so that the index on
+        # disk never refers to a missing segment.
+        self.save()
+        for name in oldNames:
+            os.remove(path.join(self.indexDir, name))
+
+    def findAll(self, keys):
+        """Returns the ids of the files containing all the trigram keys."""
+
+        found = set()
+        for segment in self.segments:
+            lists = sorted((segment.lookup(key) for key in keys), key=len)
+            if not lists or not lists[0]:
+                continue
+            ids = set(lists[0])
+            for ids2 in lists[1:]:
+                ids.intersection_update(ids2)
+                if not ids:
+                    break
+            found |= ids
+        return found
+
+    def candidates(self, query):
+        """Returns the files which can have matches for the query (see
+        literalQuery), in the order they were indexed."""
+
+        found = set()
+        for literals in query:
+            keys = set()
+            for literal in literals:
+                keys |= stringTrigrams(literal)
+            if not keys:
+                # Every file can match this one.
+                found = None
+                break
+            found |= self.findAll(keys)
+
+        result = []
+        for (i, f) in enumerate(self.files):
+            if f is None or f[3] == BINARY:
+                continue
+            if found is None or f[3] == LARGE or i in found:
+                result.append(f[0])
+        return result
+
+    def stats(self):
+        numFiles = sum(1 for f in self.files if f is not None)
+        numTombstones = len(self.files) - numFiles
+        numBytes = sum(path.getsize(path.join(self.indexDir, name)) for name in self.segmentNames)
+        return ('%d files (%d tombstones), %d segments, %.1f MB'
+                % (numFiles, numTombstones, len(self.segmentNames), numBytes / 1e6))
+
+def getSolutionFiles():
+    from ListSearch import listOrSearchFiles, Lister
+    return [f for f in listOrSearchFiles(0, Lister) if f]
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+    from sbtools import getRootDir
+
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-f", "--full", dest="full", help="re-index all the files", action="store_true", default=False)
+    parser.add_option("-s", "--stats", dest="stats", help="only show how big the index is", action="store_true", default=False)
+    (options, args) = parser.parse_args()
+
+    rootDir = getRootDir()
+    if not rootDir:
+        print("ERROR: Not in a sandbox.")
+        sys.exit(1)
+
+    with CodeIndex(rootDir) as index:
+        if not options.stats:
+            if options.full:
+                index.clear()
+            numIndexed = index.update(getSolutionFiles())
+            print("Indexed %d files" % numIndexed)
+        print(index.stats())
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+# A persistent cache of the files under a directory, kept in
+# <rootDir>/.sbtools/fileLists. There is one per include root of the
+# Solution and filter, as a filter only walks some of the directories.
+#
+# For every directory the cache has its mtime and the names of the files
+# and sub-directories in it. Adding, removing or renaming an entry changes
+# the mtime of its directory, so listing the files again only needs a stat
+# per directory, and only the directories which changed are read again.
+#
+# Directories are read a level at a time by a pool of threads, which keeps
+# several reads in flight on a cold or network file system.
+#
+# A process which lists files more than once, like toolServer.py, keeps the
+# cache files it read in memory and only reads them again once they change.
+# It also keeps the last list of files of every directory and filter, which
+# is used again as long as none of the directories changed.
+
+import os
+import pickle
+import time
+import zlib
+from os import path
+from threading import Lock
+
+CACHE_DIR = path.join('.sbtools', 'fileLists')
+
+# Bump this whenever the format of the cached data changes.
+CACHE_VERSION = 3
+
+# A directory changed this recently can change again without its mtime
+# changing, so it is read again the next time.
+RACY_NS = 2 * 10**9
+
+NUM_THREADS = 8
+
+pool = None
+poolLock = Lock()
+
+def getPool():
+    """The pool of threads shared by all the caches."""
+
+    global pool
+    with poolLock:
+        if pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            pool = ThreadPoolExecutor(NUM_THREADS)
+        return pool
+
+def closePool():
+    """Stops the threads of the pool, a new one is made when needed."""
+
+    global pool
+    with poolLock:
+        if pool is not None:
+            pool.shutdown()
+            pool = None
+
+def forgetPool():
+    """The threads of the pool are not there in a forked process."""
+
+    global pool, poolLock
+    pool = None
+    poolLock = Lock()
+
+os.register_at_fork(after_in_child=forgetPool)
+
+def getCacheFile(rootDir, dirName, filterKey=None):
+    # Not hashlib, which takes longer to import than most listings take.
+    # Two listings with the same name only share a cache file, which knows
+    # which directory and filter it is for.
+    data = dirName.encode('utf-8', 'surrogateescape')
+    if filterKey is not None:
+        data += b'\0' + repr(filterKey).encode('utf-8', 'surrogateescape')
+    key = '%08x%08x' % (zlib.crc32(data), zlib.adler32(data))
+    return path.join(rootDir, CACHE_DIR, key)
+
+# cache file -> ((mtime, size) of it, its data) of the cache files read by
+# this process.
+loaded = {}
+
+def readCacheFile(cacheFile):
+    """Returns the data in cacheFile, from memory if it did not change
+    since it was last read."""
+
+    st = os.stat(cacheFile)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = loaded.get(cacheFile)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(cacheFile, 'rb') as f:
+        data = pickle.load(f)
+    loaded[cacheFile] = (stamp, data)
+    return data
+
+# (cache file, filter key) -> (the directories, the files) of the last
+# listing with a filter.
+listed = {}
+
+def preload(rootDir):
+    """Reads all the cache files of rootDir which changed into memory."""
+
+    cacheDir = path.join(rootDir, CACHE_DIR)
+    try:
+        names = os.listdir(cacheDir)
+    except OSError:
+        return
+    for name in names:
+        if not name.startswith('.tmp'):
+            try:
+                readCacheFile(path.join(cacheDir, name))
+            except Exception:
+                pass
+
+def readDir(dirName):
+    """Returns the names of the (files, sub-directories, symbolic links to
+    directories) in dirName. Symbolic links are files, like for find, the
+    ones to directories are also returned on their own."""
+
+    files = []
+    subDirs = []
+    dirLinks = []
+    try:
+        with os.scandir(dirName) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subDirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+                    if entry.is_symlink() and entry.is_dir():
+                        dirLinks.append(entry.name)
+    except OSError:
+        pass
+    return (files, subDirs, dirLinks)
+
+class FileListCache:
+    """The cached listing of the files under dirName with fileFilter.
+
+    fileFilter decides which files are listed and which directories are
+    walked. Its key() tells filters which list the same files apart. It
+    gives the top directory a state with rootState().
+    enterDir(state, path, name) returns the state of a sub-directory from
+    the one of its parent, or None to skip it. A file is listed if
+    isListed(state, dirPath, name) for the state of its directory.
+    Symbolic links to directories are only walked, like directories, if
+    followsLink(path)."""
+
+    def __init__(self, rootDir, dirName, refresh=False, fileFilter=None):
+        self.fileFilter = fileFilter
+        self.filterKey = fileFilter.key() if fileFilter is not None else None
+        self.cacheFile = getCacheFile(rootDir, dirName, self.filterKey)
+        self.dirName = dirName
+
+        # dirName -> (mtime or None, files, sub-directories, links to
+        # directories)
+        self.oldDirs = {} if refresh else self.load()
+        self.dirs = {}
+        self.changed = refresh
+
+    def load(self):
+        try:
+            data = readCacheFile(self.cacheFile)
+        except Exception:
+            return {}
+        if (data.get('version') != CACHE_VERSION or data.get('dirName') != self.dirName or
+                data.get('filterKey') != self.filterKey):
+            return {}
+        return data['dirs']
+
+    def save(self):
+        from tempfile import mkstemp
+
+        data = {'version': CACHE_VERSION,
+                'dirName': self.dirName,
+                'filterKey': self.filterKey,
+                'dirs': self.dirs}
+
+        cacheDir = path.dirname(self.cacheFile)
+        try:
+            if not path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+            (fd, tmpFile) = mkstemp(dir=cacheDir, prefix='.tmp')
+        except OSError:
+            # Read-only sandbox. Just live without a cache.
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpFile, self.cacheFile)
+        except Exception:
+            if path.exists(tmpFile):
+                os.remove(tmpFile)
+
+    def getDirs(self, dirNames):
+        """Returns the (mtime or None, files, sub-directories, links to
+        directories) of dirNames, None for the ones which do not exist.
+        Only the directories which changed are read."""
+
+        entries = []
+        toRead = []
+        for dirName in dirNames:
+            try:
+                mtime = os.stat(dirName).st_mtime_ns
+            except OSError:
+                entries.append(None)
+                continue
+
+            cached = self.oldDirs.get(dirName)
+            if cached is not None and cached[0] == mtime:
+                entries.append(cached)
+            else:
+                toRead.append((len(entries), dirName, mtime))
+                entries.append(None)
+
+        if toRead:
+            self.changed = True
+            if len(toRead) > 1:
+                listings = getPool().map(readDir, [d for (_, d, _) in toRead])
+            else:
+                listings = [readDir(toRead[0][1])]
+
+            now = time.time_ns()
+            for ((i, dirName, mtime), (files, subDirs, dirLinks)) in zip(toRead, listings):
+                if now - mtime < RACY_NS:
+                    mtime = None
+                entries[i] = (mtime, files, subDirs, dirLinks)
+        return entries
+
+    def listFiles(self):
+        """Returns the paths of the files under the directory which pass
+        the filter and saves the cache if anything changed."""
+
+        fileFilter = self.fileFilter
+        states = {self.dirName: fileFilter.rootState() if fileFilter else None}
+        level = [self.dirName]
+        while level:
+            nextLevel = []
+            for (dirName, entry) in zip(level, self.getDirs(level)):
+                if entry is None:
+                    continue
+                self.dirs[dirName] = entry
+                state = states[dirName]
+                for d in entry[2] + entry[3]:
+                    subDir = path.join(dirName, d)
+                    if d in entry[3] and (fileFilter is None or not fileFilter.followsLink(subDir)):
+                        continue
+                    if fileFilter is not None:
+                        subState = fileFilter.enterDir(state, subDir, d)
+                        if subState is None:
+                            continue
+                        states[subDir] = subState
+                    nextLevel.append(subDir)
+            level = nextLevel
+
+        if self.changed or len(self.dirs) != len(self.oldDirs):
+            self.save()
+
+        listedKey = (self.cacheFile, self.filterKey)
+        last = listed.get(listedKey)
+        if last is not None and last[0] == self.dirs:
+            return list(last[1])
+
+        # Depth first, the way find lists them.
+        result = []
+        stack = [self.dirName]
+        while stack:
+            dirName = stack.pop()
+            entry = self.dirs.get(dirName)
+            if entry is None:
+                continue
+            (_, files, subDirs, dirLinks) = entry
+            if fileFilter is not None:
+                state = states[dirName]
+                files = [f for f in files if fileFilter.isListed(state, dirName, f)]
+            result.extend([path.join(dirName, f) for f in files])
+            # Only the links which were followed are in self.dirs.
+            stack.extend(reversed([path.join(dirName, d) for d in subDirs + dirLinks]))
+
+        listed[listedKey] = (self.dirs, result)
+        return list(result)
+
+def listFiles(rootDir, dirName, refresh=False, fileFilter=None):
+    """Returns the paths of all the files under dirName, using the cache
+    in rootDir. With refresh, all the directories are read again. See
+    FileListCache for fileFilter."""
+
+    return FileListCache(rootDir, dirName, refresh, fileFilter).listFiles()
@@ -1,43 +1,133 @@
 #!/usr/bin/env python
 
-from threading import Thread
-from sbtools import getoutput
-from os import path
-from sbtools import *
-
-class Finder(Thread):
-    def __init__(self, files, args):
-        Thread.__init__(self)
-        self.args = ['grep'] + args + files
-        self.result = []
-
-    def run(self):
-        self.result = getoutput(self.args).strip()
-
-def find(args, allFiles):
-    numMaxFilesPerThread = 200
-    
-    fileGroups = []
-    while 1:
-        fileGroups += [allFiles[:numMaxFilesPerThread]]
-        allFiles[:numMaxFilesPerThread] = []
-        if not allFiles:
-            break
+# Greps the files listed on stdin. The files are split into chunks of
+# about the same number of bytes, which are grepped by a bounded number of
+# grep processes. The output is written in the order of the files as soon
+# as all the chunks before it are done.
 
-    threads = []
-    for i, fg in enumerate(fileGroups):
-        threads += [Finder(fileGroups[i], args)]
-        threads[-1].start()
+import os
+import sys
+from threading import Thread, Condition
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+try:
+    NUM_WORKERS = os.cpu_count() or 1
+except AttributeError:
+    import multiprocessing
+    NUM_WORKERS = multiprocessing.cpu_count()
+
+# Chunks are sized so that every worker gets a few of them, but are never
+# so small that starting grep dominates or so large that the first results
+# take long to show up.
+MIN_CHUNK_BYTES = 1 << 20
+MAX_CHUNK_BYTES = 64 << 20
+CHUNKS_PER_WORKER = 4
+
+# Keeps the command lines well below the limits of the system.
+MAX_FILES_PER_CHUNK = 1000
+
+def getSize(fname):
+    try:
+        return os.path.getsize(fname)
+    except OSError:
+        return 0
+
+def makeChunks(allFiles, numWorkers):
+    sizes = [getSize(f) for f in allFiles]
+
+    chunkBytes = sum(sizes) // (numWorkers * CHUNKS_PER_WORKER)
+    chunkBytes = max(MIN_CHUNK_BYTES, min(MAX_CHUNK_BYTES, chunkBytes))
+
+    chunks = []
+    chunk = []
+    numBytes = 0
+    for (fname, size) in zip(allFiles, sizes):
+        chunk.append(fname)
+        numBytes += size
+        if numBytes >= chunkBytes or len(chunk) >= MAX_FILES_PER_CHUNK:
+            chunks.append(chunk)
+            chunk = []
+            numBytes = 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+class OrderedWriter:
+    """Writes the results of the chunks in order, each one as soon as all
+    the ones before it have been written."""
+
+    def __init__(self, out):
+        self.out = out
+        self.results = {}
+        self.nextChunk = 0
+        self.cond = Condition()
 
-    results = []
-    for t in threads:
-        t.join()
-        if t.result:
-            results += [t.result]
+    def put(self, idx, result):
+        with self.cond:
+            self.results[idx] = result
+            self.cond.notify()
+
+    def writeAll(self, numChunks):
+        while self.nextChunk < numChunks:
+            with self.cond:
+                while self.nextChunk not in self.results:
+                    self.cond.wait()
+                result = self.results.pop(self.nextChunk)
+            self.nextChunk += 1
+            if result:
+                self.out.write(result)
+                self.out.flush()
+
+def grep(args, files):
+    from subprocess import Popen, PIPE
+
+    p = Popen(['grep'] + args + files, stdout=PIPE)
+    return p.communicate()[0]
+
+def worker(args, chunks, writer):
+    while True:
+        (idx, files) = chunks.get()
+        if files is None:
+            return
+        try:
+            result = grep(args, files)
+        except OSError:
+            result = b''
+        writer.put(idx, result)
+
+def find(args, allFiles, out, numWorkers=NUM_WORKERS):
+    """Greps allFiles with args and writes the output to out (a binary
+    stream) in the order of allFiles."""
+
+    allFiles = [f for f in allFiles if f]
+    if not allFiles:
+        return
+
+    chunks = makeChunks(allFiles, numWorkers)
+    queue = Queue()
+    for (idx, files) in enumerate(chunks):
+        queue.put((idx, files))
+
+    numWorkers = min(numWorkers, len(chunks))
+    for i in range(numWorkers):
+        queue.put((None, None))
+
+    writer = OrderedWriter(out)
+    threads = []
+    for i in range(numWorkers):
+        th = Thread(target=worker, args=(args, queue, writer))
+        th.daemon = True
+        th.start()
+        threads += [th]
 
-    return '\n'.join(results)
+    writer.writeAll(len(chunks))
+    for th in threads:
+        th.join()
 
 if __name__ == "__main__":
-    import sys
     allFiles = sys.stdin.read().splitlines()
-    print(find(sys.argv[1:], allFiles))
+    out = getattr(sys.stdout, 'buffer', sys.stdout)
+    find(sys.argv[1:], allFiles, out)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# Like findInSoln.py, but only searches the files which can have matches
+# according to the code index of the sandbox (see codeIndex.py). Files
+# which changed since they were indexed are indexed again first.
+#
+# Without an index, while it is first built, or for grep args
+# searchFiles.py does not understand, this is the same as findInSoln.py. A
+# leading --stream is accepted like there, the results are always written
+# as they are found.
+
+if __name__ == "__main__":
+    # Before the imports, which the server has done already.
+    from toolClient import runOnServer
+    runOnServer()
+
+import sys
+import searchFiles
+from sbtools import getRootDir
+from codeIndex import CodeIndex, getSolutionFiles, hasIndex, literalQuery
+
+if __name__ == "__main__":
+    from ListSearch import popStreamArg
+    popStreamArg()
+    options = searchFiles.getSearchOptions(sys.argv[1:])
+
+    files = None
+    rootDir = getRootDir()
+    # The first build holds the lock of the index until it is done, which
+    # takes a while. Searches do not wait for it.
+    if rootDir and options is not None and hasIndex(rootDir):
+        allFiles = getSolutionFiles()
+        query = literalQuery(options)
+        # Searches only wait for an update of the index, not for each
+        # other, and only update it themselves when something changed.
+        with CodeIndex(rootDir, shared=True) as index:
+            if index.exists() and index.isUpToDate(allFiles):
+                files = index.candidates(query)
+        if files is None:
+            with CodeIndex(rootDir) as index:
+                if index.exists():
+                    index.update(allFiles)
+                    files = index.candidates(query)
+
+    if files is None:
+        from ListSearch import streamFiles, Finder
+        streamFiles(0, Finder)
+        sys.exit(0)
+
+    out = sys.stdout.buffer
+    for result in searchFiles.search(options, files):
+        out.write(result)
+        out.flush()
@@ -1,6 +1,12 @@
 #!/usr/bin/env python3
 
-from ListSearch import listOrSearchFiles, Finder
+from toolClient import runOnServer
+runOnServer()
+
+from ListSearch import listOrSearchFiles, streamFiles, popStreamArg, Finder
 
 if __name__ == "__main__":
-    print("\n".join(listOrSearchFiles(1, Finder)))
+    if popStreamArg():
+        streamFiles(1, Finder)
+    else:
+        print("\n".join(listOrSearchFiles(1, Finder)))
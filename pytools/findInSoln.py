@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 
+from toolClient import runOnServer
+runOnServer()
+
 import sys
-from ListSearch import listOrSearchFiles, Finder
+from ListSearch import listOrSearchFiles, streamFiles, popStreamArg, Finder
 
 if __name__ == "__main__":
-    print("\n".join(listOrSearchFiles(0, Finder)))
+    if popStreamArg():
+        streamFiles(0, Finder)
+    else:
+        print("\n".join(listOrSearchFiles(0, Finder)))
@@ -1,55 +1,432 @@
-#!/usr/bin/env python
-
-from __future__ import print_function
+#!/usr/bin/env python3
 
+import heapq
+import json
 import os
+import re
+import stat
 import sys
+from fnmatch import fnmatch
 from os import path
-from subprocess import Popen, PIPE
-from sbtools import *
-from tempfile import mkstemp
 
-dir = sys.argv[1]
-pat = sys.argv[2]
-args = sys.argv[3:]
+import tagIndex
 
-tagsFile = 'tags'
-(dummy, tmpTagsFile) = mkstemp()
-for i in range(1,len(args)):
-    if args[i-1] == '-f':
-        tagsFile = args[i]
-        args[i] = tmpTagsFile
+ctags = r'/mathworks/hub/share/sbtools/external-apps/exuberant-ctags/exuberant-ctags-5.9/exuberant-ctags/ctags'
+ctags_config = path.join(path.dirname(path.abspath(__file__)), 'ctags.cnf')
 
-print("tags %(dir)s/%(pat)s -f %(tagsFile)s ..." % locals(), end=' ')
+# Bump this whenever the format of the manifest changes.
+MANIFEST_VERSION = 1
 
-os.chdir(dir)
+LINE_DIRECTIVE_PATTERN = re.compile(br'^[ \t]*#[ \t]*(line[ \t]+)?\d', re.M)
 
-pat = " -o ".join(["-name %s " % p for p in pat.split()])
+def listSourceFiles(dirName, pat):
+    """Returns {name: os.stat_result} for all the files under dirName
+    matching any of the patterns in pat. Names are relative to dirName and
+    start with ./ just like the output of find which used to be used."""
 
-ctags = r'/mathworks/hub/share/sbtools/external-apps/exuberant-ctags/exuberant-ctags-5.9/exuberant-ctags/ctags'
-ctags_config = getScriptPath('ctags.cnf')
-
-p1cmd = ['find'] + pat.split()
-p1 = Popen(p1cmd, stdout=PIPE)
-p2cmd = [ctags] + args + ['--options=%s' % ctags_config,
-            '--fields=+iaS', '--extra=+q', '-L', '-']
-p2 = Popen(p2cmd, stdin=p1.stdout,
-           stdout=PIPE)
-p2.communicate()[0]
-
-isDifferent = True
-if os.path.exists(tagsFile):
-    newTags = open(tmpTagsFile).read()
-    oldTags = open(tagsFile).read()
-    if newTags == oldTags:
-        isDifferent = False
-        
-if isDifferent:
-    os.system('mv -f %(tmpTagsFile)s %(tagsFile)s' % locals())
-    os.system('chmod -w %(tagsFile)s' % locals())
-else:
-    print('Tags file didnt change...')
-    os.system('rm -f %(tmpTagsFile)s' % locals())
-
-os.system('chmod go+r %(tagsFile)s' % locals())
-print("done")
+    patterns = pat.split()
+    files = {}
+    for (dirpath, dirnames, filenames) in os.walk(dirName):
+        relDir = path.relpath(dirpath, dirName)
+        relDir = '.' if relDir == '.' else './' + relDir
+        for fname in filenames:
+            for p in patterns:
+                if fnmatch(fname, p):
+                    try:
+                        files['%s/%s' % (relDir, fname)] = os.stat(path.join(dirpath, fname))
+                    except OSError:
+                        pass
+                    break
+    return files
+
+# Directories with more files than this are tagged by several ctags
+# processes in parallel whose outputs are merged.
+SHARD_MIN_FILES = 2000
+
+def runCtagsOnce(dirName, files, args, outFile, listFile):
+    """Starts ctags on files. The file list goes through listFile rather
+    than a pipe so that several ctags processes can be started at once."""
+
+    with open(listFile, 'w') as f:
+        f.write('\n'.join(files) + '\n')
+
+    from subprocess import Popen
+
+    cmd = [ctags] + args + ['--options=%s' % ctags_config,
+                            '--fields=+iaS', '--extra=+q', '-f', outFile, '-L', listFile]
+    return Popen(cmd, cwd=dirName)
+
+def makeShards(files, sizes, numShards):
+    """Splits files into numShards lists of about the same total size,
+    biggest files first so that no shard ends up with all of them."""
+
+    shards = [[] for i in range(numShards)]
+    heap = [(0, i) for i in range(numShards)]
+    for fname in sorted(files, key=lambda f: -sizes.get(f, 0)):
+        (total, i) = heapq.heappop(heap)
+        shards[i].append(fname)
+        heapq.heappush(heap, (total + sizes.get(fname, 0), i))
+    return [sorted(shard) for shard in shards if shard]
+
+def readHeaders(tagsFile):
+    headers = []
+    with open(tagsFile, 'rb') as f:
+        for line in f:
+            if not isHeader(line):
+                break
+            headers.append(line)
+    return headers
+
+def mergeSortedTagsFiles(tagsFiles, outFile):
+    """k-way merges sorted tags files into outFile. The header lines are
+    the same in all of them, so they are only taken from the first."""
+
+    inputs = [open(f, 'rb') for f in tagsFiles]
+    try:
+        with open(outFile, 'wb') as out:
+            out.writelines(readHeaders(tagsFiles[0]))
+            tags = [(line for line in f if not isHeader(line)) for f in inputs]
+            out.writelines(heapq.merge(*tags))
+    finally:
+        for f in inputs:
+            f.close()
+
+def runCtags(dirName, files, args, outFile, sizes=None, numShards=None, maxShards=None):
+    """Runs ctags on files (relative to dirName) writing the tags to outFile.
+
+    Large file lists are split into shards of about the same total size
+    (from sizes, {fname: bytes}) which are tagged in parallel and then
+    merged. Sharding needs ctags to sort its output, so it is not done when
+    args change the sort order. Unless numShards is given, there is a
+    shard per SHARD_MIN_FILES files, up to maxShards or the number of
+    CPUs."""
+
+    from tempfile import mkstemp
+
+    if numShards is None:
+        numShards = min(maxShards or os.cpu_count() or 1, len(files) // SHARD_MIN_FILES)
+    if any(a.startswith('--sort') or a == '-u' for a in args):
+        numShards = 1
+
+    if numShards <= 1:
+        shards = [files]
+    else:
+        shards = makeShards(files, sizes or {}, numShards)
+
+    tmpFiles = []
+    try:
+        procs = []
+        shardFiles = []
+        for shard in shards:
+            (fd, listFile) = mkstemp()
+            os.close(fd)
+            tmpFiles.append(listFile)
+
+            if len(shards) == 1:
+                shardFile = outFile
+            else:
+                (fd, shardFile) = mkstemp()
+                os.close(fd)
+                tmpFiles.append(shardFile)
+                shardFiles.append(shardFile)
+
+            procs.append(runCtagsOnce(dirName, shard, args, shardFile, listFile))
+
+        for p in procs:
+            p.wait()
+
+        if shardFiles:
+            mergeSortedTagsFiles(shardFiles, outFile)
+    finally:
+        for f in tmpFiles:
+            os.remove(f)
+
+def hashFile(fname):
+    """Returns the sha1 of the file and whether it contains #line
+    directives."""
+
+    import hashlib
+
+    with open(fname, 'rb') as f:
+        data = f.read()
+    return (hashlib.sha1(data).hexdigest(),
+            LINE_DIRECTIVE_PATTERN.search(data) is not None)
+
+def getManifestFile(tagsFile):
+    return tagsFile + '.manifest'
+
+def readManifest(tagsFile, options):
+    try:
+        with open(getManifestFile(tagsFile)) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('options') != options:
+        return None
+    return manifest['files']
+
+def writeManifest(tagsFile, options, entries):
+    from tempfile import mkstemp
+
+    manifestFile = getManifestFile(tagsFile)
+    (fd, tmpFile) = mkstemp(dir=path.dirname(path.abspath(manifestFile)))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION,
+                       'options': options,
+                       'files': entries}, f)
+        os.replace(tmpFile, manifestFile)
+    except Exception:
+        os.remove(tmpFile)
+        raise
+
+def diffManifest(dirName, files, oldEntries, checkLineDirectives):
+    """Compares the current files with the ones in the manifest. Returns
+    the new manifest entries, the names of the added or changed files and
+    the names of the removed files.
+
+    A manifest entry is [mtime, size, sha1, hasLineDirectives]. Files are
+    only hashed when their mtime or size changed, so touching a file does
+    not get it re-tagged."""
+
+    entries = {}
+    changed = []
+    for (fname, st) in files.items():
+        old = oldEntries.get(fname)
+        if old and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+            entries[fname] = old
+            continue
+
+        (sha1, hasLineDirectives) = hashFile(path.join(dirName, fname))
+        if not checkLineDirectives:
+            hasLineDirectives = False
+        entries[fname] = [st.st_mtime_ns, st.st_size, sha1, hasLineDirectives]
+        if not old or old[2] != sha1:
+            changed.append(fname)
+
+    removed = [fname for fname in oldEntries if fname not in files]
+    return (entries, changed, removed)
+
+def isHeader(line):
+    return line.startswith(b'!_TAG_')
+
+def tagFileName(line):
+    return line.split(b'\t', 2)[1]
+
+def tagKind(line):
+    """Returns the kind of a tag in the extended format, i.e. the first
+    extension field after the ;" which ends the ex command."""
+
+    start = line.find(b';"\t', line.find(b'\t', line.find(b'\t') + 1))
+    if start < 0:
+        return b''
+    kind = line[start+3:].split(b'\t', 1)[0].rstrip(b'\n')
+    if kind.startswith(b'kind:'):
+        kind = kind[5:]
+    return kind
+
+def mergeTags(oldTagsFile, newTagsFile, droppedFiles, outFile):
+    """Writes the tags of oldTagsFile, except for the ones in droppedFiles,
+    merged with all the tags in newTagsFile to outFile. Both inputs are
+    sorted, so this is a single streaming merge."""
+
+    droppedFiles = set(f.encode('utf-8') for f in droppedFiles)
+
+    with open(oldTagsFile, 'rb') as oldTags, \
+            open(newTagsFile, 'rb') as newTags, \
+            open(outFile, 'wb') as out:
+        oldLines = (line for line in oldTags
+                    if isHeader(line) or tagFileName(line) not in droppedFiles)
+        newLines = (line for line in newTags if not isHeader(line))
+        out.writelines(heapq.merge(oldLines, newLines))
+
+def makeTempFile(nearFile):
+    """Returns the name of a new empty file in the directory of nearFile so
+    that it can later be renamed over nearFile atomically."""
+
+    from tempfile import mkstemp
+
+    dirName = path.dirname(path.abspath(nearFile))
+    (fd, tmpFile) = mkstemp(dir=dirName, prefix='.%s.' % path.basename(nearFile), suffix='.tmp')
+    os.close(fd)
+    return tmpFile
+
+def removeFile(fname):
+    try:
+        os.remove(fname)
+    except OSError:
+        pass
+
+def sameContents(file1, file2, chunkSize=1 << 20):
+    """Compares two files a chunk at a time, so that big tags files do not
+    have to be read into memory."""
+
+    if os.stat(file1).st_size != os.stat(file2).st_size:
+        return False
+    with open(file1, 'rb') as f1, open(file2, 'rb') as f2:
+        while True:
+            chunk = f1.read(chunkSize)
+            if chunk != f2.read(chunkSize):
+                return False
+            if not chunk:
+                return True
+
+def replaceTagsFile(tmpTagsFile, tagsFile):
+    """Moves tmpTagsFile over tagsFile if they differ. Returns whether the
+    tags file changed. tmpTagsFile is gone afterwards in either case.
+
+    tmpTagsFile should be in the same directory as tagsFile (see
+    makeTempFile), so that Vim never sees a partially written tags file."""
+
+    try:
+        if path.exists(tagsFile) and sameContents(tmpTagsFile, tagsFile):
+            mode = os.stat(tagsFile).st_mode
+            os.chmod(tagsFile, stat.S_IMODE(mode) | stat.S_IRGRP | stat.S_IROTH)
+            return False
+
+        os.chmod(tmpTagsFile, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(tmpTagsFile, tagsFile)
+        return True
+    finally:
+        removeFile(tmpTagsFile)
+
+def installTagsFiles(tmpTagsFile, tagsFile, subsets):
+    """Replaces tagsFile with tmpTagsFile and every subset tags file with
+    the lines of tmpTagsFile whose kind is not excluded for it. The subsets
+    are all written in the same pass over tmpTagsFile. The indexes of the
+    tags files (see tagIndex) are brought up to date as well. Returns
+    whether any of the tags files changed."""
+
+    subsetFiles = []
+    try:
+        for (subsetTagsFile, excludedKinds) in subsets:
+            tmpSubsetFile = makeTempFile(subsetTagsFile)
+            excluded = set(k.encode('utf-8') for k in excludedKinds)
+            subsetFiles.append((open(tmpSubsetFile, 'wb'), tmpSubsetFile, subsetTagsFile, excluded))
+
+        try:
+            if subsetFiles:
+                with open(tmpTagsFile, 'rb') as tags:
+                    for line in tags:
+                        kind = b'' if isHeader(line) else tagKind(line)
+                        for (out, _, _, excluded) in subsetFiles:
+                            if kind not in excluded:
+                                out.write(line)
+        finally:
+            for (out, _, _, _) in subsetFiles:
+                out.close()
+
+        isDifferent = replaceTagsFile(tmpTagsFile, tagsFile)
+        for (_, tmpSubsetFile, subsetTagsFile, _) in subsetFiles:
+            isDifferent = replaceTagsFile(tmpSubsetFile, subsetTagsFile) or isDifferent
+
+        for f in [tagsFile] + [s[0] for s in subsets]:
+            tagIndex.updateIndex(f)
+        return isDifferent
+    finally:
+        for (_, tmpSubsetFile, _, _) in subsetFiles:
+            removeFile(tmpSubsetFile)
+
+def genDirTags(dirName, pat, args, tagsFile, incremental=False, subsets=(), maxShards=None):
+    """Generates tagsFile (relative to dirName) for all the files in dirName
+    matching pat. args are passed on to ctags.
+
+    subsets is a list of (tagsFile, excludedKinds). Each of those tags files
+    gets the tags of tagsFile except for the ones of the excluded kinds,
+    without running ctags again. For example, with --c++-kinds=+p in args
+    and [('foo.inc.tags', 'p')] one ctags pass writes both the tags with
+    and without prototypes.
+
+    In incremental mode a manifest of the tagged files is kept next to the
+    tags file and only files which were added or changed since the last
+    run are passed to ctags. Their tags are merged into the existing tags
+    file.
+
+    maxShards bounds the ctags processes running at once, see runCtags.
+
+    Returns a short description of what happened for progress messages."""
+
+    tagsFile = path.join(dirName, tagsFile)
+    subsets = [(path.join(dirName, f), kinds) for (f, kinds) in subsets]
+    options = [pat] + args + ['%s:%s' % s for s in subsets]
+    checkLineDirectives = '--line-directives' in args
+
+    files = listSourceFiles(dirName, pat)
+
+    oldEntries = None
+    allExist = all(path.exists(f) for f in [tagsFile] + [s[0] for s in subsets])
+    if incremental and allExist:
+        oldEntries = readManifest(tagsFile, options)
+
+    # With --line-directives the tags of a file can be attributed to some
+    # other file, so they cannot be replaced file by file.
+    if oldEntries is not None and checkLineDirectives:
+        if any(e[3] for e in oldEntries.values()):
+            oldEntries = None
+
+    if oldEntries is not None:
+        (entries, changed, removed) = diffManifest(dirName, files, oldEntries, checkLineDirectives)
+        if not changed and not removed:
+            # The manifest only changes if files were touched, otherwise
+            # nothing is written at all.
+            if entries != oldEntries:
+                writeManifest(tagsFile, options, entries)
+            return 'Tags file didnt change...'
+
+    tmpTagsFile = makeTempFile(tagsFile)
+    try:
+        if oldEntries is None:
+            sizes = dict((f, st.st_size) for (f, st) in files.items())
+            runCtags(dirName, sorted(files), args, tmpTagsFile, sizes, maxShards=maxShards)
+            isDifferent = installTagsFiles(tmpTagsFile, tagsFile, subsets)
+            if incremental:
+                entries = {}
+                for (fname, st) in files.items():
+                    hasLineDirectives = False
+                    if checkLineDirectives:
+                        hasLineDirectives = hashFile(path.join(dirName, fname))[1]
+                    entries[fname] = [st.st_mtime_ns, st.st_size, None, hasLineDirectives]
+                writeManifest(tagsFile, options, entries)
+            return '' if isDifferent else 'Tags file didnt change...'
+
+        newTagsFile = makeTempFile(tagsFile)
+        try:
+            if changed:
+                sizes = dict((f, files[f].st_size) for f in changed)
+                runCtags(dirName, sorted(changed), args, newTagsFile, sizes, maxShards=maxShards)
+            mergeTags(tagsFile, newTagsFile, changed + removed, tmpTagsFile)
+        finally:
+            removeFile(newTagsFile)
+        installTagsFiles(tmpTagsFile, tagsFile, subsets)
+
+        writeManifest(tagsFile, options, entries)
+        return '(%d changed, %d removed)' % (len(changed), len(removed))
+    finally:
+        # Only left behind if something failed before it was installed.
+        removeFile(tmpTagsFile)
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    incremental = False
+    if argv and argv[0] == '--incremental':
+        incremental = True
+        argv = argv[1:]
+
+    dir = argv[0]
+    pat = argv[1]
+    args = argv[2:]
+
+    tagsFile = 'tags'
+    if '-f' in args:
+        i = args.index('-f')
+        tagsFile = args[i+1]
+        args = args[:i] + args[i+2:]
+
+    print("tags %(dir)s/%(pat)s -f %(tagsFile)s ..." % locals(), end=' ')
+
+    msg = genDirTags(dir, pat, args, tagsFile, incremental)
+    if msg:
+        print(msg, end=' ')
+
+    print("done")
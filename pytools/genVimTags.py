@@ -1,30 +1,120 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
-from __future__ import print_function
+if __name__ == "__main__":
+    # Before the imports, which the server has done already.
+    from toolClient import runOnServer
+    runOnServer()
 
 from getProjSettings import getProjSettings
 from sbtools import getRootDir, getRelPathTo
-from threading import Thread
-import subprocess
+from genDirTags import genDirTags
+from threading import Thread, Lock
+from queue import PriorityQueue, Empty
 import os
 from os import path
 import sys
 
-class TagCreator(Thread):
-    def __init__(self, path, pattern, extraArgs):
-        Thread.__init__(self)
-
-        self.path = path
-        self.pattern = pattern
-        self.extraArgs = extraArgs
-        self.result = ''
+# Tags for the project of the current file are generated first, then the
+# exported headers of the projects it depends on and then everything else.
+PRIORITY_CURRENT = 0
+PRIORITY_DEPENDS = 1
+PRIORITY_REST = 2
+
+INC_TAGS_ARGS = []
+ALL_TAGS_ARGS = ['--c++-kinds=+p', '--line-directives']
+EXP_TAGS_ARGS = ['--c++-kinds=+p', '--line-directives', '--excmd=number']
+
+class TagScheduler:
+    """Runs genDirTags jobs in this process on a bounded number of worker
+    threads, highest priority first. Each job only spawns ctags, and the
+    workers share numWorkers ctags processes between them: a job only
+    shards its files over several ctags processes when there are fewer
+    jobs than workers. So at most numWorkers ctags processes run at any
+    time."""
+
+    def __init__(self, numWorkers=None, incremental=False, singlePass=False):
+        self.numWorkers = numWorkers or os.cpu_count() or 1
+        self.incremental = incremental
+        self.singlePass = singlePass
+        self.queue = PriorityQueue()
+        self.seen = set()
+        self.numJobs = 0
+        self.numDone = 0
+        self.lock = Lock()
+        self.maxShards = 1
+
+    def add(self, priority, dirName, pattern, args, tagsFile, subsets=()):
+        # The same export can be reached from several projects.
+        key = (dirName, tagsFile)
+        if key in self.seen or not path.isdir(dirName):
+            return
+        self.seen.add(key)
+
+        self.queue.put((priority, self.numJobs, (dirName, pattern, args, tagsFile, subsets)))
+        self.numJobs += 1
+
+    def addProject(self, priority, proj):
+        for inc in proj.includes:
+            if self.singlePass:
+                # The .all.tags file has every tag of the .inc.tags file
+                # plus the prototypes, so one ctags pass can write both.
+                self.add(priority, inc['path'], inc['pattern'], ALL_TAGS_ARGS, inc['allTagsFile'],
+                         [(inc['tagsFile'], 'p')])
+            else:
+                self.add(priority, inc['path'], inc['pattern'], INC_TAGS_ARGS, inc['tagsFile'])
+                self.add(priority, inc['path'], inc['pattern'], ALL_TAGS_ARGS, inc['allTagsFile'])
+        self.addExports(priority, proj)
+
+    def addExports(self, priority, proj):
+        for exp in proj.exports:
+            self.add(priority, exp['path'], exp['pattern'], EXP_TAGS_ARGS, exp['tagsFile'])
+
+    def report(self, dirName, pattern, tagsFile, msg):
+        with self.lock:
+            self.numDone += 1
+            print("[%d/%d] tags %s/%s -f %s ... %sdone" %
+                  (self.numDone, self.numJobs, dirName, pattern, tagsFile,
+                   msg + ' ' if msg else ''))
+            sys.stdout.flush()
+
+    def worker(self):
+        while True:
+            try:
+                (_, _, job) = self.queue.get_nowait()
+            except Empty:
+                return
+
+            (dirName, pattern, args, tagsFile, subsets) = job
+            try:
+                msg = genDirTags(dirName, pattern, args, tagsFile, self.incremental, subsets,
+                                 self.maxShards)
+            except Exception as e:
+                msg = 'failed: %s' % e
+            self.report(dirName, pattern, tagsFile, msg)
 
     def run(self):
-        (curdir, tail) = path.split(path.abspath(sys.argv[0]))
-        genDirTags = path.join(curdir, 'genDirTags.py')
-        subprocess.call(['python', genDirTags, self.path, self.pattern] + self.extraArgs.split())
+        numThreads = min(self.numWorkers, self.numJobs)
+        if numThreads > 0:
+            self.maxShards = max(1, self.numWorkers // numThreads)
+
+        threads = []
+        for i in range(numThreads):
+            th = Thread(target=self.worker)
+            th.start()
+            threads += [th]
+
+        for th in threads:
+            th.join()
+
+def genVimTags(fname, incremental=False, allProjects=False, singlePass=False):
+    """Generates the tags for the project containing fname (and the exports
+    of the projects it depends on). With allProjects, or without a file,
+    tags are generated for the whole solution, starting with those.
+
+    With singlePass, the .inc.tags and .all.tags files of an include are
+    written from a single ctags run. The .inc.tags file then also honors
+    #line directives, like the .all.tags file always has."""
 
-def genVimTags(fname):
     rootDir = getRootDir()
 
     if fname != '' and (rootDir not in fname):
@@ -42,35 +132,32 @@ def genVimTags(fname):
 
     os.chdir(rootDir)
 
-    threads = []
-    for proj in soln.projects:
-        # If a filename is specified, then only generate tags for the
-        # project it belongs to.
-
-        if (not fname) or proj.includesFile(fname):
-            for inc in proj.includes:
-                if path.isdir(inc['path']):
-                    th = TagCreator(inc['path'], inc['pattern'], ' -f %s' % inc['tagsFile'])
-                    th.start()
-                    threads += [th]
+    scheduler = TagScheduler(incremental=incremental, singlePass=singlePass)
 
-                    th = TagCreator(inc['path'], inc['pattern'], ' --c++-kinds=+p --line-directives -f %s' % inc['allTagsFile'])
-                    th.start()
-                    threads += [th]
+    if fname:
+        for proj in soln.projectsForFile(fname):
+            scheduler.addProject(PRIORITY_CURRENT, proj)
+            for dep in soln.getDependencyGraph().directDependencies(proj.name):
+                scheduler.addExports(PRIORITY_DEPENDS, soln.getProjByName(dep))
 
-            for exp in proj.exports:
-                if path.isdir(exp['path']):
-                    th = TagCreator(exp['path'], exp['pattern'], '--c++-kinds=+p --line-directives --excmd=number -f %s' % exp['tagsFile'])
-                    th.start()
-                    threads += [th]
+    if allProjects or not fname:
+        for proj in soln.projects:
+            scheduler.addProject(PRIORITY_REST, proj)
 
-    for th in threads:
-        th.join()
+    scheduler.run()
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        fname = path.abspath(sys.argv[1])
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [options] [file]")
+    parser.add_option("-i", "--incremental", dest="incremental", help="only re-tag files which changed since the last run", action="store_true", default=False)
+    parser.add_option("-a", "--all", dest="allProjects", help="tag the whole solution, starting with the project of file", action="store_true", default=False)
+    parser.add_option("-s", "--single-pass", dest="singlePass", help="write the .inc.tags and .all.tags files of an include with one ctags run", action="store_true", default=False)
+    (options, args) = parser.parse_args()
+
+    if args:
+        fname = path.abspath(args[0])
     else:
         fname = ''
 
-    genVimTags(fname)
+    genVimTags(fname, options.incremental, options.allProjects, options.singlePass)
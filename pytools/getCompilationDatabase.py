@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
+if __name__ == "__main__":
+    # Before the imports, which the server has done already.
+    from toolClient import runOnServer
+    runOnServer()
+
 import sys
 from os import path
 import os
-import xml.etree.cElementTree as ET
-import subprocess
 import sbtools
 from pathUtils import searchUpFor
 import json
@@ -19,6 +22,27 @@ def getModuleRoot():
 def normalizePath(dirName, relPath):
     return os.path.abspath(os.path.join(dirName, relPath))
 
+def readModuleData(moduleDataFile):
+    """Returns the (CPPFLAGS, CXXFLAGS, moduleIncludePath) entries of a
+    module_data.xml file. The file is read in one streaming pass and every
+    section is dropped as soon as it has been read."""
+
+    import xml.etree.ElementTree as ET
+
+    sections = {'CPPFLAGS': [], 'CXXFLAGS': [], 'moduleIncludePath': []}
+
+    for (event, elem) in ET.iterparse(moduleDataFile):
+        values = sections.get(elem.tag)
+        if values is not None:
+            values.extend([child.text for child in elem if child.tag in ('flag', 'dir')])
+            elem.clear()
+        elif elem.tag not in ('flag', 'dir'):
+            elem.clear()
+
+    return (sections['CPPFLAGS'],
+            sections['CXXFLAGS'],
+            sections['moduleIncludePath'])
+
 def getFlags(filename):
     absfilename = path.abspath(filename)
     os.chdir(path.dirname(absfilename))
@@ -34,12 +58,12 @@ def getFlags(filename):
 
     moduleDataFile = path.join(mlroot, 'derived', 'glnxa64', 'modules', relModulePath, 'module_data.xml')
 
-    root = ET.fromstring(open(moduleDataFile).read())
+    (cppFlags, cxxFlags, includeDirs) = readModuleData(moduleDataFile)
 
     flags = []
-    flags.extend([f.text for f in root.findall('./CPPFLAGS/flag')])
-    flags.extend([f.text for f in root.findall('./CXXFLAGS/flag')])
-    flags.extend([('-I%s' % normalizePath(moduleRoot, inc.text)) for inc in root.findall('./moduleIncludePath/dir')])
+    flags.extend(cppFlags)
+    flags.extend(cxxFlags)
+    flags.extend([('-I%s' % normalizePath(moduleRoot, inc)) for inc in includeDirs])
     flags.extend(['-Wno-unused-parameter'])
 
     return (flags, moduleRoot)
@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 
-import xml.dom.minidom
 import os
-import re
 from os import path
 from pathUtils import searchUpFor
+import solutionCache
+
+# Most of the time the Solution comes from the cache, which needs none of
+# the modules to read .vimproj.xml and find the modules. Those are only
+# imported when they are used.
 
 DEBUG = 0
 
@@ -16,21 +19,75 @@ class Solution:
     def __init__(self):
         self.projects = []
         self.rootDir = ''
+        # Directories whose contents decide which projects are part of
+        # this solution.
+        self.watchedDirs = []
+        # Maps a normalized include directory to the indices of the
+        # projects including it. Built on demand by projectsForFile.
+        self.includeIndex = None
+        self.projByName = None
+        self.dependencyGraph = None
 
     def __str__(self):
         return '\n'.join(['%s' % p for p in self.projects])
 
     def getProjByName(self, name):
-        for proj in self.projects:
-            if name == proj.name:
-                return proj
+        if self.projByName is None:
+            self.projByName = {}
+            for proj in self.projects:
+                self.projByName.setdefault(proj.name, proj)
 
-        return None
+        return self.projByName.get(name)
+
+    def getDependencyGraph(self):
+        if self.dependencyGraph is None:
+            from moduleGraph import DependencyGraph
+            self.dependencyGraph = DependencyGraph(self.projects)
+        return self.dependencyGraph
 
     def setRootDir(self, rootDir):
         self.rootDir = rootDir
         for p in self.projects:
             p.rootDir = rootDir
+        self.includeIndex = None
+
+    def buildIncludeIndex(self):
+        index = {}
+        for (i, proj) in enumerate(self.projects):
+            for inc in proj.includes:
+                incPath = proj.getIncludePath(inc)
+                index.setdefault(incPath, []).append(i)
+        return index
+
+    def projectsForFile(self, fname):
+        """Returns the projects with an include directory containing fname,
+        in the order in which they appear in the solution."""
+
+        if self.includeIndex is None:
+            self.includeIndex = self.buildIncludeIndex()
+
+        found = set()
+        dirName = normalizePath(fname)
+        while True:
+            found.update(self.includeIndex.get(dirName, ()))
+            (dirName, tail) = path.split(dirName)
+            if not tail:
+                break
+
+        return [self.projects[i] for i in sorted(found)]
+
+    def getState(self):
+        return {'rootDir': self.rootDir,
+                'watchedDirs': self.watchedDirs,
+                'projects': [p.getState() for p in self.projects]}
+
+    @staticmethod
+    def fromState(state):
+        soln = Solution()
+        soln.rootDir = state['rootDir']
+        soln.watchedDirs = state['watchedDirs']
+        soln.projects = [Project.fromState(s) for s in state['projects']]
+        return soln
 
 class Project:
     def __init__(self, name, dllname, depends):
@@ -42,23 +99,36 @@ class Project:
         self.path = ''
         self.rootDir = ''
 
+    def getIncludePath(self, inc):
+        return normalizePath(path.join(self.rootDir, inc['path']))
+
     def includesFile(self, fname):
+        fname = normalizePath(fname)
         for inc in self.includes:
-            incPath = path.abspath(path.join(self.rootDir, inc['path']))
-            if incPath.lower() in path.abspath(fname).lower():
+            if isUnder(fname, self.getIncludePath(inc)):
                 return True
 
         return False
 
-    def addInclude(self, path, pattern):
+    def addInclude(self, path, pattern, exclude=''):
         self.includes.append({'path': path, 
                               'pattern': pattern, 
+                              'exclude': exclude,
                               'tagsFile': '%s.inc.tags' % self.name,
                               'allTagsFile': '%s.all.tags' % self.name})
 
     def addExport(self, path, pattern):
         self.exports.append({'path': path, 'pattern': pattern, 'tagsFile': '%s.exp.tags' % self.name})
 
+    def getState(self):
+        return dict(self.__dict__)
+
+    @staticmethod
+    def fromState(state):
+        proj = Project(state['name'], state['dllname'], state['depends'])
+        proj.__dict__.update(state)
+        return proj
+
     def __str__(self):
         return ("name:%s (path:%s):"
                 "\n   dllname: %s"
@@ -66,29 +136,32 @@ class Project:
                 "\n   exports: %s"
                 "\n   depends: %s") % (self.name, self.path, self.dllname, self.includes, self.exports, ' '.join(self.depends))
 
-def getText(doms):
-    txt = ''
-    for d in doms:
-        for c in d.childNodes:
-            if c.nodeType == c.TEXT_NODE:
-                txt += c.data
-    return txt
-
-def handleProj(dom):
-    name = dom.getAttribute('name')
-    depends = getText(dom.getElementsByTagName('depends')).strip().split()
+def normalizePath(fname):
+    return path.normcase(path.abspath(fname)).lower()
+
+def isUnder(fname, dirName):
+    return (fname == dirName or
+            fname.startswith(dirName if dirName.endswith(os.sep) else dirName + os.sep))
+
+def handleProj(elem):
+    name = elem.get('name', '')
+    depends = ' '.join([d.text or '' for d in elem.iter('depends')]).split()
     moduleDLLName = ""
     proj = Project(name, moduleDLLName, depends)
 
-    for inc_dom in dom.getElementsByTagName('include'):
-        proj.addInclude(inc_dom.getAttribute('path'), inc_dom.getAttribute('pattern'))
+    # Files and directories to leave out of all the includes, on top of
+    # ListSearch.DEFAULT_EXCLUDES.
+    exclude = elem.get('exclude', '')
+    for inc in elem.iter('include'):
+        proj.addInclude(inc.get('path', ''), inc.get('pattern', ''),
+                        (exclude + ' ' + inc.get('exclude', '')).strip())
 
-    for exp_dom in dom.getElementsByTagName('export'):
-        proj.addExport(exp_dom.getAttribute('path'), exp_dom.getAttribute('pattern'))
+    for exp in elem.iter('export'):
+        proj.addExport(exp.get('path', ''), exp.get('pattern', ''))
 
     return proj
 
-def handleModuleImpl(rootDir, modPath, extraIncludes):
+def handleModuleImpl(rootDir, modPath, extraIncludes, exclude=''):
     depends = []
 
     name = path.basename(modPath)
@@ -96,6 +169,7 @@ def handleModuleImpl(rootDir, modPath, extraIncludes):
     moduleDLLName = ""
     makeFile = path.join(rootDir, modPath, 'Makefile')
     if path.isfile(makeFile):
+        import re
         modnameAssignText = re.search(r"MODNAME([\s:]*)=(.*)\n",open(makeFile).read())
         if modnameAssignText != None:
              moduleDLLName = modnameAssignText.group(2).strip()
@@ -109,26 +183,24 @@ def handleModuleImpl(rootDir, modPath, extraIncludes):
     if extraIncludes:
         incPattern += (' %s' % extraIncludes)
 
-    proj.addInclude(modPath, incPattern)
+    proj.addInclude(modPath, incPattern, exclude)
     proj.addExport(path.join(modPath, 'export'), '*.hpp *.h')
 
     derivedSrc = modPath.replace('matlab/', 'matlab/derived/glnxa64/')
     derivedInc = 'matlab/derived/glnxa64/src/include/' + name
 
-    proj.addInclude(derivedSrc, '*.[ch]pp *.c')
+    proj.addInclude(derivedSrc, '*.[ch]pp *.c', exclude)
     proj.addExport(derivedInc, '*.hpp *.h')
     return proj
 
 
-def handleModule(dom, rootDir):
-    return handleModuleImpl(rootDir, dom.getAttribute("path"),
-            dom.getAttribute("extraIncludes"))
-
 def addModuleDependencies(modules, rootDir):
     moduleNames = set()
     [moduleNames.add(mod.name) for mod in modules]
-    dllNames = []
-    [dllNames.append(mod.dllname) for mod in modules]
+    dllNameMap = {}
+    for mod in modules:
+        if mod.dllname:
+            dllNameMap.setdefault(mod.dllname, mod.name)
     for mod in modules:
         if not mod.path:
             continue
@@ -144,8 +216,8 @@ def addModuleDependencies(modules, rootDir):
             if depName.startswith('='):
                 depName = depName[1:]
 
-            if depName and depName in dllNames:
-                depName = modules[dllNames.index(depName)].name
+            if depName in dllNameMap:
+                depName = dllNameMap[depName]
 
             if depName in moduleNames:
                 mod.depends.append(depName)
@@ -155,33 +227,94 @@ def addModuleDependencies(modules, rootDir):
                     mod.depends.append(depName)
 
 def handleModuleDir(soln, rootDir, moduleDir):
-    moduleDirPath = path.join(rootDir, moduleDir.getAttribute("path"))
-    extraIncludes = moduleDir.getAttribute("extraIncludes")
+    from moduleFinder import ModuleFinder, DEFAULT_SKIP_DIRS
 
-    for (dirname, _, files) in os.walk(moduleDirPath, topdown=True):
-        if 'MODULE_DEPENDENCIES' in files:
-            soln.projects.append(handleModuleImpl(rootDir,
-                                                  path.relpath(dirname,
-                                                               rootDir), extraIncludes))
+    moduleDirPath = path.join(rootDir, moduleDir.get("path", ""))
+    extraIncludes = moduleDir.get("extraIncludes", "")
+    exclude = moduleDir.get("exclude", "")
 
-def handleSolution(dom, rootDir):
-    soln = Solution()
+    # Directories matching any of the patterns in "skip" are not searched
+    # for modules in addition to the default ones. Modules nested inside
+    # other modules are only found with nested="1".
+    skip = DEFAULT_SKIP_DIRS + moduleDir.get("skip", "").split()
+    nested = moduleDir.get("nested") in ('1', 'true')
+
+    finder = ModuleFinder(skip=skip, nested=nested)
+    for dirname in finder.find(moduleDirPath):
+        soln.projects.append(handleModuleImpl(rootDir,
+                                              path.relpath(dirname,
+                                                           rootDir), extraIncludes, exclude))
 
-    project_doms = dom.getElementsByTagName('project')
-    for proj_dom in project_doms:
-        soln.projects.append(handleProj(proj_dom))
+    soln.watchedDirs.append(moduleDirPath)
+    soln.watchedDirs += finder.visitedDirs
 
-    modules = dom.getElementsByTagName('module')
-    for module in modules:
-        soln.projects.append(handleModule(module, rootDir))
+def loadSolution(fname, rootDir):
+    """Reads a .vimproj.xml file in a single streaming pass.
+
+    Every <project> and <module> element is turned into a Project as soon
+    as it has been read and then dropped from the tree, so memory use does
+    not grow with the size of the file. Projects come first, then modules
+    and then the modules found under each <modules_under>, just like they
+    always have."""
+
+    import xml.etree.ElementTree as ET
+
+    soln = Solution()
+    modules = []
+    moduleDirs = []
+
+    for (event, elem) in ET.iterparse(fname):
+        if elem.tag == 'project':
+            soln.projects.append(handleProj(elem))
+            elem.clear()
+        elif elem.tag == 'module':
+            modules.append(handleModuleImpl(rootDir, elem.get('path', ''),
+                                            elem.get('extraIncludes', ''),
+                                            elem.get('exclude', '')))
+            elem.clear()
+        elif elem.tag == 'modules_under':
+            moduleDirs.append(dict(elem.attrib))
+            elem.clear()
+
+    soln.projects += modules
 
-    moduleDirs = dom.getElementsByTagName("modules_under")
     for moduleDir in moduleDirs:
         handleModuleDir(soln, rootDir, moduleDir)
 
     return soln
 
-def getProjSettings():
+def getStamps(soln, specFiles):
+    stamps = solutionCache.StampSet()
+    stamps.addAll(specFiles)
+    stamps.addAll(soln.watchedDirs)
+    for proj in soln.projects:
+        if proj.path:
+            stamps.add(path.join(proj.path, 'Makefile'))
+            stamps.add(path.join(proj.path, 'MODULE_DEPENDENCIES'))
+    return stamps
+
+def parseProjSettings(projSpecFile, userHomePath, rootDir, mw_anchor):
+    spec = loadSolution(projSpecFile, rootDir)
+    if path.exists(userHomePath):
+        specUser = loadSolution(userHomePath, rootDir)
+        specNames = []
+
+        for proj in spec.projects:
+            specNames.append(proj.path)
+
+        for proj in specUser.projects:
+            if proj.path not in specNames:
+                # print("DEBUG: adding %s with path [%s] to project" % (proj.name, proj.path))
+                spec.projects.append(proj)
+
+        spec.watchedDirs += specUser.watchedDirs
+
+    if mw_anchor:
+        addModuleDependencies(spec.projects, path.dirname(mw_anchor))
+
+    return spec
+
+def getProjSettings(useCache=True):
     projSpecFile = searchUpFor('.vimproj.xml')
     mw_anchor = searchUpFor('mw_anchor')
     if mw_anchor:
@@ -195,29 +328,28 @@ def getProjSettings():
         if path.exists(homePath):
             projSpecFile = homePath
 
-    if projSpecFile:
-        dom = xml.dom.minidom.parseString(open(projSpecFile).read())
-        spec = handleSolution(dom, rootDir)
-        userHomePath = path.join(os.environ['HOME'], '.vimproj.xml')
-        if path.exists(userHomePath):
-            dom = xml.dom.minidom.parseString(open(userHomePath).read())
-            specUser = handleSolution(dom, rootDir)
-            specNames = []
+    if not projSpecFile:
+        return None
 
-            for proj in spec.projects:
-                specNames.append(proj.path)
+    userHomePath = path.join(os.environ['HOME'], '.vimproj.xml')
 
-            for proj in specUser.projects:
-                if proj.path not in specNames:
-                    # print("DEBUG: adding %s with path [%s] to project" % (proj.name, proj.path))
-                    spec.projects.append(proj)
+    # Only sandboxes get a cache. That is where loading the solution is
+    # expensive and mw_anchor tells us where to keep it.
+    useCache = useCache and mw_anchor
+    cacheKey = (path.abspath(projSpecFile), userHomePath, path.abspath(rootDir))
+    if useCache:
+        state = solutionCache.loadSolution(rootDir, cacheKey)
+        if state is not None:
+            debug('using cached solution')
+            return Solution.fromState(state)
 
-        if mw_anchor:
-            addModuleDependencies(spec.projects, path.dirname(mw_anchor))
+    spec = parseProjSettings(projSpecFile, userHomePath, rootDir, mw_anchor)
 
-        return spec
-    else:
-        return None
+    if useCache:
+        stamps = getStamps(spec, [projSpecFile, userHomePath])
+        solutionCache.saveSolution(rootDir, cacheKey, spec.getState(), stamps)
+
+    return spec
 
 if __name__ == "__main__":
     print(getProjSettings())
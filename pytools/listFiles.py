@@ -1,13 +1,29 @@
 #!/usr/bin/env python3
 
+from toolClient import runOnServer
+runOnServer()
+
 import sys
-from optparse import OptionParser
-from ListSearch import listOrSearchFiles, Lister
+from types import SimpleNamespace
+from ListSearch import listOrSearchFiles, streamFiles, Lister
+
+if sys.argv[1:]:
+    from optparse import OptionParser
 
-parser = OptionParser()
-parser.add_option("-p", "--only-in-proj", dest="onlyInProj", help="search in project only", action="store_true", default=False)
+    parser = OptionParser()
+    parser.add_option("-p", "--only-in-proj", dest="onlyInProj", help="search in project only", action="store_true", default=False)
+    parser.add_option("-r", "--refresh", dest="refresh", help="read all the directories again instead of using the cached file lists", action="store_true", default=False)
+    parser.add_option("-s", "--stream", dest="stream", help="write the files as they are listed, the ones of the current project first", action="store_true", default=False)
 
-(options, args) = parser.parse_args()
+    (options, args) = parser.parse_args()
+else:
+    # How it runs most of the time. Importing optparse would take longer
+    # than listing the files from the cache.
+    options = SimpleNamespace(onlyInProj=False, refresh=False, stream=False)
+Lister.refresh = options.refresh
 
-print("\n".join(listOrSearchFiles(options.onlyInProj, Lister)))
+if options.stream:
+    streamFiles(options.onlyInProj, Lister)
+else:
+    print("\n".join(listOrSearchFiles(options.onlyInProj, Lister)))
 
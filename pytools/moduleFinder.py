@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Finds all the modules (directories containing a MODULE_DEPENDENCIES file)
+# under a directory.
+#
+# On NFS backed sandboxes every directory listing is a network round trip,
+# so the directories are listed by a pool of threads instead of one at a
+# time. Directories which can never contain modules (derived output,
+# version control, l10n trees etc.) are not descended into. Neither are
+# the subdirectories of a module unless nested modules are asked for.
+#
+# It is also used from the Python 2 Vims, through getProjSettings.
+
+import os
+import sys
+from fnmatch import fnmatch
+from threading import Thread
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+MODULE_MARKER = 'MODULE_DEPENDENCIES'
+
+DEFAULT_SKIP_DIRS = ['.git', '.svn', '.sbtools', '__pycache__', 'derived', '*l10n*']
+
+try:
+    NUM_CPUS = os.cpu_count() or 1
+except AttributeError:
+    import multiprocessing
+    NUM_CPUS = multiprocessing.cpu_count()
+
+NUM_THREADS = min(32, 4 * NUM_CPUS)
+
+def listDir(dirName):
+    """Returns the (name, path, is a directory) of the entries of dirName.
+    Symbolic links to directories are not directories."""
+
+    if hasattr(os, 'scandir'):
+        return [(e.name, e.path, e.is_dir(follow_symlinks=False)) for e in os.scandir(dirName)]
+
+    entries = []
+    for name in os.listdir(dirName):
+        entryPath = os.path.join(dirName, name)
+        entries.append((name, entryPath, os.path.isdir(entryPath) and not os.path.islink(entryPath)))
+    return entries
+
+class ModuleFinder:
+    def __init__(self, skip=DEFAULT_SKIP_DIRS, nested=False, numThreads=NUM_THREADS):
+        self.skip = list(skip)
+        self.nested = nested
+        self.numThreads = numThreads
+
+        self.modules = []
+        self.visitedDirs = []
+
+    def isSkipped(self, dirName):
+        for pat in self.skip:
+            if fnmatch(dirName, pat):
+                return True
+        return False
+
+    def scanDir(self, dirName, queue):
+        try:
+            entries = listDir(dirName)
+        except OSError:
+            return
+
+        self.visitedDirs.append(dirName)
+
+        subDirs = []
+        isModule = False
+        for (name, entryPath, isDir) in entries:
+            if isDir:
+                if not self.isSkipped(name):
+                    subDirs.append(entryPath)
+            elif name == MODULE_MARKER:
+                isModule = True
+
+        if isModule:
+            self.modules.append(dirName)
+            if not self.nested:
+                return
+
+        for subDir in subDirs:
+            queue.put(subDir)
+
+    def worker(self, queue):
+        while True:
+            dirName = queue.get()
+            try:
+                if dirName is None:
+                    return
+                self.scanDir(dirName, queue)
+            finally:
+                queue.task_done()
+
+    def find(self, topDir):
+        """Returns the sorted list of module directories under topDir."""
+
+        self.modules = []
+        self.visitedDirs = []
+
+        queue = Queue()
+        queue.put(topDir)
+
+        threads = []
+        for i in range(self.numThreads):
+            th = Thread(target=self.worker, args=(queue,))
+            th.daemon = True
+            th.start()
+            threads += [th]
+
+        queue.join()
+
+        for th in threads:
+            queue.put(None)
+        for th in threads:
+            th.join()
+
+        return sorted(self.modules)
+
+if __name__ == "__main__":
+    for mod in ModuleFinder().find(sys.argv[1]):
+        print(mod)
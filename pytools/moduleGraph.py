@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+# The dependency graph between the projects of a Solution.
+#
+# The graph is built once from the direct dependencies (Project.depends).
+# The topological order and the transitive closures in both directions are
+# computed the first time they are needed. Closures are kept as one integer
+# bitset per strongly connected component, so answering "does X depend on
+# Y" is a single bit test and the set of names for a module is decoded at
+# most once.
+
+import sys
+
+def bitsToIndices(bits):
+    # bin() reverses the bit order, so walk it backwards to get increasing
+    # indices.
+    digits = bin(bits)[:1:-1]
+    return [i for (i, d) in enumerate(digits) if d == '1']
+
+class DependencyGraph:
+    def __init__(self, projects):
+        self.names = []
+        self.indexOf = {}
+        for proj in projects:
+            if proj.name not in self.indexOf:
+                self.indexOf[proj.name] = len(self.names)
+                self.names.append(proj.name)
+
+        numNodes = len(self.names)
+        self.deps = [[] for i in range(numNodes)]
+        self.rdeps = [[] for i in range(numNodes)]
+        for proj in projects:
+            i = self.indexOf[proj.name]
+            for dep in proj.depends:
+                j = self.indexOf.get(dep)
+                if j is not None and j not in self.deps[i]:
+                    self.deps[i].append(j)
+                    self.rdeps[j].append(i)
+
+        self.components = None
+        self.componentOf = None
+        self.closure = None
+        self.rclosure = None
+        self.depsCache = {}
+        self.rdepsCache = {}
+
+    def findComponents(self):
+        """Tarjan's algorithm, without recursion so that long dependency
+        chains do not overflow the stack. Components come out with all the
+        components they depend on before them."""
+
+        numNodes = len(self.names)
+        index = [-1] * numNodes
+        lowLink = [0] * numNodes
+        onStack = [False] * numNodes
+        stack = []
+        components = []
+        componentOf = [-1] * numNodes
+        counter = 0
+
+        for root in range(numNodes):
+            if index[root] >= 0:
+                continue
+
+            work = [(root, 0)]
+            while work:
+                (v, childIdx) = work.pop()
+                if childIdx == 0:
+                    index[v] = lowLink[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    onStack[v] = True
+
+                recursed = False
+                children = self.deps[v]
+                while childIdx < len(children):
+                    w = children[childIdx]
+                    childIdx += 1
+                    if index[w] < 0:
+                        work.append((v, childIdx))
+                        work.append((w, 0))
+                        recursed = True
+                        break
+                    elif onStack[w]:
+                        lowLink[v] = min(lowLink[v], index[w])
+
+                if recursed:
+                    continue
+
+                if lowLink[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        onStack[w] = False
+                        componentOf[w] = len(components)
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component)
+
+                if work:
+                    parent = work[-1][0]
+                    lowLink[parent] = min(lowLink[parent], lowLink[v])
+
+        self.components = components
+        self.componentOf = componentOf
+
+    def computeClosure(self, edges, componentOrder):
+        closure = [0] * len(self.components)
+        for c in componentOrder:
+            bits = 0
+            members = self.components[c]
+            for v in members:
+                for w in edges[v]:
+                    bits |= (1 << w) | closure[self.componentOf[w]]
+            closure[c] = bits
+        return closure
+
+    def ensureClosures(self):
+        if self.closure is not None:
+            return
+        if self.components is None:
+            self.findComponents()
+
+        order = range(len(self.components))
+        self.closure = self.computeClosure(self.deps, order)
+        self.rclosure = self.computeClosure(self.rdeps, reversed(order))
+
+    def topologicalOrder(self):
+        """Returns all module names with every module after the modules it
+        depends on. Modules in a dependency cycle are adjacent."""
+
+        if self.components is None:
+            self.findComponents()
+        return [self.names[v] for c in self.components for v in c]
+
+    def directDependencies(self, name):
+        return [self.names[j] for j in self.deps[self.indexOf[name]]]
+
+    def directDependents(self, name):
+        return [self.names[j] for j in self.rdeps[self.indexOf[name]]]
+
+    def decode(self, closure, cache, name):
+        result = cache.get(name)
+        if result is None:
+            self.ensureClosures()
+            i = self.indexOf[name]
+            bits = closure[self.componentOf[i]]
+            result = frozenset(self.names[j] for j in bitsToIndices(bits))
+            cache[name] = result
+        return result
+
+    def dependencies(self, name):
+        """All the modules name depends on, directly or indirectly."""
+        self.ensureClosures()
+        return self.decode(self.closure, self.depsCache, name)
+
+    def dependents(self, name):
+        """All the modules depending on name, directly or indirectly."""
+        self.ensureClosures()
+        return self.decode(self.rclosure, self.rdepsCache, name)
+
+    def dependsOn(self, name, otherName):
+        self.ensureClosures()
+        bits = self.closure[self.componentOf[self.indexOf[name]]]
+        return bool((bits >> self.indexOf[otherName]) & 1)
+
+if __name__ == "__main__":
+    from getProjSettings import getProjSettings
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [-r] module")
+    parser.add_option("-r", "--reverse", dest="reverse", help="list the modules depending on module", action="store_true", default=False)
+    (options, args) = parser.parse_args()
+
+    soln = getProjSettings()
+    if not soln or len(args) != 1:
+        parser.print_usage()
+        sys.exit(1)
+
+    graph = soln.getDependencyGraph()
+    if options.reverse:
+        names = graph.dependents(args[0])
+    else:
+        names = graph.dependencies(args[0])
+    print('\n'.join(sorted(names)))
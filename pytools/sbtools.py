@@ -1,7 +1,5 @@
 import os
 from os import path
-import re
-from subprocess import Popen, PIPE
 import sys
 
 def getRootDir():
@@ -28,6 +26,8 @@ def getRelPathTo(fileName):
     return p2[len(p1)+1:]
 
 def getArchivePath():
+    import re
+
     out = getoutput('sbver')
     return re.search(r'SyncFrom: (\S*)', out).group(1)
 
@@ -49,6 +49,8 @@ def getSubmitFile(sbrootDir=''):
         return ''
 
 def getoutput(cmd):
+    from subprocess import Popen, PIPE
+
     return Popen(cmd, stdout=PIPE).communicate()[0]
 
 def getScriptPath(scriptName):
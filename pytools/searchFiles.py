@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+# Searches files for a pattern in this process and a pool of worker
+# processes instead of in grep processes. Understands the grep options
+# findInProj.py and findInSoln.py are usually called with (see
+# parseGrepArgs) and writes grep -nH compatible output. Binary files are
+# skipped.
+#
+# Every file is memory mapped. When the pattern contains a literal string
+# which every match has to contain, files without it are rejected with a
+# plain substring search before the regular expression is tried.
+
+import mmap
+import os
+import re
+import sys
+import threading
+
+from findInFiles import makeChunks, getSize, MIN_CHUNK_BYTES, MAX_FILES_PER_CHUNK
+
+NUM_WORKERS = os.cpu_count() or 1
+
+# grep thinks a file is binary if its first buffer has a NUL byte in it.
+BINARY_CHECK_BYTES = 32768
+
+class SearchOptions:
+    def __init__(self, pattern, ignoreCase=False, wordRegexp=False, fixedStrings=False, extended=False):
+        self.pattern = pattern
+        self.ignoreCase = ignoreCase
+        self.wordRegexp = wordRegexp
+        self.fixedStrings = fixedStrings
+        self.extended = extended
+
+def parseGrepArgs(args):
+    """Returns the SearchOptions for grep args, or None if args use
+    something which is not supported here."""
+
+    flags = {'i': 'ignoreCase', 'w': 'wordRegexp', 'F': 'fixedStrings', 'E': 'extended'}
+    values = {}
+    pattern = None
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        i += 1
+        if arg == '--':
+            if pattern is None and i < len(args):
+                pattern = args[i]
+                i += 1
+            break
+        elif arg == '-e':
+            if pattern is not None or i == len(args):
+                return None
+            pattern = args[i]
+            i += 1
+        elif arg.startswith('-') and len(arg) > 1:
+            for c in arg[1:]:
+                if c in flags:
+                    values[flags[c]] = True
+                elif c == 'G':
+                    values['extended'] = False
+                elif c not in 'nHI':
+                    return None
+        elif pattern is None:
+            pattern = arg
+        else:
+            # More than one pattern, or files to search.
+            return None
+
+    if pattern is None or i < len(args):
+        return None
+    return SearchOptions(pattern, **values)
+
+# Backslash escapes with the same meaning in grep and Python regular
+# expressions.
+COMMON_ESCAPES = set('wWsSbB0123456789.*[]^$\\/')
+
+def translateRegexp(pattern, extended):
+    """Translates a grep basic or extended regular expression to a Python
+    one. Returns None for constructs without an easy translation."""
+
+    # In a basic regular expression these are literals unless escaped, in
+    # an extended one the other way around.
+    special = '|(){}+?'
+
+    result = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern):
+            n = pattern[i+1]
+            i += 2
+            if n in '<>':
+                result.append(r'\b')
+            elif n in special:
+                result.append('\\' + n if extended else n)
+            elif n in COMMON_ESCAPES:
+                result.append('\\' + n)
+            else:
+                return None
+        elif c == '[':
+            end = findBracketEnd(pattern, i)
+            if end < 0:
+                return None
+            body = pattern[i+1:end]
+            if '[:' in body or '[=' in body or '[.' in body:
+                return None
+            negate = body.startswith('^')
+            if negate:
+                body = body[1:]
+            # A backslash is not special in a grep bracket expression.
+            body = body.replace('\\', '\\\\').replace('[', '\\[').replace(']', '\\]')
+            result.append('[' + ('^' if negate else '') + body + ']')
+            i = end + 1
+        elif c in special:
+            result.append(c if extended else '\\' + c)
+            i += 1
+        else:
+            result.append(c)
+            i += 1
+    return ''.join(result)
+
+def findBracketEnd(pattern, start):
+    """Returns the index of the ] closing the grep bracket expression at
+    start, where a ] right after the [ or [^ is a literal."""
+
+    i = start + 1
+    if pattern[i:i+1] == '^':
+        i += 1
+    if pattern[i:i+1] == ']':
+        i += 1
+    return pattern.find(']', i)
+
+def findClassEnd(regexp, start):
+    """Returns the index of the ] closing the Python character class at
+    start."""
+
+    i = start + 1
+    while i < len(regexp):
+        if regexp[i] == '\\':
+            i += 2
+        elif regexp[i] == ']':
+            return i
+        else:
+            i += 1
+    return len(regexp)
+
+def splitAlternatives(regexp):
+    """Splits the Python regexp at the | which are not in a group."""
+
+    alternatives = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(regexp):
+        c = regexp[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '[':
+            i = findClassEnd(regexp, i)
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            alternatives.append(regexp[start:i])
+            start = i + 1
+        i += 1
+    alternatives.append(regexp[start:])
+    return alternatives
+
+def requiredLiterals(regexp):
+    """Returns strings every match of the Python regexp (produced by
+    translateRegexp) contains. Not all of them, only the ones which are
+    easy to find."""
+
+    if len(splitAlternatives(regexp)) > 1:
+        # Nothing is required of all the alternatives.
+        return []
+
+    literals = []
+    run = ''
+    depth = 0
+    i = 0
+    while i < len(regexp):
+        c = regexp[i]
+        atom = None
+        if c == '\\':
+            if regexp[i+1:i+2] and not regexp[i+1].isalnum():
+                atom = regexp[i+1]
+            i += 2
+        elif c == '[':
+            i = findClassEnd(regexp, i) + 1
+        else:
+            if c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+            elif c not in '.^$|':
+                atom = c
+            i += 1
+
+        quantifier = regexp[i:i+1]
+        if quantifier in ('*', '+', '?'):
+            i += 1
+        elif quantifier == '{':
+            i = regexp.find('}', i) + 1 or len(regexp)
+        else:
+            quantifier = ''
+
+        if atom is not None and depth == 0 and quantifier in ('', '+'):
+            run += atom
+        if atom is None or depth > 0 or quantifier:
+            if run:
+                literals.append(run)
+            # The last character of a+ can be repeated, but it is there.
+            run = atom if atom is not None and quantifier == '+' and depth == 0 else ''
+    if run:
+        literals.append(run)
+    return literals
+
+def requiredLiteral(regexp):
+    """Returns the longest of requiredLiterals(regexp), or ''."""
+    return max(requiredLiterals(regexp), key=len, default='')
+
+class Searcher:
+    """A compiled search. Can be sent to worker processes."""
+
+    def __init__(self, options):
+        if options.fixedStrings:
+            regexp = re.escape(options.pattern)
+            literal = options.pattern
+        else:
+            regexp = translateRegexp(options.pattern, options.extended)
+            if regexp is None:
+                raise ValueError('unsupported regular expression')
+            literal = requiredLiteral(regexp)
+
+        if options.wordRegexp:
+            regexp = r'(?<!\w)(?:%s)(?!\w)' % regexp
+
+        flags = re.M
+        if options.ignoreCase:
+            flags |= re.I
+            if literal.lower() != literal.upper():
+                # A plain substring search cannot ignore case.
+                literal = ''
+
+        self.regexp = re.compile(regexp.encode('utf-8', 'surrogateescape'), flags)
+        self.literal = literal.encode('utf-8', 'surrogateescape')
+
+    def searchFile(self, fname, out):
+        try:
+            with open(fname, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Missing, unreadable or empty.
+            return
+
+        try:
+            if b'\0' in data[:BINARY_CHECK_BYTES]:
+                return
+            if self.literal and data.find(self.literal) < 0:
+                return
+
+            regexp = self.regexp
+            literal = self.literal
+            prefix = fname.encode('utf-8', 'surrogateescape') + b':'
+            size = len(data)
+            lineNum = 1
+            countedTo = 0
+            # Always the start of a line.
+            pos = 0
+            while pos < size:
+                if literal:
+                    # Only the lines with the literal in them can match,
+                    # and finding it is a lot faster than trying the regexp
+                    # everywhere.
+                    idx = data.find(literal, pos)
+                    if idx < 0:
+                        break
+                    start = data.rfind(b'\n', pos, idx) + 1 or pos
+                    end = data.find(b'\n', idx)
+                    if end < 0:
+                        end = size
+                    if not regexp.search(data, start, end):
+                        pos = end + 1
+                        continue
+                else:
+                    m = regexp.search(data, pos)
+                    if not m:
+                        break
+
+                    start = data.rfind(b'\n', pos, m.start()) + 1 or pos
+                    if start == size:
+                        # An empty match after the last newline.
+                        break
+                    end = data.find(b'\n', m.start())
+                    if end < 0:
+                        end = size
+
+                    # grep matches one line at a time, but things like \s
+                    # and [^x] can match a newline here.
+                    if m.end() > end and not regexp.search(data, start, end):
+                        pos = end + 1
+                        continue
+
+                lineNum += data[countedTo:start].count(b'\n')
+                countedTo = start
+
+                out.append(b'%s%d:%s\n' % (prefix, lineNum, data[start:end]))
+                pos = end + 1
+        finally:
+            data.close()
+
+    def searchFiles(self, files):
+        out = []
+        for fname in files:
+            self.searchFile(fname, out)
+        return b''.join(out)
+
+def searchChunk(args):
+    (searcher, files) = args
+    return searcher.searchFiles(files)
+
+pool = None
+poolLock = threading.Lock()
+
+def getPool():
+    """The pool of worker processes shared by all searches. Create it
+    before starting threads, forking a process with threads is fragile."""
+
+    global pool
+    with poolLock:
+        if pool is None:
+            import multiprocessing
+            pool = multiprocessing.Pool(NUM_WORKERS)
+        return pool
+
+def needsPool(files):
+    """Whether searching files can take more than one chunk, which is
+    what the pool is for. Gives up counting as soon as it can."""
+
+    if NUM_WORKERS == 1:
+        return False
+    numBytes = 0
+    for (i, fname) in enumerate(files):
+        numBytes += getSize(fname)
+        if numBytes >= MIN_CHUNK_BYTES or i + 1 >= MAX_FILES_PER_CHUNK:
+            return True
+    return False
+
+def search(options, files):
+    """Yields the grep -nH output for files, a chunk at a time and in the
+    order of files."""
+
+    searcher = Searcher(options)
+    files = [f for f in files if f]
+    chunks = makeChunks(files, NUM_WORKERS)
+    if NUM_WORKERS == 1 or len(chunks) <= 1:
+        for files in chunks:
+            yield searcher.searchFiles(files)
+        return
+
+    for result in getPool().imap(searchChunk, [(searcher, c) for c in chunks]):
+        yield result
+
+def getSearchOptions(args):
+    """The SearchOptions for grep args if they can be searched for here,
+    otherwise None."""
+
+    options = parseGrepArgs(args)
+    if options is None:
+        return None
+    try:
+        Searcher(options)
+    except (ValueError, re.error):
+        return None
+    return options
+
+if __name__ == "__main__":
+    options = getSearchOptions(sys.argv[1:])
+    if options is None:
+        print("ERROR: unsupported grep options or pattern: %s" % ' '.join(sys.argv[1:]))
+        sys.exit(2)
+
+    out = sys.stdout.buffer
+    for result in search(options, sys.stdin.read().splitlines()):
+        out.write(result)
+        out.flush()
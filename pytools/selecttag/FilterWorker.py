@@ -0,0 +1,116 @@
+from threading import Thread
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+# Items are checked this many at a time between looking for a newer filter.
+CHUNK_SIZE = 2000
+
+class FilterResult(object):
+    def __init__(self, generation, filterTxt, items, scores, done):
+        self.generation = generation
+        self.filterTxt = filterTxt
+        self.items = items
+        # The negated scores of items once done, if the items can be ranked.
+        self.scores = scores
+        self.done = done
+
+class FilterWorker(object):
+    """Filters items on a background thread.
+
+    Every submit() gets a new generation and makes the filters submitted
+    before it obsolete: the worker skips them or stops working on them.
+    Results are put on the results queue for the UI thread to pick up. A
+    filter can produce a partial result with the first few matches before
+    its final result."""
+
+    def __init__(self, items, index=None, numFirstMatches=20):
+        self.allItems = items
+        self.index = index
+        self.canRank = len(items) > 0 and hasattr(items[0], 'score')
+        self.numFirstMatches = numFirstMatches
+
+        self.generation = 0
+        self.requests = Queue()
+        self.results = Queue()
+
+        thread = Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, filterTxt, prevFilterTxt='', prevItems=None):
+        """Starts filtering for filterTxt. prevItems are the matches of
+        prevFilterTxt, if they are known. Returns the generation of the
+        results for this filter."""
+
+        self.generation += 1
+        self.requests.put((self.generation, filterTxt, prevFilterTxt, prevItems))
+        return self.generation
+
+    def cancel(self):
+        """Stops working on the last filter. Returns the generation which
+        no results will be produced for."""
+
+        self.generation += 1
+        return self.generation
+
+    def isCancelled(self, generation):
+        return generation != self.generation
+
+    def run(self):
+        while True:
+            (generation, filterTxt, prevFilterTxt, prevItems) = self.requests.get()
+            if self.isCancelled(generation):
+                continue
+            try:
+                self.filter(generation, filterTxt, prevFilterTxt, prevItems)
+            except Exception:
+                # Nobody should wait forever for this filter.
+                self.results.put(FilterResult(generation, filterTxt, [], None, True))
+
+    def getItemsToCheck(self, filterTxt, prevFilterTxt, prevItems):
+        candidates = None
+        if self.index is not None and self.index.ready:
+            candidates = self.index.candidates(filterTxt)
+
+        if prevItems is not None and prevFilterTxt in filterTxt and (
+                candidates is None or len(prevItems) <= len(candidates)):
+            return prevItems
+        elif candidates is not None:
+            return [self.allItems[i] for i in candidates]
+        else:
+            return self.allItems
+
+    def filter(self, generation, filterTxt, prevFilterTxt, prevItems):
+        items = self.getItemsToCheck(filterTxt, prevFilterTxt, prevItems)
+
+        matches = []
+        postedFirst = False
+        for start in range(0, len(items), CHUNK_SIZE):
+            if self.isCancelled(generation):
+                return
+            for i in range(start, min(start + CHUNK_SIZE, len(items))):
+                it = items[i]
+                if it.satisfies(filterTxt):
+                    matches.append(it)
+
+            if not postedFirst and len(matches) >= self.numFirstMatches:
+                self.results.put(FilterResult(generation, filterTxt, matches[:], None, False))
+                postedFirst = True
+
+        scores = None
+        if self.canRank:
+            scores = []
+            for start in range(0, len(matches), CHUNK_SIZE):
+                if self.isCancelled(generation):
+                    return
+                scores += [-it.score(filterTxt) for it in matches[start:start + CHUNK_SIZE]]
+
+        self.results.put(FilterResult(generation, filterTxt, matches, scores, True))
+
+    def getResult(self, block=False):
+        try:
+            return self.results.get(block)
+        except Empty:
+            return None
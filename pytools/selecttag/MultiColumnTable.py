@@ -1,16 +1,38 @@
 from __future__ import division
 from Tkinter import *
+import heapq
+from FilterWorker import FilterWorker
 
 NUM_LINES_TO_SHOW = 20
 
+# How often results of the background filter are looked for.
+POLL_MS = 20
+
 class MultiColumnTable(Frame):
-    def __init__(self, parent, items, filterTxt=''):
+    def __init__(self, parent, items, filterTxt='', index=None):
         Frame.__init__(self, parent)
 
         self.allItems = items
         self.filteredItems = items
         self.filterTxt = ''
 
+        # Filtering happens on a background thread, using index (an
+        # optional TrigramIndex over the lower cased text of the items)
+        # once it is ready. The results are picked up by polling from the
+        # Tk event loop. filteredItems can be the first matches of
+        # filterTxt while filterDone is False.
+        self.worker = FilterWorker(items, index, NUM_LINES_TO_SHOW)
+        self.requestedFilterTxt = filterTxt
+        self.shownGeneration = 0
+        self.filterDone = True
+        self.polling = False
+
+        # With a filter, items which have a score method are shown best
+        # match first. Only as many of them as have been shown are ranked.
+        self.canRank = hasattr(items[0], 'score')
+        self.rankedItems = None
+        self.scores = None
+
         self.currentOffset = 0
         self.currentSelectionIdx = 0
 
@@ -33,15 +55,78 @@ class MultiColumnTable(Frame):
         self.showFilteredLines(filterTxt)
 
     def refreshFilter(self, filterTxt):
-        if filterTxt == self.filterTxt:
+        if filterTxt == self.requestedFilterTxt:
             return
+        self.requestedFilterTxt = filterTxt
 
-        self.currentOffset = 0
-        self.currentSelectionIdx = 0
-        self.showFilteredLines(filterTxt)
+        if not filterTxt:
+            self.shownGeneration = self.worker.cancel()
+            self.currentOffset = 0
+            self.currentSelectionIdx = 0
+            self.showFilteredLines(filterTxt)
+            return
+
+        prevItems = self.filteredItems if self.filterDone else None
+        self.worker.submit(filterTxt, self.filterTxt, prevItems)
+        if not self.polling:
+            self.polling = True
+            self.after(POLL_MS, self.pollResults)
+
+    def isFilterPending(self):
+        return not (self.shownGeneration == self.worker.generation and self.filterDone)
+
+    def pollResults(self):
+        while True:
+            result = self.worker.getResult()
+            if result is None:
+                break
+            self.showResult(result)
+
+        if self.isFilterPending():
+            self.after(POLL_MS, self.pollResults)
+        else:
+            self.polling = False
+
+    def finishFilter(self):
+        """Waits for the results of the last filter."""
+        while self.isFilterPending():
+            self.showResult(self.worker.getResult(block=True))
+
+    def showResult(self, result):
+        if result.generation != self.worker.generation:
+            return
+
+        if result.generation != self.shownGeneration:
+            self.shownGeneration = result.generation
+            self.currentOffset = 0
+            self.currentSelectionIdx = 0
+
+        self.filteredItems = result.items
+        self.filterTxt = result.filterTxt
+        self.filterDone = result.done
+        self.scores = result.scores
+        self.rankedItems = [] if (result.done and self.canRank) else None
+        self.showFilteredLinesWithCurrentOffset()
 
     def getCurrentSelection(self):
-        return self.filteredItems[self.currentOffset + self.currentSelectionIdx]
+        return self.getItem(self.currentOffset + self.currentSelectionIdx)
+
+    def getItem(self, idx):
+        if self.rankedItems is None:
+            return self.filteredItems[idx]
+        if idx >= len(self.rankedItems):
+            self.rankItems(max(idx + 1, 2 * len(self.rankedItems), NUM_LINES_TO_SHOW))
+        return self.rankedItems[idx]
+
+    def rankItems(self, k):
+        items = self.filteredItems
+        if self.scores is None:
+            filterTxt = self.filterTxt
+            self.scores = [-it.score(filterTxt) for it in items]
+        # nsmallest keeps the (alphabetical) order of items with equal
+        # scores.
+        best = heapq.nsmallest(k, range(len(items)), key=self.scores.__getitem__)
+        self.rankedItems = [items[i] for i in best]
 
     def moveSelection(self, command):
         for listBox in self.listBoxes:
@@ -67,14 +152,15 @@ class MultiColumnTable(Frame):
 
     def showFilteredLines(self, filterTxt):
         if filterTxt:
-            if self.filterTxt in filterTxt:
-                self.filteredItems = [it for it in self.filteredItems if it.satisfies(filterTxt)]
-            else:
-                self.filteredItems = [it for it in self.allItems if it.satisfies(filterTxt)]
+            items = self.worker.getItemsToCheck(filterTxt, self.filterTxt, self.filteredItems)
+            self.filteredItems = [it for it in items if it.satisfies(filterTxt)]
         else:
             self.filteredItems = self.allItems
 
         self.filterTxt = filterTxt
+        self.filterDone = True
+        self.scores = None
+        self.rankedItems = [] if (filterTxt and self.canRank) else None
         self.showFilteredLinesWithCurrentOffset()
 
     @property
@@ -92,7 +178,7 @@ class MultiColumnTable(Frame):
 
         for (colIdx, listBox) in enumerate(self.listBoxes):
             for rowIdx in range(self.numRowsShown):
-                listBox.insert(rowIdx, self.filteredItems[rowIdx + self.currentOffset].getTxt(colIdx))
+                listBox.insert(rowIdx, self.getItem(rowIdx + self.currentOffset).getTxt(colIdx))
 
         r1 = self.currentOffset / self.numFilteredItems
         r2 = (self.currentOffset  + self.numRowsShown) / self.numFilteredItems
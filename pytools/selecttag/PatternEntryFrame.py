@@ -1,5 +1,9 @@
 from Tkinter import *
 
+# Changes to the pattern are only passed on once it has not changed for
+# this long, so typing quickly does not start a filter per key.
+DEBOUNCE_MS = 60
+
 class PatternEntryFrame(Frame):
     def __init__(self, parent):
         Frame.__init__(self, parent)
@@ -9,6 +13,7 @@ class PatternEntryFrame(Frame):
 
         self.onChange = None
         self.onKeyPress = None
+        self.pendingChange = None
 
         self.stringVar = StringVar()
         self.stringVar.trace('w', self.callObservers)
@@ -28,11 +33,22 @@ class PatternEntryFrame(Frame):
         self.entry.bind('<Escape>', lambda *args: self.broadcast('Esc'))
 
     def broadcast(self, key):
+        # Keys act on the pattern as typed so far.
+        self.flushChange()
         if self.onKeyPress:
             self.onKeyPress(key)
 
     def callObservers(self, *args):
-        if self.onChange:
-            self.onChange(self.stringVar.get())
+        if self.pendingChange is not None:
+            self.after_cancel(self.pendingChange)
+        self.pendingChange = self.after(DEBOUNCE_MS, self.notifyObservers)
 
+    def flushChange(self):
+        if self.pendingChange is not None:
+            self.after_cancel(self.pendingChange)
+            self.notifyObservers()
 
+    def notifyObservers(self):
+        self.pendingChange = None
+        if self.onChange:
+            self.onChange(self.stringVar.get())
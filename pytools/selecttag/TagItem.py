@@ -0,0 +1,167 @@
+# The weights used to rank the tags matching a filter. Every matched
+# character counts, words starting at a word boundary or right after the
+# previous word count extra, and matches in the class name or the
+# signature count less than matches in the tag name.
+BOUNDARY_BONUS = 3.0
+ADJACENT_BONUS = 2.0
+NAME_PREFIX_BONUS = 4.0
+EXACT_NAME_BONUS = 10.0
+CLASS_WEIGHT = 0.6
+SIGNATURE_WEIGHT = 0.3
+LENGTH_PENALTY = 0.01
+
+def makeTxt(name, props):
+    """Returns the text shown for a tag and where its name is in it."""
+
+    txt = ''
+    if 'class' in props:
+        txt += (props['class'] + '::')
+
+    nameStart = len(txt)
+    txt += name
+    nameEnd = len(txt)
+
+    if 'signature' in props:
+        txt += props['signature']
+    return (txt, nameStart, nameEnd)
+
+class TagItem(object):
+    __slots__ = ('tag', '_txt', '_txtLower', '_nameStart', '_nameEnd')
+
+    def __init__(self, tag):
+        self.tag = tag
+        self._txt = None
+        self._txtLower = None
+        self._nameStart = 0
+        self._nameEnd = 0
+
+    @property
+    def txt(self):
+        if self._txt is None:
+            (self._txt, self._nameStart, self._nameEnd) = makeTxt(self.tag.name, self.tag.props)
+        return self._txt
+
+    @property
+    def txtLower(self):
+        if self._txtLower is None:
+            self._txtLower = self.txt.lower()
+        return self._txtLower
+
+    def numColumns(self):
+        return 2
+
+    def columnWidth(self, colIdx):
+        if colIdx == 0:
+            return 2
+        elif colIdx == 1:
+            return 80
+
+    def getTxt(self, colIdx):
+        if colIdx == 0:
+            return self.tag.type
+        elif colIdx == 1:
+            return self.txt
+
+    def satisfies(self, filterTxt):
+        words = filterTxt.split()
+        i = 0
+        for w in words:
+            i = self.txtLower.find(w.lower(), i)
+            if i < 0:
+                return False
+            i += len(w)
+        return True
+
+    def scoreFrom(self, words, start):
+        """Scores the words matched from the left starting at start.
+        Returns (score, start of the first match) or None if the words do
+        not match."""
+
+        txt = self._txt
+        txtLower = self.txtLower
+        nameStart = self._nameStart
+        nameEnd = self._nameEnd
+
+        score = 0.0
+        first = -1
+        prevEnd = -1
+        i = start
+        for w in words:
+            j = txtLower.find(w, i)
+            if j < 0:
+                return None
+
+            s = len(w)
+            if j == 0 or not txt[j-1].isalnum() or (txt[j].isupper() and not txt[j-1].isupper()):
+                s += BOUNDARY_BONUS
+            if j == prevEnd:
+                s += ADJACENT_BONUS
+
+            if j < nameStart:
+                s *= CLASS_WEIGHT
+            elif j >= nameEnd:
+                s *= SIGNATURE_WEIGHT
+            elif j == nameStart and first < 0:
+                s += NAME_PREFIX_BONUS
+            score += s
+
+            if first < 0:
+                first = j
+            i = prevEnd = j + len(w)
+        return (score, first)
+
+    def score(self, filterTxt):
+        """How well this tag matches filterTxt, higher is better. Only
+        meaningful for tags which satisfy filterTxt."""
+
+        words = filterTxt.lower().split()
+        if not words:
+            return 0.0
+
+        # Builds the text and finds where the name is in it.
+        self.txt
+
+        result = self.scoreFrom(words, 0)
+        if result is None:
+            return 0.0
+        (score, first) = result
+
+        # The words are matched from the left, so they could end up in the
+        # class name even though they also match the tag name.
+        if first < self._nameStart:
+            result = self.scoreFrom(words, self._nameStart)
+            if result is not None and result[0] > score:
+                score = result[0]
+
+        nameLen = self._nameEnd - self._nameStart
+        if len(words) == 1 and len(words[0]) == nameLen and first >= 0:
+            if self._txtLower[self._nameStart:self._nameEnd] == words[0]:
+                score += EXACT_NAME_BONUS
+        return score - LENGTH_PENALTY * nameLen
+
+class TagItemList(object):
+    """The TagItems of a TagList, created when they are first needed."""
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.items = [None] * len(tags)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        item = self.items[i]
+        if item is None:
+            item = self.items[i] = TagItem(self.tags[i])
+        return item
+
+    def __iter__(self):
+        for i in range(len(self.items)):
+            yield self[i]
+
+    def iterTxtLower(self):
+        """Yields the lower cased text of every item without creating the
+        items, which would keep every tag parsed in memory."""
+
+        for (name, props) in self.tags.iterNamesAndProps():
+            yield makeTxt(name, props)[0].lower()
@@ -0,0 +1,73 @@
+from array import array
+from bisect import bisect_left
+
+class TrigramIndex(object):
+    """Maps every 3 character substring of a list of texts to the sorted
+    indices of the texts containing it. Finding the texts which can
+    contain some words then only needs the posting lists of the trigrams
+    of the words instead of a scan over all the texts."""
+
+    def __init__(self):
+        self.postings = {}
+        self.count = 0
+        self.ready = False
+
+    def add(self, txt):
+        i = self.count
+        self.count += 1
+
+        postings = self.postings
+        for g in set([txt[j:j+3] for j in range(len(txt) - 2)]):
+            p = postings.get(g)
+            if p is None:
+                p = postings[g] = array('I')
+            p.append(i)
+
+    def addAll(self, texts):
+        for txt in texts:
+            self.add(txt)
+        self.ready = True
+
+    def candidates(self, filterTxt):
+        """Returns the sorted indices of the texts which contain all the
+        trigrams of the words in filterTxt, or None if the words are too
+        short to have any."""
+
+        grams = set()
+        for w in filterTxt.lower().split():
+            grams.update([w[j:j+3] for j in range(len(w) - 2)])
+        if not grams:
+            return None
+
+        lists = []
+        for g in grams:
+            p = self.postings.get(g)
+            if p is None:
+                return []
+            lists.append(p)
+        lists.sort(key=len)
+
+        result = lists[0]
+        for p in lists[1:]:
+            result = intersect(result, p)
+            if not result:
+                break
+        return list(result)
+
+def intersect(small, big):
+    # Looking each element up is much cheaper than walking big when small
+    # is a lot shorter, which is the common case.
+    if len(small) * 20 < len(big):
+        result = []
+        lo = 0
+        n = len(big)
+        for i in small:
+            lo = bisect_left(big, i, lo)
+            if lo == n:
+                break
+            if big[lo] == i:
+                result.append(i)
+        return result
+
+    bigSet = set(big)
+    return [i for i in small if i in bigSet]
@@ -1,49 +1,190 @@
-import re
-from operator import attrgetter
+import mmap
+import os
+import struct
+from array import array
 
-PAT_TAG_PATTERN = re.compile(r'(.*);"\t(.*)')
+# A tags file is parsed to the offsets of the tags to show, deduplicated and
+# sorted by name. The offsets are cached next to the tags file so that
+# selectTag starts instantly the next time. Tags are only decoded when
+# they are looked at.
 
-class Tag:
-    def __init__(self, line):
-        (self.name, self.file, rest) = line.split('\t', 2)
+CACHE_MAGIC = b'SELTAGS1'
+
+# magic, tags file mtime, tags file size, number of tags, offset size
+CACHE_HEADER = struct.Struct('<8sdQQI')
+
+def toStr(s):
+    if str is bytes:
+        return s
+    return s.decode('utf-8', 'replace')
+
+class Tag(object):
+    __slots__ = ('data', 'offset', 'name', 'file', 'pattern', 'type', 'propsTxt', '_props')
 
-        m = PAT_TAG_PATTERN.match(rest)
-        self.pattern = m.group(1)
-        rest = m.group(2)
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+        self._props = None
 
-        self.location = self.file + '\t' + self.pattern
+    def __getattr__(self, attr):
+        # Only called for the slots which are not set yet, i.e. before the
+        # line was parsed.
+        if attr not in ('name', 'file', 'pattern', 'type', 'propsTxt'):
+            raise AttributeError(attr)
+        self.parse()
+        return object.__getattribute__(self, attr)
+
+    def parse(self):
+        end = self.data.find(b'\n', self.offset)
+        if end < 0:
+            end = len(self.data)
+        line = toStr(self.data[self.offset:end])
+
+        (self.name, self.file, rest) = line.split('\t', 2)
+        sep = rest.rfind(';"\t')
+        self.pattern = rest[:sep]
+        rest = rest[sep+3:]
 
         self.type = rest[0]
-        rest = rest[2:]
-
-        self.props = {}
-        if rest:
-            for it in rest.split('\t'):
-                (name, value) = it.split(':', 1)
-                self.props[name] = value
-
-def parseTags(fname):
-    loc2TagMap = {}
-    tags = []
-    for line in open(fname):
-        if not line.startswith('!'):
-            t = Tag(line)
-            if t.type == 'n':
-                continue
-            if t.location in loc2TagMap:
-                prevT = loc2TagMap[t.location]
-                if t.name > prevT.name:
-                    loc2TagMap[t.location] = t
-            else:
-                loc2TagMap[t.location] = t
-
-    tags = loc2TagMap.values()
-    tags.sort(key=attrgetter('name'))
-    return tags
+        self.propsTxt = rest[2:]
+
+    @property
+    def location(self):
+        return self.file + '\t' + self.pattern
+
+    @property
+    def props(self):
+        if self._props is None:
+            self._props = parseProps(self.propsTxt)
+        return self._props
+
+def parseProps(propsTxt):
+    props = {}
+    if propsTxt:
+        for it in propsTxt.split('\t'):
+            (name, value) = it.split(':', 1)
+            props[name] = value
+    return props
+
+class TagList(object):
+    """A read only list of the Tags at offsets in data."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        return Tag(self.data, self.offsets[i])
+
+    def __iter__(self):
+        for offset in self.offsets:
+            yield Tag(self.data, offset)
+
+    def iterNamesAndProps(self):
+        """Yields the name and the props of every tag, straight from the
+        tags file without making Tags."""
+
+        data = self.data
+        for offset in self.offsets:
+            end = data.find(b'\n', offset)
+            if end < 0:
+                end = len(data)
+            line = toStr(data[offset:end])
+            sep = line.rfind(';"\t')
+            yield (line[:line.find('\t')], parseProps(line[sep+5:]))
+
+def nameAt(data, offset):
+    return data[offset:data.find(b'\t', offset)]
+
+def findTagOffsets(tagsFile, data):
+    """Returns the offsets of the tags to show, sorted by name. Namespaces
+    are skipped and of the tags at the same location only the one with the
+    largest name is kept."""
+
+    isSorted = False
+    loc2Offset = {}
+    offset = 0
+    for line in tagsFile:
+        if line.startswith(b'!'):
+            if line.startswith(b'!_TAG_FILE_SORTED\t1'):
+                isSorted = True
+        else:
+            nameEnd = line.find(b'\t')
+            sep = line.rfind(b';"\t')
+            if sep > nameEnd and line[sep+3:sep+4] != b'n':
+                loc = line[nameEnd+1:sep]
+                prev = loc2Offset.get(loc)
+                if prev is None or line[:nameEnd] > nameAt(data, prev):
+                    loc2Offset[loc] = offset
+        offset += len(line)
+
+    offsets = list(loc2Offset.values())
+    del loc2Offset
+
+    if isSorted:
+        # Sorted tags files are sorted by name, so the file order is right.
+        offsets.sort()
+    else:
+        offsets.sort(key=lambda o: nameAt(data, o))
+    return array('L', offsets)
+
+def getCacheFile(fname):
+    return fname + '.selcache'
+
+def readCache(fname, st):
+    try:
+        with open(getCacheFile(fname), 'rb') as f:
+            header = f.read(CACHE_HEADER.size)
+            if len(header) != CACHE_HEADER.size:
+                return None
+            (magic, mtime, size, count, itemSize) = CACHE_HEADER.unpack(header)
+            offsets = array('L')
+            if (magic != CACHE_MAGIC or mtime != st.st_mtime or size != st.st_size
+                    or itemSize != offsets.itemsize):
+                return None
+            offsets.fromfile(f, count)
+            return offsets
+    except (IOError, OSError, EOFError):
+        return None
+
+def writeCache(fname, st, offsets):
+    cacheFile = getCacheFile(fname)
+    tmpFile = '%s.%d.tmp' % (cacheFile, os.getpid())
+    try:
+        with open(tmpFile, 'wb') as f:
+            f.write(CACHE_HEADER.pack(CACHE_MAGIC, st.st_mtime, st.st_size,
+                                      len(offsets), offsets.itemsize))
+            offsets.tofile(f)
+        os.rename(tmpFile, cacheFile)
+    except (IOError, OSError):
+        # The tags might live in a directory we cannot write to.
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+
+def parseTags(fname, useCache=True):
+    # The offsets are found by reading the very file which is mapped, in
+    # case the tags file is replaced meanwhile.
+    with open(fname, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if st.st_size == 0:
+            return TagList(b'', array('L'))
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        offsets = None
+        if useCache:
+            offsets = readCache(fname, st)
+        if offsets is None:
+            offsets = findTagOffsets(f, data)
+            if useCache:
+                writeCache(fname, st, offsets)
+
+    return TagList(data, offsets)
 
 if __name__ == "__main__":
     tags = parseTags('stateflow.inc.tags')
-    print len(tags)
+    print(len(tags))
     for i in range(5000):
-        print tags[i].name
-
+        print(tags[i].name)
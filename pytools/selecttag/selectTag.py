@@ -4,46 +4,10 @@ from Tkinter import *
 from MultiColumnTable import MultiColumnTable
 from PatternEntryFrame import PatternEntryFrame
 from parseTags import parseTags
-
-class TagItem:
-    def __init__(self, tag):
-        self.tag = tag
-        self.txt = ''
-
-        if 'class' in tag.props:
-            self.txt += (tag.props['class'] + '::')
-
-        self.txt += tag.name
-
-        if 'signature' in tag.props:
-            self.txt += tag.props['signature']
-
-        self.txtLower = self.txt.lower()
-
-    def numColumns(self):
-        return 2
-
-    def columnWidth(self, colIdx):
-        if colIdx == 0:
-            return 2
-        elif colIdx == 1:
-            return 80
-
-    def getTxt(self, colIdx):
-        if colIdx == 0:
-            return self.tag.type
-        elif colIdx == 1:
-            return self.txt
-
-    def satisfies(self, filterTxt):
-        words = filterTxt.split()
-        i = 0
-        for w in words:
-            i = self.txtLower.find(w.lower(), i)
-            if i < 0:
-                return False
-            i += len(w)
-        return True
+from TrigramIndex import TrigramIndex
+from TagItem import TagItemList
+from threading import Thread
+import os
 
 def main():
     top = Tk()
@@ -51,14 +15,21 @@ def main():
     top.title('Choose a tag')
 
     tags = parseTags(sys.argv[1])
-    ttags = []
-    for t in tags:
-        ttags.append(TagItem(t))
+    ttags = TagItemList(tags)
 
     patternEntryFrame = PatternEntryFrame(top)
     patternEntryFrame.pack(side=TOP)
 
-    table = MultiColumnTable(top, ttags)
+    # Building the index needs the text of every tag, so do it without
+    # keeping the window from coming up. Until it is ready, filtering
+    # scans the tags. The texts come straight from the tags file, the items
+    # are still only made when they are looked at.
+    index = TrigramIndex()
+    indexer = Thread(target=index.addAll, args=(ttags.iterTxtLower(),))
+    indexer.daemon = True
+    indexer.start()
+
+    table = MultiColumnTable(top, ttags, index=index)
     table.pack(side=TOP, fill=X, expand=True)
 
     def filterTable(txt):
@@ -66,6 +37,7 @@ def main():
 
     def changeTableSelection(key):
         if key == 'Return':
+            table.finishFilter()
             tag = table.getCurrentSelection().tag
             print tag.name
             print tag.file
@@ -83,4 +55,9 @@ def main():
 
     top.mainloop()
 
+    # The indexing and filtering threads might still be busy. Exit without
+    # waiting for them or tearing them down, which can print errors.
+    sys.stdout.flush()
+    os._exit(0)
+
 main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# A persistent cache of the parsed Solution.
+#
+# Building a Solution means parsing the .vimproj.xml files, walking every
+# <modules_under> tree and reading every Makefile and MODULE_DEPENDENCIES
+# file. All of that is stored in a single file next to mw_anchor together
+# with the modification times of everything it was built from. As long as
+# none of those change, the Solution is read back from the cache instead.
+# A process which loads the Solution more than once, like toolServer.py,
+# keeps the last one it read in memory and only checks the stamps again.
+#
+# The Solution is also loaded from the Python 2 Vims, through
+# addSandboxTags. Python 2 cannot read what Python 3 pickles and its times
+# have a different type, so it keeps a cache file of its own.
+
+import os
+import sys
+from os import path
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+if sys.version_info[0] >= 3:
+    CACHE_FILE_NAME = '.vimproj.cache'
+else:
+    CACHE_FILE_NAME = '.vimproj.py2.cache'
+
+# Bump this whenever the format of the cached data changes.
+CACHE_VERSION = 3
+
+def getMTime(fname):
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    # Only Python 3 has the times in nanoseconds.
+    return getattr(st, 'st_mtime_ns', st.st_mtime)
+
+def replaceFile(src, dst):
+    """Renames src to dst, replacing dst if it exists."""
+
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+        return
+    try:
+        os.rename(src, dst)
+    except OSError:
+        # Windows does not rename over an existing file.
+        os.remove(dst)
+        os.rename(src, dst)
+
+def getCacheFile(rootDir):
+    return path.join(rootDir, CACHE_FILE_NAME)
+
+class StampSet:
+    """The modification times of all the files and directories a Solution
+    was built from. Files which did not exist are recorded as well so that
+    creating them invalidates the cache."""
+
+    def __init__(self):
+        self.stamps = {}
+
+    def add(self, fname):
+        if fname not in self.stamps:
+            self.stamps[fname] = getMTime(fname)
+
+    def addAll(self, fnames):
+        for fname in fnames:
+            self.add(fname)
+
+    def isUpToDate(self):
+        for (fname, mtime) in self.stamps.items():
+            if getMTime(fname) != mtime:
+                return False
+        return True
+
+# cache file -> (its mtime, its data) of the cache files read by this
+# process.
+loaded = {}
+
+def readCacheFile(cacheFile):
+    mtime = getMTime(cacheFile)
+    cached = loaded.get(cacheFile)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(cacheFile, 'rb') as f:
+        data = pickle.load(f)
+    loaded[cacheFile] = (mtime, data)
+    return data
+
+def loadSolution(rootDir, key):
+    """Returns the cached (solution state, stamps) for the given key or
+    None if there is no valid cache."""
+
+    try:
+        data = readCacheFile(getCacheFile(rootDir))
+    except Exception:
+        return None
+
+    if data.get('version') != CACHE_VERSION or data.get('key') != key:
+        return None
+
+    stamps = StampSet()
+    stamps.stamps = data['stamps']
+    if not stamps.isUpToDate():
+        return None
+
+    return data['solution']
+
+def saveSolution(rootDir, key, solutionState, stamps):
+    from tempfile import mkstemp
+
+    data = {'version': CACHE_VERSION,
+            'key': key,
+            'stamps': stamps.stamps,
+            'solution': solutionState}
+
+    cacheFile = getCacheFile(rootDir)
+    try:
+        (fd, tmpFile) = mkstemp(dir=rootDir, prefix=CACHE_FILE_NAME)
+    except OSError:
+        # Read-only sandbox. Just live without a cache.
+        return
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        replaceFile(tmpFile, cacheFile)
+    except Exception:
+        if path.exists(tmpFile):
+            os.remove(tmpFile)
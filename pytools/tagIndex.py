@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+
+# A binary index of a tags file, kept next to it as <tagsFile>.idx.
+#
+# The index holds the offsets of all the tag lines in the tags file twice:
+# once sorted by tag name and once sorted by the lower cased tag name. Both
+# files are memory mapped and searched with a binary search, so a lookup
+# only touches the few pages it needs instead of reading the whole tags
+# file.
+#
+# The header records the size and mtime of the tags file the index was
+# built from. An index which does not match its tags file is not used.
+# Offsets are stored in the native byte order, the index is only a cache.
+
+if __name__ == "__main__":
+    # Before the imports, which the server has done already.
+    from toolClient import runOnServer
+    runOnServer()
+
+import heapq
+import io
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import islice
+from os import path
+
+INDEX_MAGIC = b'VTAGIDX1'
+
+# magic, offset typecode, tags file size, tags file mtime, number of tags
+HEADER = struct.Struct('=8scxxxxxxxQqQ')
+
+# Bytes of the tags file sorted in memory at a time, larger tags files are
+# sorted in runs which are merged.
+SORT_BLOCK_SIZE = 1 << 20
+
+# Offsets written at a time.
+CHUNK_SIZE = 1 << 16
+
+# The bytes of the runs read or written at a time while they are merged,
+# and how many runs are merged at a time.
+MERGE_BUFFER_SIZE = 1 << 20
+MAX_MERGE_RUNS = 64
+
+def getIndexFile(tagsFile):
+    return tagsFile + '.idx'
+
+def isHeader(line):
+    return line.startswith(b'!_TAG_')
+
+def tagName(line):
+    # A line without a tab is broken, its name is all of it.
+    return line.split(b'\t', 1)[0].rstrip(b'\r\n')
+
+def iterTagBlocks(tagsFile):
+    """Yields the tags in tagsFile in file order, as (offsets, names) of
+    about SORT_BLOCK_SIZE bytes of tags at a time."""
+
+    offset = 0
+    with open(tagsFile, 'rb') as f:
+        while True:
+            lines = f.readlines(SORT_BLOCK_SIZE)
+            if not lines:
+                return
+            offsets = []
+            names = []
+            for line in lines:
+                if not isHeader(line):
+                    offsets.append(offset)
+                    names.append(tagName(line))
+                offset += len(line)
+            yield (offsets, names)
+
+def writeOffsets(f, offsets, typecode):
+    offsets = iter(offsets)
+    while True:
+        chunk = array(typecode, islice(offsets, CHUNK_SIZE))
+        if not chunk:
+            return
+        chunk.tofile(f)
+
+# A run is a temporary file of sorted lines, one per tag: its key, a NUL
+# and its offset as 16 hex digits. Tag names cannot contain a newline and
+# in practice no NUL, so comparing the lines compares the keys, and tags
+# with the same key by their offsets, which keeps them in file order.
+RUN_OFFSET = slice(-17, -1)
+
+def makeRun(lines):
+    """Returns a run of the lines, which are either sorted in memory or
+    come from an iterator in order."""
+
+    from tempfile import TemporaryFile
+
+    if isinstance(lines, list):
+        lines.sort()
+    # Unbuffered, it is written and read through buffers of its own.
+    writer = io.BufferedWriter(TemporaryFile(buffering=0), MERGE_BUFFER_SIZE)
+    writer.writelines(lines)
+    writer.flush()
+    return writer.detach()
+
+def mergeRuns(runs):
+    """Yields the lines of runs in order. Every run is read through a
+    buffer of its own, together they are about MERGE_BUFFER_SIZE bytes."""
+
+    bufferSize = max(io.DEFAULT_BUFFER_SIZE, MERGE_BUFFER_SIZE // len(runs))
+    readers = []
+    for run in runs:
+        run.seek(0)
+        readers.append(io.BufferedReader(run, bufferSize))
+    return heapq.merge(*readers)
+
+class OffsetSorter:
+    """Sorts the offsets of the tags by a key of their names, tags with the
+    same key in file order. check() has to see all the tags before add()
+    sees any of them. A tags file in order is not sorted at all, its
+    offsets are read again in writeTo(). Otherwise every block of tags is
+    sorted in memory into a run, and the runs are merged at the end, at
+    most MAX_MERGE_RUNS at a time."""
+
+    def __init__(self, key, typecode):
+        self.key = key
+        self.typecode = typecode
+        self.isSorted = True
+        self.lastKey = None
+        self.runs = []
+
+    def keys(self, names):
+        return names if self.key is None else list(map(self.key, names))
+
+    def check(self, names):
+        if self.isSorted and names:
+            keys = self.keys(names)
+            self.isSorted = ((self.lastKey is None or self.lastKey <= keys[0])
+                             and keys == sorted(keys))
+            self.lastKey = keys[-1]
+
+    def add(self, offsets, names):
+        if not self.isSorted and names:
+            self.runs.append(makeRun([key + b'\0' + b'%016x\n' % offset
+                                      for (key, offset) in zip(self.keys(names), offsets)]))
+
+    def writeTo(self, f, tagsFile):
+        if self.isSorted:
+            for (offsets, _) in iterTagBlocks(tagsFile):
+                array(self.typecode, offsets).tofile(f)
+            return
+
+        while len(self.runs) > MAX_MERGE_RUNS:
+            runs = self.runs
+            self.runs = []
+            for i in range(0, len(runs), MAX_MERGE_RUNS):
+                group = runs[i:i + MAX_MERGE_RUNS]
+                self.runs.append(makeRun(mergeRuns(group)))
+                for run in group:
+                    run.close()
+
+        if self.runs:
+            lines = mergeRuns(self.runs)
+            writeOffsets(f, (int(line[RUN_OFFSET], 16) for line in lines), self.typecode)
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+
+def buildIndex(tagsFile, indexFile=None):
+    """Writes the index of tagsFile. The index is written to a temporary
+    file first, so readers never see a partial one.
+
+    The tags are read a block at a time and memory use does not grow with
+    the size of the tags file. ctags sorts by the whole line, which is the
+    same as sorting by the name, so usually only the lower cased names have
+    to be sorted."""
+
+    indexFile = indexFile or getIndexFile(tagsFile)
+    st = os.stat(tagsFile)
+    typecode = 'I' if st.st_size < (1 << 32) else 'Q'
+
+    sorters = (OffsetSorter(None, typecode), OffsetSorter(bytes.lower, typecode))
+    (dirName, baseName) = path.split(path.abspath(indexFile))
+    tmpFile = path.join(dirName, '.%s.%d.tmp' % (baseName, os.getpid()))
+    try:
+        count = 0
+        for (_, names) in iterTagBlocks(tagsFile):
+            count += len(names)
+            for sorter in sorters:
+                sorter.check(names)
+
+        if not all(sorter.isSorted for sorter in sorters):
+            for (offsets, names) in iterTagBlocks(tagsFile):
+                for sorter in sorters:
+                    sorter.add(offsets, names)
+
+        with open(tmpFile, 'wb') as f:
+            f.write(HEADER.pack(INDEX_MAGIC, typecode.encode('ascii'),
+                                st.st_size, st.st_mtime_ns, count))
+            for sorter in sorters:
+                sorter.writeTo(f, tagsFile)
+        os.chmod(tmpFile, 0o444)
+        os.replace(tmpFile, indexFile)
+    finally:
+        for sorter in sorters:
+            sorter.close()
+        if path.exists(tmpFile):
+            os.remove(tmpFile)
+
+def readIndexHeader(indexFile):
+    try:
+        with open(indexFile, 'rb') as f:
+            data = f.read(HEADER.size)
+    except (IOError, OSError):
+        return None
+    if len(data) != HEADER.size:
+        return None
+    header = HEADER.unpack(data)
+    if header[0] != INDEX_MAGIC:
+        return None
+    return header
+
+def matchesTagsFile(header, tagsFile):
+    try:
+        st = os.stat(tagsFile)
+    except OSError:
+        return False
+    return header[2] == st.st_size and header[3] == st.st_mtime_ns
+
+def isIndexUpToDate(tagsFile):
+    header = readIndexHeader(getIndexFile(tagsFile))
+    return header is not None and matchesTagsFile(header, tagsFile)
+
+def updateIndex(tagsFile):
+    """Rebuilds the index of tagsFile unless it is up to date. Returns
+    whether it was rebuilt."""
+
+    if isIndexUpToDate(tagsFile):
+        return False
+    buildIndex(tagsFile)
+    return True
+
+class TagIndex:
+    """Lookups in a tags file through its index. Use openIndex() to get
+    one."""
+
+    def __init__(self, tagsFile, header):
+        self.tagsFile = tagsFile
+        self.tagsDir = path.dirname(path.abspath(tagsFile))
+        self.header = header
+        (_, typecode, _, _, self.count) = header
+        typecode = typecode.decode('ascii')
+
+        self.tags = None
+        self.index = None
+        self.byName = self.byLowerName = []
+        if self.count == 0:
+            return
+
+        with open(tagsFile, 'rb') as f:
+            self.tags = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(getIndexFile(tagsFile), 'rb') as f:
+            self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        offsets = memoryview(self.index)[HEADER.size:].cast(typecode)
+        self.byName = offsets[:self.count]
+        self.byLowerName = offsets[self.count:2 * self.count]
+
+    def close(self):
+        self.byName = self.byLowerName = []
+        for m in (self.tags, self.index):
+            if m is not None:
+                m.close()
+        self.tags = self.index = None
+
+    def nameAt(self, offset):
+        return self.tags[offset:self.tags.find(b'\t', offset)]
+
+    def lineAt(self, offset):
+        end = self.tags.find(b'\n', offset)
+        if end < 0:
+            end = len(self.tags)
+        return self.tags[offset:end]
+
+    def lowerBound(self, offsets, key, transform):
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if transform(self.nameAt(offsets[mid])) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def findLines(self, name, prefix=False, ignoreCase=False):
+        """Returns the lines of the tags whose name is name or, with
+        prefix, starts with name. name can be str or bytes."""
+
+        if not isinstance(name, bytes):
+            name = name.encode('utf-8')
+        if ignoreCase:
+            offsets = self.byLowerName
+            transform = bytes.lower
+            name = name.lower()
+        else:
+            offsets = self.byName
+            transform = lambda n: n
+
+        lines = []
+        i = self.lowerBound(offsets, name, transform)
+        while i < self.count:
+            tagName = transform(self.nameAt(offsets[i]))
+            if tagName != name and not (prefix and tagName.startswith(name)):
+                break
+            lines.append(self.lineAt(offsets[i]))
+            i += 1
+        return lines
+
+    def find(self, name, prefix=False, ignoreCase=False):
+        """Like findLines, but returns dictionaries with the same keys as
+        Vim's taglist(). File names are absolute."""
+
+        return [parseTagLine(line, self.tagsDir)
+                for line in self.findLines(name, prefix, ignoreCase)]
+
+def parseTagLine(line, tagsDir):
+    line = line.decode('utf-8', 'replace')
+    (name, fname, rest) = line.split('\t', 2)
+    (cmd, sep, extra) = rest.partition(';"\t')
+    tag = {'name': name,
+           'filename': path.normpath(path.join(tagsDir, fname)),
+           'cmd': cmd,
+           'kind': '',
+           'static': 0}
+    if sep:
+        for field in extra.split('\t'):
+            (key, sep, value) = field.partition(':')
+            if not sep:
+                tag['kind'] = key
+            elif key == 'kind':
+                tag['kind'] = value
+            elif key == 'file':
+                tag['static'] = 1
+            else:
+                tag[key] = value
+    return tag
+
+def openIndex(tagsFile):
+    """Returns a TagIndex for tagsFile, or None if it has no up to date
+    index."""
+
+    header = readIndexHeader(getIndexFile(tagsFile))
+    if header is None or not matchesTagsFile(header, tagsFile):
+        return None
+
+    index = TagIndex(tagsFile, header)
+    # The tags file could have been replaced since it was checked.
+    if index.tags is not None and len(index.tags) != header[2]:
+        index.close()
+        return None
+    return index
+
+# tags file -> TagIndex of the indexes kept open by getIndex.
+openIndexes = {}
+
+def getIndex(tagsFile):
+    """Like openIndex, but the index stays open for the next lookups as long
+    as it is up to date. For processes which look up tags more than once,
+    like toolServer.py. Do not close the index."""
+
+    index = openIndexes.pop(tagsFile, None)
+    if index is not None:
+        header = readIndexHeader(getIndexFile(tagsFile))
+        if header == index.header and matchesTagsFile(header, tagsFile):
+            openIndexes[tagsFile] = index
+            return index
+        index.close()
+
+    index = openIndex(tagsFile)
+    if index is not None:
+        openIndexes[tagsFile] = index
+    return index
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [options] tagsFile [name]")
+    parser.add_option("-b", "--build", dest="build", help="(re)build the index of tagsFile", action="store_true", default=False)
+    parser.add_option("-p", "--prefix", dest="prefix", help="find the tags starting with name", action="store_true", default=False)
+    parser.add_option("-i", "--ignore-case", dest="ignoreCase", help="ignore case when matching name", action="store_true", default=False)
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.print_usage()
+        sys.exit(1)
+
+    tagsFile = args[0]
+    if options.build:
+        buildIndex(tagsFile)
+
+    if len(args) > 1:
+        # The indexes toolServer.py keeps open are in the module, not in
+        # this script.
+        import tagIndex
+        index = tagIndex.getIndex(tagsFile)
+        if index is None:
+            print("ERROR: %s has no up to date index. Use --build to create one." % tagsFile)
+            sys.exit(1)
+        for line in index.findLines(args[1], options.prefix, options.ignoreCase):
+            print(line.decode('utf-8', 'replace'))
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+
+# Keeps the tags of a sandbox up to date while it is being edited.
+#
+# Watches the include and export directories of the Solution and re-runs
+# genDirTags incrementally for the directories in which a tagged file
+# changed. Changes are collected until the sandbox has been quiet for a
+# moment, so that a sync or a branch switch leads to one refresh rather
+# than thousands.
+#
+# Uses inotify where available and polls the directories otherwise. Only
+# one watcher runs per sandbox. Restart it after changing .vimproj.xml.
+
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import os
+import select
+import struct
+import sys
+import time
+from fnmatch import fnmatch
+from os import path
+
+from getProjSettings import getProjSettings
+from sbtools import getRootDir
+from genVimTags import TagScheduler, PRIORITY_REST
+
+LOCK_FILE_NAME = '.tagWatcher.lock'
+
+# Seconds without any change before the tags are refreshed, and the longest
+# a change waits while changes keep coming in.
+DEBOUNCE = 1.0
+MAX_DELAY = 10.0
+
+POLL_INTERVAL = 30.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+class InotifyWatcher:
+    """Watches directory trees with inotify. Raises OSError when inotify
+    is not available or the system limit on watches is reached."""
+
+    def __init__(self):
+        libcName = ctypes.util.find_library('c')
+        if not libcName:
+            raise OSError(errno.ENOSYS, 'libc not found')
+        self.libc = ctypes.CDLL(libcName, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify not supported')
+
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirOf = {}
+
+    def close(self):
+        os.close(self.fd)
+
+    def addWatch(self, dirName):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirName), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return
+            raise OSError(err, 'cannot watch %s' % dirName)
+        self.dirOf[wd] = dirName
+
+    def watchTree(self, topDir):
+        for (dirpath, _, _) in os.walk(topDir):
+            self.addWatch(dirpath)
+
+    def readEvents(self, timeout):
+        """Waits up to timeout seconds (forever if None) for changes.
+        Returns the list of (path, isDir) which changed, or None if events
+        were lost and everything has to be assumed changed."""
+
+        (ready, _, _) = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        buf = os.read(self.fd, 65536)
+        changes = []
+        lost = False
+        offset = 0
+        while offset < len(buf):
+            (wd, mask, _, nameLen) = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(buf[offset:offset + nameLen].rstrip(b'\0'))
+            offset += nameLen
+
+            if mask & IN_Q_OVERFLOW:
+                lost = True
+                continue
+
+            dirName = self.dirOf.get(wd)
+            if dirName is None:
+                continue
+
+            if mask & IN_IGNORED:
+                del self.dirOf[wd]
+                continue
+
+            if mask & IN_MOVE_SELF:
+                # Its path is stale now. If it moved within the watched
+                # trees, IN_MOVED_TO watches it again under the new name.
+                self.libc.inotify_rm_watch(self.fd, wd)
+                continue
+
+            if mask & IN_DELETE_SELF:
+                continue
+
+            fname = path.join(dirName, name)
+            isDir = bool(mask & IN_ISDIR)
+            if isDir and mask & (IN_CREATE | IN_MOVED_TO):
+                self.watchTree(fname)
+            changes.append((fname, isDir))
+
+        return None if lost else changes
+
+class PollingWatcher:
+    """Finds changes by comparing the mtimes and sizes of all the files in
+    the watched trees every interval seconds."""
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.topDirs = []
+        self.snapshot = {}
+        self.nextPoll = time.time() + interval
+
+    def watchTree(self, topDir):
+        self.topDirs.append(topDir)
+        self.snapshot.update(self.scan(topDir))
+
+    def scan(self, topDir):
+        files = {}
+        for (dirpath, _, filenames) in os.walk(topDir):
+            for fname in filenames:
+                fname = path.join(dirpath, fname)
+                try:
+                    st = os.stat(fname)
+                except OSError:
+                    continue
+                files[fname] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    def readEvents(self, timeout):
+        wait = self.nextPoll - time.time()
+        if timeout is not None and timeout < wait:
+            time.sleep(max(timeout, 0))
+            return []
+        time.sleep(max(wait, 0))
+        self.nextPoll = time.time() + self.interval
+
+        snapshot = {}
+        for topDir in self.topDirs:
+            snapshot.update(self.scan(topDir))
+
+        changes = [(f, False) for (f, stamp) in snapshot.items()
+                   if self.snapshot.get(f) != stamp]
+        changes += [(f, False) for f in self.snapshot if f not in snapshot]
+        self.snapshot = snapshot
+        return changes
+
+class JobCollector(TagScheduler):
+    """Records the jobs genVimTags would run for a project instead of
+    queuing them."""
+
+    def __init__(self, jobs, singlePass):
+        TagScheduler.__init__(self, singlePass=singlePass)
+        self.jobs = jobs
+
+    def add(self, priority, dirName, pattern, args, tagsFile, subsets=()):
+        key = (dirName, tagsFile)
+        if key not in self.seen and path.isdir(dirName):
+            self.seen.add(key)
+            self.jobs.append((dirName, pattern, args, tagsFile, subsets))
+
+class TagWatcher:
+    def __init__(self, rootDir, soln, singlePass=False, poll=False,
+                 debounce=DEBOUNCE, maxDelay=MAX_DELAY):
+        self.rootDir = path.abspath(rootDir)
+        self.singlePass = singlePass
+        self.debounce = debounce
+        self.maxDelay = maxDelay
+
+        self.jobs = []
+        collector = JobCollector(self.jobs, singlePass)
+        for proj in soln.projects:
+            collector.addProject(PRIORITY_REST, proj)
+
+        # Directory -> indices of the jobs tagging the files under it.
+        self.jobsByDir = {}
+        for (i, job) in enumerate(self.jobs):
+            dirName = path.normpath(path.join(self.rootDir, job[0]))
+            self.jobsByDir.setdefault(dirName, []).append(i)
+        self.patterns = [job[1].split() for job in self.jobs]
+
+        self.watcher = None
+        if not poll:
+            watcher = None
+            try:
+                watcher = InotifyWatcher()
+                for dirName in self.jobsByDir:
+                    watcher.watchTree(dirName)
+                self.watcher = watcher
+            except OSError as e:
+                print('inotify not usable (%s), polling every %ds instead' % (e, POLL_INTERVAL))
+                if watcher:
+                    watcher.close()
+        if self.watcher is None:
+            self.watcher = PollingWatcher()
+            for dirName in self.jobsByDir:
+                self.watcher.watchTree(dirName)
+
+    def jobsFor(self, fname, isDir):
+        """Returns the indices of the jobs whose tags can depend on fname."""
+
+        result = set()
+        name = path.basename(fname)
+        dirName = fname if isDir else path.dirname(fname)
+        while True:
+            for i in self.jobsByDir.get(dirName, []):
+                if isDir or any(fnmatch(name, p) for p in self.patterns[i]):
+                    result.add(i)
+            parent = path.dirname(dirName)
+            if parent == dirName:
+                return result
+            dirName = parent
+
+    def retag(self, jobIndices):
+        scheduler = TagScheduler(incremental=True, singlePass=self.singlePass)
+        for i in sorted(jobIndices):
+            scheduler.add(PRIORITY_REST, *self.jobs[i])
+        scheduler.run()
+
+    def run(self):
+        os.chdir(self.rootDir)
+
+        # Catch up with whatever changed while nobody was watching.
+        self.retag(range(len(self.jobs)))
+
+        pending = set()
+        firstChange = lastChange = 0
+        while True:
+            timeout = None
+            if pending:
+                deadline = min(lastChange + self.debounce, firstChange + self.maxDelay)
+                timeout = max(deadline - time.time(), 0)
+
+            changes = self.watcher.readEvents(timeout)
+            now = time.time()
+
+            if changes is None:
+                jobs = set(range(len(self.jobs)))
+            else:
+                jobs = set()
+                for (fname, isDir) in changes:
+                    jobs |= self.jobsFor(fname, isDir)
+
+            if jobs:
+                if not pending:
+                    firstChange = now
+                lastChange = now
+                pending |= jobs
+
+            if pending and now >= min(lastChange + self.debounce, firstChange + self.maxDelay):
+                self.retag(pending)
+                pending = set()
+
+def lockSandbox(rootDir):
+    """Returns an open lock file if no other watcher runs for rootDir. The
+    lock is held for as long as the file stays open."""
+
+    lockFile = open(path.join(rootDir, LOCK_FILE_NAME), 'w')
+    try:
+        fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        lockFile.close()
+        return None
+    return lockFile
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-s", "--single-pass", dest="singlePass", help="write the .inc.tags and .all.tags files of an include with one ctags run", action="store_true", default=False)
+    parser.add_option("-p", "--poll", dest="poll", help="poll for changes instead of using inotify", action="store_true", default=False)
+    parser.add_option("-d", "--debounce", dest="debounce", help="seconds without changes before re-tagging", type="float", default=DEBOUNCE)
+    (options, args) = parser.parse_args()
+
+    rootDir = getRootDir()
+    soln = getProjSettings()
+    if not rootDir or not soln:
+        print("ERROR: Project description file .vimproj.xml not found either in $HOME or the root of the sandbox.")
+        sys.exit(1)
+
+    lock = lockSandbox(rootDir)
+    if not lock:
+        print("Tags of %s are already being watched" % rootDir)
+        sys.exit(0)
+
+    soln.setRootDir(rootDir)
+    os.chdir(rootDir)
+
+    watcher = TagWatcher(rootDir, soln, options.singlePass, options.poll, options.debounce)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+# The client side of toolServer.py.
+#
+# The tools the server can run call runOnServer() before anything else.
+# If a server runs for the sandbox of the current directory, the command
+# is handed to it together with the stdin, stdout and stderr of this
+# process. It runs in a process forked from the server, which has all the
+# modules imported and the Solution, the file lists and the tag indexes of
+# the sandbox loaded already, and writes straight to our stdout. This
+# process then exits with its status.
+#
+# Without a server runOnServer() just returns and the tool runs in this
+# process, like it always has. Set PYTOOLS_NO_SERVER to never use one.
+#
+# Everything here has to be cheap to import, it is paid for by every
+# command whether there is a server or not.
+
+import marshal
+import os
+import stat
+import struct
+import sys
+import zlib
+from os import path
+
+# The socket module imports a lot more than the socket itself.
+import _socket
+
+from sbtools import getRootDir
+
+# The tools which can run on the server.
+SERVED_SCRIPTS = ('listFiles.py', 'findInProj.py', 'findInSoln.py', 'findInIndex.py',
+                  'genVimTags.py', 'getCompilationDatabase.py', 'tagIndex.py')
+
+# Every message is a length or a number in this format, the request
+# follows its length.
+INT = struct.Struct('=i')
+
+# Set in the processes of the server, where the tools run in-process.
+inServer = False
+
+def getSocketDir():
+    """The directory of the sockets of the servers of this user. Only the
+    user can get at it, otherwise anyone could listen on the socket of a
+    server before it runs and get the streams and the environment of the
+    commands."""
+
+    runtimeDir = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return path.join(runtimeDir, 'pytools-%d' % os.getuid())
+
+def isPrivateDir(dirName):
+    """Whether dirName is a directory (not a link to one) which only this
+    user can get at."""
+
+    try:
+        st = os.lstat(dirName)
+    except OSError:
+        return False
+    return (stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid()
+            and st.st_mode & 0o077 == 0)
+
+def getSocketFile(rootDir):
+    """The socket of the server of rootDir. It is not in the sandbox
+    because the path of a Unix socket has to be short. The server checks
+    the root directory of every request, so a clash of the names only
+    costs the speed up."""
+
+    key = zlib.crc32(rootDir.encode('utf-8', 'surrogateescape'))
+    return path.join(getSocketDir(), '%08x.sock' % key)
+
+def readInt(sock):
+    data = b''
+    while len(data) < INT.size:
+        more = sock.recv(INT.size - len(data))
+        if not more:
+            return None
+        data += more
+    return INT.unpack(data)[0]
+
+def forwardSignals(pid):
+    """Passes the signals which would stop this process on to the process
+    group running the command. Returns the list the signals are added
+    to."""
+
+    import signal
+
+    received = []
+    def forward(signum, frame):
+        received.append(signum)
+        try:
+            os.killpg(pid, signum)
+        except OSError:
+            pass
+
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signum, forward)
+    return received
+
+def runOnServer():
+    """Runs the command of this process on the server of the sandbox and
+    exits with its status. Returns if there is no server, or it did not
+    take the command."""
+
+    if inServer or os.environ.get('PYTOOLS_NO_SERVER'):
+        return
+
+    script = path.basename(sys.argv[0])
+    rootDir = getRootDir()
+    if script not in SERVED_SCRIPTS or not rootDir or not isPrivateDir(getSocketDir()):
+        return
+
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.connect(getSocketFile(rootDir))
+
+        request = marshal.dumps({'rootDir': rootDir,
+                                 'script': script,
+                                 'argv': sys.argv[1:],
+                                 'cwd': os.getcwd(),
+                                 'env': dict(os.environ)})
+        fds = struct.pack('3i', 0, 1, 2)
+        sock.sendmsg([INT.pack(len(request)) + request],
+                     [(_socket.SOL_SOCKET, _socket.SCM_RIGHTS, fds)])
+
+        # The process running the command, or 0 if the server did not take
+        # it.
+        pid = readInt(sock)
+    except OSError:
+        # No server, a stale socket or closed standard streams.
+        pid = None
+
+    if not pid:
+        sock.close()
+        return
+
+    received = forwardSignals(pid)
+    try:
+        status = readInt(sock)
+    except OSError:
+        status = None
+
+    if status is None:
+        if received:
+            status = 128 + received[0]
+        else:
+            sys.stderr.write('ERROR: the pytools server went away while running %s\n' % script)
+            status = 1
+    os._exit(status)
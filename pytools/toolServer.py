@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+# A resident server for the pytools of a sandbox.
+#
+# Every tool used to start a fresh interpreter which imported its modules,
+# found the root of the sandbox and loaded the Solution and the file lists
+# before doing any work. The server does all of that once and keeps it
+# loaded, the Solution and file lists are only read again when they
+# change. The tags indexes of the projects are kept open as well.
+#
+# The tools in toolClient.SERVED_SCRIPTS are its clients. They send their
+# arguments, environment and current directory over a Unix socket, along
+# with their stdin, stdout and stderr. Every command runs in a process
+# forked from the server, which starts with everything loaded, writes to
+# the streams of the client and sends back its exit status. Commands run
+# concurrently, and a command cannot break the server.
+#
+# Only one server runs per sandbox. Restart it after changing the pytools.
+
+import fcntl
+import importlib
+import marshal
+import os
+import signal
+import socket
+import sys
+import traceback
+import types
+from os import path
+
+import toolClient
+from toolClient import INT, SERVED_SCRIPTS, getSocketDir, getSocketFile, isPrivateDir
+from getProjSettings import getProjSettings
+from sbtools import getRootDir
+
+import ListSearch
+import fileListCache
+import tagIndex
+
+# Imported by the server so that the commands do not have to. The tools
+# import the modules they only need now and then when they need them,
+# those are imported here as well.
+PRELOADED_MODULES = [
+    'codeIndex',
+    'genVimTags',
+    'getCompilationDatabase',
+    'optparse',
+    'searchFiles',
+    'concurrent.futures',
+    'hashlib',
+    'multiprocessing',
+    'subprocess',
+    'tempfile',
+    'xml.etree.ElementTree',
+]
+
+for name in PRELOADED_MODULES:
+    importlib.import_module(name)
+
+LOCK_FILE_NAME = '.toolServer.lock'
+
+PYTOOLS = path.dirname(path.abspath(__file__))
+
+# Seconds without a new command before the caches are brought up to date
+# with what the commands wrote.
+REFRESH_DELAY = 1.0
+
+MAX_REQUEST_SIZE = 16 * 1024 * 1024
+
+# Seconds a client has to send its request. Clients send it right after
+# connecting.
+REQUEST_TIMEOUT = 10.0
+
+class ToolServer:
+    def __init__(self, rootDir):
+        self.rootDir = rootDir
+        self.socketFile = getSocketFile(rootDir)
+        self.sock = None
+        # script -> (mtime, compiled code)
+        self.scripts = {}
+
+    def refresh(self):
+        """Loads whatever changed of the Solution, the file lists and the
+        tags indexes."""
+
+        os.chdir(self.rootDir)
+        soln = getProjSettings()
+        if not soln:
+            return
+        soln.setRootDir(self.rootDir)
+
+        fileListCache.preload(self.rootDir)
+        for includeRoot in ListSearch.getIncludeRoots(self.rootDir, soln.projects):
+            if path.isdir(includeRoot.path):
+                fileListCache.listFiles(self.rootDir, includeRoot.path, False, includeRoot)
+        # The commands are forked from this process, which is only safe
+        # without other threads.
+        fileListCache.closePool()
+
+        for script in SERVED_SCRIPTS:
+            self.compileScript(path.join(PYTOOLS, script))
+
+        for proj in soln.projects:
+            for inc in proj.includes:
+                for tagsFile in (inc['tagsFile'], inc['allTagsFile']):
+                    self.openTags(path.join(self.rootDir, inc['path'], tagsFile))
+            for exp in proj.exports:
+                self.openTags(path.join(self.rootDir, exp['path'], exp['tagsFile']))
+
+    def compileScript(self, script):
+        """Returns the compiled code of script, None if it cannot be
+        read."""
+
+        try:
+            mtime = os.stat(script).st_mtime_ns
+        except OSError:
+            return None
+        cached = self.scripts.get(script)
+        if cached is None or cached[0] != mtime:
+            with open(script, 'rb') as f:
+                cached = (mtime, compile(f.read(), script, 'exec'))
+            self.scripts[script] = cached
+        return cached[1]
+
+    def openTags(self, tagsFile):
+        if path.exists(tagIndex.getIndexFile(tagsFile)):
+            tagIndex.getIndex(tagsFile)
+
+    def listen(self):
+        if path.exists(self.socketFile):
+            # Left behind by a server which did not exit cleanly. The lock
+            # says that it does not run anymore.
+            os.remove(self.socketFile)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        oldMask = os.umask(0o077)
+        try:
+            self.sock.bind(self.socketFile)
+        finally:
+            os.umask(oldMask)
+        self.sock.listen(16)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            if path.exists(self.socketFile):
+                os.remove(self.socketFile)
+
+    def serve(self):
+        # The processes running the commands are not waited for.
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+        self.refresh()
+        self.listen()
+        while True:
+            try:
+                (conn, _) = self.sock.accept()
+            except socket.timeout:
+                self.refresh()
+                self.sock.settimeout(None)
+                continue
+
+            try:
+                self.handle(conn)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                conn.close()
+            self.sock.settimeout(REFRESH_DELAY)
+
+    def readRequest(self, conn):
+        """Returns the (request, file descriptors) sent by a client, or
+        (None, file descriptors) if it is not a request for this server."""
+
+        (data, fds, _, _) = socket.recv_fds(conn, 65536, 3)
+        if len(data) < INT.size:
+            return (None, fds)
+        size = INT.unpack(data[:INT.size])[0]
+        if size > MAX_REQUEST_SIZE:
+            return (None, fds)
+        data = data[INT.size:]
+        while len(data) < size:
+            more = conn.recv(size - len(data))
+            if not more:
+                return (None, fds)
+            data += more
+
+        try:
+            request = marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            return (None, fds)
+        if (len(fds) != 3 or request.get('rootDir') != self.rootDir
+                or request.get('script') not in SERVED_SCRIPTS):
+            return (None, fds)
+        return (request, fds)
+
+    def handle(self, conn):
+        """Forks the process which reads the request of the client on conn
+        and runs its command. A client which is slow to send its request
+        only holds up its own process, not the server."""
+
+        try:
+            pid = os.fork()
+        except OSError:
+            # The client runs the command itself.
+            conn.sendall(INT.pack(0))
+            return
+        if pid != 0:
+            return
+
+        try:
+            self.sock.close()
+            conn.settimeout(REQUEST_TIMEOUT)
+            (request, fds) = self.readRequest(conn)
+            conn.settimeout(None)
+            if request is not None:
+                runCommand(conn, fds, request, self.compileScript)
+            # Not a request for this server, the client runs the command
+            # itself once the connection is closed.
+            for fd in fds:
+                os.close(fd)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(1)
+
+def reopenStream(fd, mode, errors='strict'):
+    buffering = 1 if mode == 'w' and os.isatty(fd) else -1
+    return open(fd, mode, buffering=buffering, errors=errors, closefd=False)
+
+def runCommand(conn, fds, request, compileScript):
+    """Runs the command of a client in a forked server process. Sends the
+    client its pid and then its exit status. Does not return."""
+
+    status = 1
+    try:
+        # Like in a fresh process.
+        for signum in (signal.SIGCHLD, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        # The client signals the whole group, with the processes the
+        # command starts.
+        os.setpgid(0, 0)
+        conn.sendall(INT.pack(os.getpid()))
+
+        for (target, fd) in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        sys.stdin = reopenStream(0, 'r')
+        sys.stdout = reopenStream(1, 'w')
+        sys.stderr = reopenStream(2, 'w', 'backslashreplace')
+
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+
+        script = path.join(PYTOOLS, request['script'])
+        sys.argv = [script] + request['argv']
+        status = runScript(script, compileScript(script))
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            conn.sendall(INT.pack(status))
+        finally:
+            os._exit(status)
+
+def runScript(script, code):
+    """Runs the code of script as __main__ and returns its exit status."""
+
+    main = types.ModuleType('__main__')
+    main.__file__ = script
+    main.__builtins__ = __builtins__
+    sys.modules['__main__'] = main
+    try:
+        exec(code, main.__dict__)
+        status = 0
+    except SystemExit as e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        else:
+            sys.stderr.write('%s\n' % e.code)
+            status = 1
+    except KeyboardInterrupt:
+        status = 128 + signal.SIGINT
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+    return status
+
+def makeSocketDir():
+    """Creates the directory of the sockets unless it is there. Returns
+    whether only this user can get at it."""
+
+    socketDir = getSocketDir()
+    try:
+        os.mkdir(socketDir, 0o700)
+    except OSError:
+        # Checked below.
+        pass
+    return isPrivateDir(socketDir)
+
+def lockSandbox(rootDir):
+    """Returns an open lock file if no other server runs for rootDir. The
+    lock is held for as long as the file stays open."""
+
+    lockFile = open(path.join(rootDir, LOCK_FILE_NAME), 'w')
+    try:
+        fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        lockFile.close()
+        return None
+    return lockFile
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog")
+    (options, args) = parser.parse_args()
+
+    rootDir = getRootDir()
+    if not rootDir:
+        print("ERROR: Not in a sandbox.")
+        sys.exit(1)
+
+    if not makeSocketDir():
+        print("ERROR: %s has to be a directory only you can access." % getSocketDir())
+        sys.exit(1)
+
+    lock = lockSandbox(rootDir)
+    if not lock:
+        print("A pytools server already runs for %s" % rootDir)
+        sys.exit(0)
+
+    # Vim stops the server with SIGTERM when it exits. Exiting through
+    # SystemExit removes the socket.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # The tools run in the processes forked from this one.
+    toolClient.inServer = True
+
+    server = ToolServer(rootDir)
+    print("Serving the pytools of %s on %s" % (rootDir, server.socketFile))
+    sys.stdout.flush()
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()